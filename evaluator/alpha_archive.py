@@ -0,0 +1,358 @@
+# alpha_archive.py
+"""
+alpha 详情的并发读取与本地列式归档。
+
+simulation 结束后，评估器不再在轮询循环中阻塞重试 /alphas/{id}：
+- AsyncAlphaFetcher（异步评估器）与 AlphaFetcher（批量评估器，线程池）在后台读取 alpha 详情，
+  同时最多 alpha_fetch_workers 个请求；结果未就绪（404 / 空响应）时按 Retry-After（缺省 3 秒）重试；
+- alpha_detail_recordsets 中的 recordsets（如 yearly-stats、pnl）需要额外的请求，默认不读取；
+  配置后每个 alpha 多 len(recordsets) 个 GET，在默认 5 rps 限流下会降低吞吐量；
+- AlphaArchive 把完整详情（全部 is 指标、checks、年度统计、PnL 序列与原始 JSON）缓冲后写入
+  backtest_result/alpha_details/template=<模板>/date=<YYYY-MM-DD>/part-*.parquet，
+  缓冲满 FLUSH_ROWS 条或最早一条已等待 FLUSH_SECONDS 秒时写出；add() 的 on_written 回调在该条写出后调用，
+  评估器在回调中写结果并把 journal 标记为完成，进程崩溃时未写出的详情仍留在 journal 中，下次运行重新读取；
+  之后的分析与相关性检查用 read_alpha_details() / pnl_matrix() 在本地读取，不再调用 API。
+
+Parquet 需要 pyarrow；未安装时在同样的目录结构下写 part-*.jsonl.gz，读取函数两种格式都支持。
+
+    alpha_fetch_workers: 8                          # ALPHA_FETCH_WORKERS
+    alpha_detail_recordsets: [yearly-stats, pnl]    # 默认 []：只读 /alphas/{id}
+
+    python -m evaluator.alpha_archive [--template NAME]    # 归档概况
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from threading import Lock
+
+import httpx
+import pandas as pd
+
+from evaluator.result_store import settings_hash
+from utils.config_loader import ConfigLoader
+from utils.rate_limiter import get_limiter, retry_after_seconds
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BACKTEST_DIR = Path(ConfigLoader.get("backtest_result_dir") or BASE_DIR / "data" / "alpha_db_v2" / "backtest_result")
+BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+ALPHA_DETAILS_DIR = BACKTEST_DIR / "alpha_details"
+
+WQ_API_BASE = ConfigLoader.get("worldquant_api_base")
+
+FETCH_ATTEMPTS = 10
+FETCH_MIN_DELAY = 3.0
+FLUSH_ROWS = 200
+FLUSH_SECONDS = 30
+# is 中的标量指标，归档为独立的列
+IS_COLUMNS = ["sharpe", "fitness", "turnover", "returns", "drawdown", "margin", "pnl", "bookSize",
+              "longCount", "shortCount"]
+# checks / recordsets / 原始详情以 JSON 字符串保存，各分区的 schema 保持一致
+JSON_COLUMNS = ["settings", "checks", "yearly_stats", "pnl_series", "raw"]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        return None
+
+
+def detail_row(alpha_expr, alpha_data, recordsets=None, settings=None, status=None):
+    """一条归档记录（不含分区列 template / date）"""
+    recordsets = recordsets or {}
+    is_data = alpha_data.get("is") or {}
+    settings = settings or alpha_data.get("settings") or {}
+    row = {
+        "alpha_id": alpha_data.get("id"),
+        "alpha": alpha_expr,
+        "settings_hash": settings_hash(settings),
+        "status": status,
+        "fetched_at": time.time(),
+        "settings": json.dumps(settings, sort_keys=True),
+        "checks": json.dumps(is_data.get("checks") or []),
+        "yearly_stats": json.dumps(recordsets.get("yearly-stats")) if "yearly-stats" in recordsets else None,
+        "pnl_series": json.dumps(recordsets.get("pnl")) if "pnl" in recordsets else None,
+        "raw": json.dumps(alpha_data),
+    }
+    for key in IS_COLUMNS:
+        value = is_data.get(key)
+        row[f"is_{key}"] = float(value) if isinstance(value, (int, float)) else None
+    return row
+
+
+# =========================
+# 归档
+# =========================
+class AlphaArchive:
+    def __init__(self, root=ALPHA_DETAILS_DIR, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.root = Path(root)
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.parquet = _pyarrow() is not None
+        self._buffers = {}     # (template, date) -> 待写出的行
+        self._callbacks = {}   # (template, date) -> 这些行写出后要调用的 on_written
+        self._pending = 0
+        self._oldest = None
+        self._lock = Lock()
+        self.written = 0
+        if not self.parquet:
+            logging.warning("未安装 pyarrow，alpha 详情以 jsonl.gz 归档")
+
+    def add(self, template, alpha_expr, alpha_data, recordsets=None, settings=None, status=None, on_written=None):
+        """缓冲一条详情；on_written() 在这条详情写入磁盘后调用（在执行写出的线程中）"""
+        row = detail_row(alpha_expr, alpha_data, recordsets, settings, status)
+        key = (template or "_", date.today().isoformat())
+        with self._lock:
+            self._buffers.setdefault(key, []).append(row)
+            if on_written is not None:
+                self._callbacks.setdefault(key, []).append(on_written)
+            self._pending += 1
+            self._oldest = self._oldest or time.time()
+            full = self._pending >= self.flush_rows
+        if full:
+            self.flush()
+        else:
+            self.flush_due()
+
+    def flush_due(self):
+        """最早缓冲的一条已等待 flush_seconds 秒时写出；评估器的轮询循环定期调用"""
+        if self._oldest is not None and time.time() - self._oldest >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """
+        逐个分区写出；只调用已写出分区的 on_written。某个分区写入失败时记录错误，
+        该分区及之后的分区留在缓冲中下次重试（已写出的分区不会重复写），对应的 journal 记录保持未完成
+        """
+        callbacks = []
+        with self._lock:
+            try:
+                self._flush(callbacks)
+            except Exception as e:
+                logging.error(f"写入 alpha 详情失败，{self._pending} 条留待下次写出: {e!r}")
+        for callback in callbacks:
+            callback()
+
+    def _flush(self, callbacks):
+        while self._buffers:
+            key, rows = next(iter(self._buffers.items()))
+            self._write_partition(key, rows)
+            del self._buffers[key]
+            self._pending -= len(rows)
+            self.written += len(rows)
+            callbacks.extend(self._callbacks.pop(key, []))
+        self._oldest = None
+
+    def _write_partition(self, key, rows):
+        """先写临时文件再改名，写入中途失败不会留下不完整的分区文件"""
+        template, day = key
+        part_dir = self.root / f"template={template}" / f"date={day}"
+        part_dir.mkdir(parents=True, exist_ok=True)
+        name = f"part-{int(time.time())}-{uuid.uuid4().hex[:8]}" + (".parquet" if self.parquet else ".jsonl.gz")
+        tmp_path = part_dir / f"{name}.tmp"
+        try:
+            if self.parquet:
+                self._write_parquet(tmp_path, rows)
+            else:
+                with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                    f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+            os.replace(tmp_path, part_dir / name)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _write_parquet(path, rows):
+        pa = _pyarrow()
+        fields = [pa.field(k, pa.string()) for k in ["alpha_id", "alpha", "settings_hash", "status"]]
+        fields += [pa.field("fetched_at", pa.float64())]
+        fields += [pa.field(k, pa.string()) for k in JSON_COLUMNS]
+        fields += [pa.field(f"is_{k}", pa.float64()) for k in IS_COLUMNS]
+        pa.parquet.write_table(pa.Table.from_pylist(rows, schema=pa.schema(fields)), str(path))
+
+    def close(self):
+        self.flush()
+
+
+def read_alpha_details(template=None, root=ALPHA_DETAILS_DIR):
+    """读取归档的 alpha 详情（DataFrame，含 template / date 列）；template 为空时读取全部"""
+    root = Path(root)
+    pattern = f"template={template}/date=*/part-*" if template else "template=*/date=*/part-*"
+    frames = []
+    for path in sorted(root.glob(pattern)):
+        if path.name.endswith(".parquet"):
+            frame = pd.read_parquet(path)
+        elif path.name.endswith(".jsonl.gz"):
+            frame = pd.read_json(path, lines=True, compression="gzip", dtype=False)
+        else:
+            continue
+        frame["template"] = path.parent.parent.name.split("=", 1)[1]
+        frame["date"] = path.parent.name.split("=", 1)[1]
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def pnl_matrix(template=None, root=ALPHA_DETAILS_DIR):
+    """各 alpha 的日 PnL 序列（行为日期、列为 alpha_id），用于本地相关性检查"""
+    details = read_alpha_details(template, root)
+    if details.empty:
+        return pd.DataFrame()
+    series = {}
+    for _, row in details.iterrows():
+        recordset = json.loads(row["pnl_series"]) if isinstance(row["pnl_series"], str) else None
+        if not recordset or not recordset.get("records"):
+            continue
+        names = [p["name"] for p in recordset.get("schema", {}).get("properties", [])] or ["date", "pnl"]
+        frame = pd.DataFrame(recordset["records"], columns=names)
+        series[row["alpha_id"]] = frame.set_index("date")["pnl"]
+    return pd.DataFrame(series).sort_index()
+
+
+# =========================
+# 读取
+# =========================
+def _recordsets_from_config():
+    return list(ConfigLoader.get("alpha_detail_recordsets") or [])
+
+
+def _parse(resp):
+    """200 且有内容时返回 JSON；recordset 仍在生成时平台返回空响应 + Retry-After"""
+    if resp.status_code != 200 or not resp.content:
+        return None
+    try:
+        return resp.json()
+    except ValueError:
+        return None
+
+
+def _should_retry(resp, required):
+    """未就绪（空响应 / 404）、限流与服务端错误时重试；可选的 recordset 返回 404 表示不存在"""
+    if resp.status_code == 404:
+        return required
+    return resp.status_code in (200, 429) or resp.status_code >= 500
+
+
+def _retry_delay(resp, delay):
+    return max(delay, retry_after_seconds(resp.headers) or FETCH_MIN_DELAY)
+
+
+class AsyncAlphaFetcher:
+    """异步评估器的 alpha 详情读取：由调度器在独立任务中调用，不占用 simulation 槽位，也不阻塞轮询"""
+
+    def __init__(self, workers=8, recordsets=None, attempts=FETCH_ATTEMPTS):
+        self._semaphore = asyncio.Semaphore(max(1, workers))
+        self.recordsets = _recordsets_from_config() if recordsets is None else list(recordsets)
+        self.attempts = attempts
+
+    @classmethod
+    def from_config(cls):
+        return cls(ConfigLoader.get("alpha_fetch_workers", 8))
+
+    async def _get(self, session, url, required=True):
+        for _ in range(self.attempts):
+            await session.limiter.wait_async()
+            try:
+                resp = await session.client.get(url)
+            except httpx.HTTPError as e:
+                logging.error(f"读取 {url} 出错: {e}")
+                await asyncio.sleep(max(session.limiter.on_error(), FETCH_MIN_DELAY))
+                continue
+            delay = session.limiter.on_response(resp.status_code, resp.headers)
+            data = _parse(resp)
+            if data is not None:
+                return data
+            if not _should_retry(resp, required):
+                return None
+            await asyncio.sleep(_retry_delay(resp, delay))
+        return None
+
+    async def fetch(self, session, alpha_id):
+        """返回 (alpha 详情, {recordset: 数据})，alpha 详情读取失败时为 (None, {})"""
+        async with self._semaphore:
+            alpha_data = await self._get(session, f"{WQ_API_BASE}/alphas/{alpha_id}")
+            if not alpha_data:
+                return None, {}
+            results = await asyncio.gather(*[
+                self._get(session, f"{WQ_API_BASE}/alphas/{alpha_id}/recordsets/{name}", required=False)
+                for name in self.recordsets])
+        return alpha_data, {name: data for name, data in zip(self.recordsets, results) if data is not None}
+
+
+def fetch_alpha_detail(sess, alpha_id, recordsets=None, attempts=FETCH_ATTEMPTS, limiter=None):
+    """同步读取 alpha 详情与 recordsets，返回 (alpha 详情, {recordset: 数据})"""
+    limiter = limiter or get_limiter()
+    recordsets = _recordsets_from_config() if recordsets is None else recordsets
+
+    def get(url, required=True):
+        for _ in range(attempts):
+            limiter.wait()
+            try:
+                resp = sess.get(url)
+            except Exception as e:
+                logging.error(f"读取 {url} 出错: {e}")
+                time.sleep(max(limiter.on_error(), FETCH_MIN_DELAY))
+                continue
+            delay = limiter.on_response(resp.status_code, resp.headers)
+            data = _parse(resp)
+            if data is not None:
+                return data
+            if not _should_retry(resp, required):
+                return None
+            time.sleep(_retry_delay(resp, delay))
+        return None
+
+    alpha_data = get(f"{WQ_API_BASE}/alphas/{alpha_id}")
+    if not alpha_data:
+        return None, {}
+    details = {}
+    for name in recordsets:
+        data = get(f"{WQ_API_BASE}/alphas/{alpha_id}/recordsets/{name}", required=False)
+        if data is not None:
+            details[name] = data
+    return alpha_data, details
+
+
+class AlphaFetcher:
+    """批量评估器的 alpha 详情读取：线程池中执行，submit() 立即返回 Future，轮询循环不等待"""
+
+    def __init__(self, sess, workers=8, recordsets=None, attempts=FETCH_ATTEMPTS):
+        self.sess = sess
+        self.recordsets = _recordsets_from_config() if recordsets is None else list(recordsets)
+        self.attempts = attempts
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="alpha-fetch")
+
+    @classmethod
+    def from_config(cls, sess):
+        return cls(sess, ConfigLoader.get("alpha_fetch_workers", 8))
+
+    def submit(self, alpha_id):
+        """Future 的结果为 (alpha 详情, {recordset: 数据})"""
+        return self._executor.submit(fetch_alpha_detail, self.sess, alpha_id, self.recordsets, self.attempts)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summary of the local alpha detail archive")
+    parser.add_argument("--template")
+    args = parser.parse_args()
+    details = read_alpha_details(args.template)
+    if details.empty:
+        print(f"⚠️ {ALPHA_DETAILS_DIR} 中没有归档的 alpha 详情")
+    else:
+        for template, group in details.groupby("template"):
+            print(f"   📦 {template}: {len(group)} alphas, {group['pnl_series'].notna().sum()} with PnL, "
+                  f"mean fitness={group['is_fitness'].mean():.3f}")
+        print(f"✅ {len(details)} alphas in {ALPHA_DETAILS_DIR}")
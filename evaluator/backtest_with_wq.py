@@ -1,65 +1,57 @@
-import json
 import csv
 import logging
 from pathlib import Path
 from time import sleep
-import requests
-from requests.auth import HTTPBasicAuth
 
+from evaluator.alpha_archive import AlphaArchive, fetch_alpha_detail
+from evaluator.result_store import INVALID, ResultStore
+from evaluator.sim_settings import get_settings, run_name
+from utils.alpha_file import count_alphas, iter_alphas
 from utils.config_loader import ConfigLoader
+from utils.fast_expr_validator import load_validator
+from utils.rate_limiter import get_limiter
+from utils.wq_client import WQSession
 
 BASE_DIR = Path(__file__).resolve().parents[1]
-BACKTEST_DIR = BASE_DIR / "data" / "alpha_db_v2" / "backtest_result"
+BACKTEST_DIR = Path(ConfigLoader.get("backtest_result_dir") or BASE_DIR / "data" / "alpha_db_v2" / "backtest_result")
 BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
 
+WQ_API_BASE = ConfigLoader.get("worldquant_api_base")
+
 logging.basicConfig(filename='backtest_with_wq.log', level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 # ====== 登录并保持 Session ======
 def sign_in():
-    """登录 WQ Brain 并返回 session"""
-    username = ConfigLoader.get('worldquant_account')
-    password = ConfigLoader.get('worldquant_password')
-
-    sess = requests.Session()
-    sess.auth = HTTPBasicAuth(username, password)
-    response = sess.post(ConfigLoader.get('worldquant_api_auth'))
-    print(f"Login status: {response.status_code}")
+    """登录 WQ Brain 并返回 session（请求带默认超时，会话过期时自动重新登录）"""
+    sess = WQSession()
+    sess.sign_in()
     return sess
 
 
 def run_backtest_by_wq_api(alphas_json_file):
     """回测指定 alphas json 文件"""
     sess = sign_in()
+    limiter = get_limiter()
 
-    # === 1. 读 alpha JSON ===
-    with open(alphas_json_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
+    # === 1. 读 alpha 文件（JSONL 或旧的 JSON 结构，逐条惰性读取） ===
     print(f"🔬 Start backtest for {alphas_json_file}")
-    # 支持两种结构
-    alphas = []
-    if "GeneratedAlphas" in data:
-        for item in data["GeneratedAlphas"]:
-            alphas.append(item["alpha"])
-    elif isinstance(data, list):
-        for item in data:
-            alphas.append(item["alpha"])
-    else:
+    n_alphas = count_alphas(alphas_json_file)
+    if n_alphas is None:
         print("❌ 不识别的 alpha JSON 格式")
         return None
+    alphas = iter_alphas(alphas_json_file)
 
     template_name = Path(alphas_json_file).stem
-    out_csv = BACKTEST_DIR / f"{template_name}_backtest.csv"
+    # settings 取 config.yaml 的 settings_profile；非 default 配置档的结果写入 "<模板>__<配置档>_backtest.csv"
+    settings = get_settings()
+    out_csv = BACKTEST_DIR / f"{run_name(template_name)}_backtest.csv"
 
-    # === 2. 读取已存在CSV，跳过已回测 ===
-    finished_alphas = set()
-    if out_csv.exists():
-        with open(out_csv, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                finished_alphas.add(row["alpha"])
-        print(f"⚠️ 已有 {len(finished_alphas)} 条回测结果，将跳过这些 alpha")
+    # === 2. 跳过已回测：只查全局结果库，结果库出现之前的旧 CSV 只导入一次 ===
+    store = ResultStore()
+    imported = store.import_csv(out_csv, template_name, settings)
+    if imported:
+        print(f"📥 已从 {out_csv.name} 导入 {imported} 条旧回测结果")
 
     # === 3. CSV准备写入 ===
     fieldnames = ["alpha", "sharpe", "turnover", "fitness", "returns", "drawdown", "margin"]
@@ -67,45 +59,49 @@ def run_backtest_by_wq_api(alphas_json_file):
     writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
     if csv_file.tell() == 0:  # 空文件时写表头
         writer.writeheader()
+    archive = AlphaArchive()
+    validator = load_validator()
 
     # === 4. 循环回测 ===
     alpha_fail_attempt_tolerance = 15
     for index, alpha_expr in enumerate(alphas, start=1):
-        if alpha_expr in finished_alphas:
-            print(f"✅ 跳过已回测 alpha: {alpha_expr[:40]}...")
-            continue
+        # 本地静态校验：无效表达式不提交，可修复的表达式以修复后的形式提交
+        if validator:
+            check = validator.validate(alpha_expr)
+            if not check.ok:
+                print(f"🚫 本地校验未通过: {alpha_expr[:60]}... {'; '.join(check.errors)}")
+                if store.get(alpha_expr, settings) is None:
+                    invalid_row = {"alpha": alpha_expr, "margin": INVALID}
+                    writer.writerow(invalid_row)
+                    store.put(template_name, settings, invalid_row)
+                continue
+            alpha_expr = check.fixed_expr
 
         # 组装模拟参数
         alpha_payload = {
             "type": "REGULAR",
-            "settings": {
-                "instrumentType": "EQUITY",
-                "region": "USA",
-                "universe": "TOP3000",
-                "delay": 1,
-                "decay": 0,
-                "neutralization": "SUBINDUSTRY",
-                "truncation": 0.01,
-                "pasteurization": "ON",
-                "unitHandling": "VERIFY",
-                "nanHandling": "OFF",
-                "language": "FASTEXPR",
-                "visualization": False,
-            },
+            "settings": settings,
             "regular": alpha_expr
         }
+        # 全局结果库中已有（可能来自其他模板）则跳过
+        if store.is_finished(alpha_expr, alpha_payload["settings"]):
+            print(f"✅ 跳过已回测 alpha: {alpha_expr[:40]}...")
+            continue
 
-        print(f"[{index}/{len(alphas)}] 回测 alpha: {alpha_expr[:60]}...")
+        print(f"[{index}/{n_alphas}] 回测 alpha: {alpha_expr[:60]}...")
         keep_trying = True
         failure_count = 0
 
         # === 4.1 提交 Simulation ===
         while keep_trying:
+            delay = 0
             try:
+                limiter.wait()
                 sim_resp = sess.post(
-                    'https://api.worldquantbrain.com/simulations',
+                    f'{WQ_API_BASE}/simulations',
                     json=alpha_payload
                 )
+                delay = limiter.on_response(sim_resp.status_code, sim_resp.headers, sim_resp.text)
                 if sim_resp.status_code not in (200, 201):
                     raise RuntimeError(f"Simulation submit failed {sim_resp.status_code}: {sim_resp.text}")
 
@@ -117,9 +113,11 @@ def run_backtest_by_wq_api(alphas_json_file):
                 keep_trying = False
             except Exception as e:
                 failure_count += 1
-                print(f"⚠️ No Location, sleep 15 and retry: {e}")
-                logging.error(f"No Location, sleep 15 and retry: {e}")
-                sleep(15)
+                # 优先使用服务端的 Retry-After，否则按抖动指数退避
+                wait = delay or limiter.on_error()
+                print(f"⚠️ No Location, sleep {wait:.0f}s and retry: {e}")
+                logging.error(f"No Location, sleep {wait:.0f}s and retry: {e}")
+                sleep(wait)
                 if failure_count >= alpha_fail_attempt_tolerance:
                     sess = sign_in()  # 重新登录
                     failure_count = 0
@@ -132,7 +130,12 @@ def run_backtest_by_wq_api(alphas_json_file):
         # 等待完成
         finished = False
         for _ in range(240):  # 最多轮询 240 次 * 15s = 60 分钟
+            limiter.wait()
             status_resp = sess.get(sim_progress_url)
+            delay = limiter.on_response(status_resp.status_code, status_resp.headers)
+            if delay > 0:
+                sleep(delay)
+                continue
             status_json = status_resp.json()
             status = status_json.get("status")
             if status == "COMPLETE":
@@ -149,19 +152,12 @@ def run_backtest_by_wq_api(alphas_json_file):
         if not finished:
             continue
 
-        # === 4.3 获取 Alpha 指标 ===
-        # alpha_resp = sess.get(f'https://api.worldquantbrain.com/alphas/{alpha_id}')
-        for attempt in range(20):
-            alpha_resp = sess.get(f'https://api.worldquantbrain.com/alphas/{alpha_id}')
-            if alpha_resp.status_code == 200:
-                alpha_data = alpha_resp.json()
-                break
-            else:
-                print(f"⏳ Alpha {alpha_id} not ready yet, status={alpha_resp.status_code}, retry {attempt + 1}")
-                sleep(5)
-        else:
+        # === 4.3 获取 Alpha 指标（含 recordsets，完整详情写入归档） ===
+        alpha_data, recordsets = fetch_alpha_detail(sess, alpha_id, attempts=20, limiter=limiter)
+        if not alpha_data:
             print(f"❌ Failed to fetch alpha result after retries for alphaId={alpha_id}")
-            continue  # 或 raise
+            continue
+        archive.add(template_name, alpha_expr, alpha_data, recordsets, settings, status)
 
         is_data = alpha_data.get("is", {})
         result_row = {
@@ -175,10 +171,13 @@ def run_backtest_by_wq_api(alphas_json_file):
         }
         writer.writerow(result_row)
         csv_file.flush()
+        store.put(template_name, alpha_payload["settings"], result_row)
         print(f"✅ 已写入回测结果: sharpe={result_row['sharpe']}, fitness={result_row['fitness']}")
 
 
     csv_file.close()
+    store.close()
+    archive.close()
     print(f"🎯 所有回测完成，结果已保存到 {out_csv}")
     return str(out_csv)
 
@@ -0,0 +1,946 @@
+# backtest_with_wq_async.py
+import asyncio
+import contextlib
+import heapq
+import itertools
+import csv
+import logging
+import signal
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+
+from evaluator.alpha_archive import AlphaArchive, AsyncAlphaFetcher
+from evaluator.early_stop import CHECK_EVERY, EarlyStopRules
+from evaluator.expr_repair import apply_overrides
+from evaluator.quota_budget import QuotaBudget
+from evaluator.result_store import FIELDNAMES, INVALID, ResultStore, ResultWriter
+from evaluator.session_pool import SessionPool
+from evaluator.sim_settings import get_settings, run_name
+from evaluator.sim_journal import SimJournal, DONE, LOST, multi_key, split_multi_key
+from utils.alpha_file import count_alphas, iter_alphas, read_header
+from utils.config_loader import ConfigLoader
+from utils.fast_expr import canonical_hash
+from utils.fast_expr_validator import load_validator
+from utils.negative_cache import NegativeCache
+from utils.rate_limiter import is_concurrency_limited, retry_after_seconds
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BACKTEST_DIR = Path(ConfigLoader.get("backtest_result_dir") or BASE_DIR / "data" / "alpha_db_v2" / "backtest_result")
+BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+
+WQ_API_BASE = ConfigLoader.get("worldquant_api_base")
+
+# 评估器使用的 simulation settings（config.yaml 的 settings_profile），见 sim_settings.py
+SIM_SETTINGS = get_settings()
+
+# 轮询间隔上下限（秒）：不早于 Retry-After，也不晚于 POLL_MAX_INTERVAL
+POLL_MIN_INTERVAL = 1.0
+POLL_MAX_INTERVAL = 60.0
+# 服务端未返回进度时，下一次检查间隔取已运行时间的比例（间隔随运行时间几何增长）
+POLL_ELAPSED_FRACTION = 0.25
+TERMINAL_STATUSES = ("COMPLETE", "WARNING", "ERROR", "FAIL")
+# 连续 POLL_ERROR_LIMIT 次读不到有效的进度（4xx、非 JSON 响应、网络异常）后放弃轮询，
+# 以 UNREACHABLE 结束：不写结果，journal 记录保留，下次运行时继续轮询
+POLL_ERROR_LIMIT = 5
+UNREACHABLE = "UNREACHABLE"
+# 平台单个 multi-simulation 最多包含的 alpha 数
+MULTI_SIM_MAX = 10
+# 提交队列每次从 alpha 文件读取（并校验、去重）的条数
+PRODUCE_BATCH = 32
+
+logging.basicConfig(filename='backtest_with_wq.log', level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def make_payload(expr, settings=None):
+    """构造单个 alpha 的 simulation payload"""
+    return {
+        "type": "REGULAR",
+        "settings": dict(settings or SIM_SETTINGS),
+        "regular": expr
+    }
+
+
+def make_multi_payload(exprs, settings=None):
+    """multi-simulation payload：多个 REGULAR payload 组成的列表，整体只占一个并发槽位"""
+    return [make_payload(expr, settings) for expr in exprs]
+
+
+def next_poll_delay(elapsed, progress=None, retry_after=None,
+                    min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL):
+    """
+    根据已运行时间与服务端提示计算下一次检查的等待秒数：
+    有进度时按当前速度线性外推剩余时间，正好在预计完成时检查；
+    无进度时取已运行时间的一部分；结果夹在 [min_interval, max_interval] 内，且不早于 Retry-After。
+    """
+    try:
+        progress = float(progress)
+    except (TypeError, ValueError):
+        progress = None
+    if progress is not None and 0 < progress < 1:
+        delay = elapsed * (1 - progress) / progress
+    else:
+        delay = elapsed * POLL_ELAPSED_FRACTION
+    delay = min(max(delay, min_interval), max_interval)
+    return max(delay, retry_after or 0.0)
+
+
+class ProgressPoller:
+    """
+    所有在途 simulation 共用一个定时堆：每个任务按自己的预计完成时间排队，
+    到期才发起一次检查，检查结果决定下一次检查时间，取代每个任务各自固定间隔的 sleep 循环。
+    多账号时每个任务用提交它的账号会话（session.client / session.limiter）检查。
+    """
+
+    def __init__(self, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.stats = {"polls": 0, "jobs": 0}
+        self._heap = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._checks = set()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        for task in [self._task, *self._checks]:
+            if task:
+                task.cancel()
+        await asyncio.gather(*[t for t in [self._task, *self._checks] if t], return_exceptions=True)
+        self._task = None
+
+    async def wait(self, session, sim_url, label="", first_delay=None):
+        """登记一个在途 simulation，结束后返回 status_json（服务器上已不存在时返回 LOST）"""
+        self.start()
+        job = {
+            "session": session,
+            "url": sim_url,
+            "label": label,
+            "started": time.monotonic(),
+            "future": asyncio.get_running_loop().create_future(),
+        }
+        self.stats["jobs"] += 1
+        self._schedule(job, first_delay if first_delay is not None else self.min_interval)
+        return await job["future"]
+
+    def _schedule(self, job, delay):
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), job))
+        self._wakeup.set()
+
+    async def _loop(self):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            due = self._heap[0][0]
+            now = time.monotonic()
+            if due > now:
+                # 等到最早的任务到期，或有新任务插到堆顶
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), due - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, job = heapq.heappop(self._heap)
+            task = asyncio.create_task(self._check(job))
+            self._checks.add(task)
+            task.add_done_callback(self._checks.discard)
+
+    async def _check(self, job):
+        """检查一次进度；任何情况下都要么重新排期，要么结束 job["future"]，等待它的 worker 不会永久挂起"""
+        try:
+            await self._check_once(job)
+        except Exception as e:
+            logging.error(f"检查 {job['url']} 出错: {e!r}")
+            if not job["future"].done():
+                job["future"].set_result({"status": UNREACHABLE, "message": repr(e)})
+
+    def _poll_error(self, job, session, message):
+        job["errors"] = job.get("errors", 0) + 1
+        logging.error(f"检查 {job['url']} 出错（第 {job['errors']} 次）: {message}")
+        if job["errors"] >= POLL_ERROR_LIMIT:
+            job["future"].set_result({"status": UNREACHABLE, "message": message})
+            return
+        self._schedule(job, session.limiter.on_error())
+
+    async def _check_once(self, job):
+        session = job["session"]
+        await session.limiter.wait_async()
+        self.stats["polls"] += 1
+        try:
+            resp = await session.client.get(job["url"])
+        except httpx.HTTPError as e:
+            self._poll_error(job, session, repr(e))
+            return
+        delay = session.limiter.on_response(resp.status_code, resp.headers)
+        if delay > 0:
+            self._schedule(job, delay)
+            return
+        if resp.status_code == 404:
+            job["future"].set_result({"status": LOST})
+            return
+        if resp.status_code >= 400:
+            self._poll_error(job, session, f"HTTP {resp.status_code}: {resp.text[:200]}")
+            return
+
+        # simulation 进行中时 body 可能为空
+        try:
+            status_json = resp.json() if resp.content else {}
+        except ValueError as e:
+            self._poll_error(job, session, f"invalid JSON ({e}): {resp.text[:200]}")
+            return
+        if not isinstance(status_json, dict):
+            self._poll_error(job, session, f"unexpected body: {resp.text[:200]}")
+            return
+        job["errors"] = 0
+        status = status_json.get("status")
+        if status in TERMINAL_STATUSES:
+            job["future"].set_result(status_json)
+            return
+        progress = status_json.get("progress")
+        elapsed = time.monotonic() - job["started"]
+        wait = next_poll_delay(elapsed, progress, retry_after_seconds(resp.headers),
+                               self.min_interval, self.max_interval)
+        if status or progress is not None:
+            print(f"⏳ {job['label'][:40]}... status={status or 'RUNNING'}, progress={progress}, next check in {wait:.1f}s")
+        self._schedule(job, wait)
+
+
+class SlidingWindowScheduler:
+    """
+    滑动窗口调度器：始终让会话池中每个账号的槽位都有 simulation 在途。
+    任意一个 slot 释放后立即向空闲槽位最多的账号提交下一个 alpha，所有在途任务通过同一个定时堆轮询。
+    multi_size > 1 时每 multi_size 个 alpha 打包成一个 multi-simulation 占用一个 slot，
+    结束后逐个读取子 simulation，结果仍按单个 alpha 写入。
+    early_stop 规则触发（或模板已被淘汰）后不再提交该模板的新 alpha，在途 simulation 照常结束。
+    ERROR 信息中的无效字段 / 运算符组合记入 negative_cache，之后包含这些模式的 alpha 不再提交。
+    simulation 结束后立即释放 slot，alpha 详情由 fetcher 在独立任务中并发读取，完整详情写入 archive。
+    多个调度器可以共享同一个会话池并发运行（工作队列的相邻工作项、settings 扫描），槽位由会话池统一分配；
+    produced 在所有待回测项都已交给 worker 后置位，调用方据此提前准备下一批工作，窗口不会在批次边界排空。
+    """
+
+    def __init__(self, pool, writer, poll_interval=5, journal=None, template=None, multi_size=0,
+                 early_stop=None, negative_cache=None, settings=None, journal_name=None, fetcher=None, archive=None,
+                 produced=None):
+        self.pool = pool
+        self.poller = ProgressPoller()
+        self.writer = writer
+        self.journal = journal
+        self.template = template
+        # 非 default 配置档的在途 simulation 以 "<模板>__<配置档>" 记入 journal
+        self.journal_name = journal_name or template
+        self.settings = settings or SIM_SETTINGS
+        self.concurrency = pool.capacity
+        self.poll_interval = poll_interval
+        self.multi_size = min(max(multi_size or 0, 0), MULTI_SIM_MAX)
+        # 一个 multi-simulation 按包含的 alpha 数扣预算，不能超过小时 / 天预算，否则永远提交不了
+        max_cost = pool.budget.max_cost if pool.budget else None
+        if max_cost and self.multi_size > max_cost:
+            print(f"⚠️ wq_multi_simulation_size {self.multi_size} exceeds the simulation budget, using {max_cost}")
+            self.multi_size = max_cost
+        self.total = 0
+        self.stats = {"submitted": 0, "resumed": 0, "completed": 0, "failed": 0, "skipped": 0, "blocked": 0}
+        self.draining = False
+        self.produced = produced or asyncio.Event()
+        self.early_stop = early_stop if early_stop is not None and early_stop.enabled else None
+        self.retired = None
+        self._since_check = 0
+        self.negative_cache = negative_cache
+        self.blocked_by = Counter()
+        self.fetcher = fetcher or AsyncAlphaFetcher.from_config()
+        self.archive = archive
+        self._fetches = set()
+        # slot 利用率统计：在途数量对时间积分
+        self._in_flight = 0
+        self._busy_slot_seconds = 0.0
+        self._last_tick = None
+        self._started_at = None
+
+    def _tick(self, delta):
+        now = time.monotonic()
+        self._busy_slot_seconds += self._in_flight * (now - self._last_tick)
+        self._last_tick = now
+        self._in_flight += delta
+
+    def utilisation(self):
+        """返回运行期间的平均 slot 利用率 (0~1)"""
+        if self._started_at is None:
+            return 0.0
+        self._tick(0)
+        wall = self._last_tick - self._started_at
+        if wall <= 0:
+            return 0.0
+        return self._busy_slot_seconds / (wall * self.concurrency)
+
+    def write_row(self, alpha_expr, is_data=None, margin=None):
+        is_data = is_data or {}
+        self.writer.writerow({
+            "alpha": alpha_expr,
+            "sharpe": is_data.get("sharpe"),
+            "turnover": is_data.get("turnover"),
+            "fitness": is_data.get("fitness"),
+            "returns": is_data.get("returns"),
+            "drawdown": is_data.get("drawdown"),
+            "margin": margin if margin is not None else is_data.get("margin"),
+        })
+
+    async def submit(self, session, alpha_expr):
+        """
+        提交 alpha（列表表示 multi-simulation），返回 (progress url, 首次检查前应等待的秒数)；
+        遇到限流 / 并发上限时按 Retry-After 或退避等待后重试
+        """
+        payload = make_multi_payload(alpha_expr, self.settings) if isinstance(alpha_expr, list) \
+            else make_payload(alpha_expr, self.settings)
+        while True:
+            await session.limiter.wait_async()
+            try:
+                resp = await session.client.post(f"{WQ_API_BASE}/simulations", json=payload)
+            except httpx.HTTPError as e:
+                logging.error(f"提交 {alpha_expr} 出错: {e}")
+                await asyncio.sleep(session.limiter.on_error())
+                continue
+
+            delay = session.limiter.on_response(resp.status_code, resp.headers, resp.text)
+            if is_concurrency_limited(resp.status_code, resp.text):
+                session.on_limit_hit()
+            if resp.status_code in (200, 201):
+                sim_url = resp.headers.get("Location")
+                if sim_url:
+                    return sim_url, retry_after_seconds(resp.headers)
+                logging.error(f"提交 {alpha_expr} 未返回 Location")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            print(f"❌ 提交失败: {resp.status_code}, {resp.text}")
+            return None, None
+
+    async def poll(self, session, alpha_expr, sim_url, first_delay=None):
+        """交给共享的定时堆轮询，直到 simulation 结束，返回 status_json"""
+        return await self.poller.wait(session, sim_url, alpha_expr, first_delay)
+
+    async def run_one(self, session, index, alpha_expr, sim_url=None):
+        """sim_url 不为空时表示从 journal 恢复的在途 simulation，只轮询不重新提交"""
+        first_delay = None
+        if sim_url:
+            self.stats["resumed"] += 1
+            print(f"♻️ 恢复轮询: {alpha_expr[:50]}... -> {sim_url}")
+        else:
+            sim_url, first_delay = await self.submit(session, alpha_expr)
+            if not sim_url:
+                self.pool.refund(session)
+                self._count(session, "failed")
+                return
+            if self.journal:
+                self.journal.record_submitted(self.journal_name, alpha_expr, sim_url, session.name)
+            self._count(session, "submitted")
+            print(f"📩 提交成功: {index}/{self.total} -> {alpha_expr[:50]}... ({session.name})")
+
+        status_json = await self.poll(session, alpha_expr, sim_url, first_delay)
+        await self.collect(session, alpha_expr, status_json, sim_url)
+
+    def _count(self, session, key, n=1):
+        """同时累计全局与账号维度的统计"""
+        self.stats[key] += n
+        session.stats[key] += n
+        if key in ("completed", "failed"):
+            self._since_check += n
+            if self._since_check >= CHECK_EVERY:
+                self.check_early_stop()
+
+    def check_early_stop(self):
+        """结果库中该模板已被淘汰或本次触发提前终止规则时，停止提交新的 alpha"""
+        self._since_check = 0
+        if self.retired or not self.template:
+            return self.retired
+        store = self.writer.store
+        self.retired = store.retired_reason(self.template)
+        if self.retired is None and self.early_stop:
+            self.retired = self.early_stop.check(store, self.template)
+        return self.retired
+
+    async def run_multi(self, session, indices, exprs, keys=None):
+        """
+        提交（或恢复）一个 multi-simulation，结束后把每个子 simulation 的结果分别写入；
+        keys 不为空时表示从 journal 恢复，为各 alpha 的 multi_key
+        """
+        first_delay = None
+        label = f"multi[{len(exprs)}] {exprs[0]}"
+        if keys:
+            parent_url = split_multi_key(keys[0])[0]
+            self.stats["resumed"] += len(exprs)
+            print(f"♻️ 恢复轮询 multi-simulation ({len(exprs)} alphas) -> {parent_url}")
+        else:
+            parent_url, first_delay = await self.submit(session, exprs)
+            if not parent_url:
+                self.pool.refund(session)
+                self._count(session, "failed", len(exprs))
+                return
+            if self.journal:
+                self.journal.record_multi_submitted(self.journal_name, exprs, parent_url, session.name)
+            keys = [multi_key(parent_url, i) for i in range(len(exprs))]
+            self._count(session, "submitted", len(exprs))
+            print(f"📩 提交 multi-simulation: {indices[0]}..{indices[-1]}/{self.total} "
+                  f"({len(exprs)} alphas, {session.name})")
+
+        status_json = await self.poll(session, label, parent_url, first_delay)
+        children = status_json.get("children") or []
+        if status_json.get("status") in (LOST, UNREACHABLE) or not children:
+            # 父任务失效或没有子任务：逐个按父任务状态处理
+            for expr, key in zip(exprs, keys):
+                await self.collect(session, expr, status_json, key)
+            return
+
+        # 子任务在父任务结束时已全部结束，立即通过定时堆并发读取
+        child_results = await asyncio.gather(*[
+            self.poller.wait(session, f"{WQ_API_BASE}/simulations/{child_id}", label, 0) for child_id in children])
+        by_code = {}
+        for i, child_json in enumerate(child_results):
+            code = child_json.get("regular")
+            code = code.get("code") if isinstance(code, dict) else code
+            by_code.setdefault(code, []).append(i)
+        for expr, key in zip(exprs, keys):
+            # 优先按子任务返回的表达式对应，取不到时按提交顺序对应
+            matched = by_code.get(expr)
+            j = matched.pop(0) if matched else split_multi_key(key)[1]
+            if j >= len(child_results):
+                await self.collect(session, expr, {"status": "MISSING_CHILD"}, key)
+                continue
+            await self.collect(session, expr, child_results[j], key)
+
+    async def collect(self, session, alpha_expr, status_json, journal_key):
+        """根据 simulation 结束时的 status_json 读取 alpha 指标并写入结果"""
+        status = status_json.get("status")
+        if status == LOST:
+            # 服务器上已不存在，不写结果，下次运行时重新提交
+            self._finish_journal(journal_key, LOST)
+            self._count(session, "failed")
+            print(f"⚠️ simulation 已失效: {journal_key}")
+            return
+        if status == UNREACHABLE:
+            # 多次读不到进度：simulation 可能仍在运行，不写结果、保留 journal 记录，下次运行时继续轮询
+            self._count(session, "failed")
+            print(f"⚠️ 无法读取 simulation 进度，下次运行时继续轮询: {journal_key} ({status_json.get('message')})")
+            return
+
+        alpha_id = status_json.get("alpha")
+        if status not in ("COMPLETE", "WARNING") or not alpha_id:
+            if status == "ERROR" and self.negative_cache is not None:
+                self.negative_cache.learn(alpha_expr, status_json, self.settings)
+            self.write_row(alpha_expr, margin=f"FAILED:{status}")
+            self._finish_journal(journal_key)
+            self._count(session, "failed")
+            print(f"❌ 模拟失败: {alpha_expr[:60]}...")
+            return
+
+        # 读取结果不占用 slot：交给后台任务，run() 结束前等待全部完成
+        task = asyncio.create_task(self.store_result(session, alpha_expr, alpha_id, status, journal_key))
+        self._fetches.add(task)
+        task.add_done_callback(self._fetches.discard)
+
+    async def store_result(self, session, alpha_expr, alpha_id, status, journal_key):
+        """
+        读取 alpha 详情并归档；归档写入磁盘后才写结果、把 journal 标记为完成，
+        读取失败或进程在写出前退出时保留 journal 记录，下次运行时继续读取
+        """
+        try:
+            alpha_data, recordsets = await self.fetcher.fetch(session, alpha_id)
+        except Exception as e:
+            logging.error(f"读取 alpha {alpha_id} 出错: {e}")
+            alpha_data, recordsets = None, {}
+        if not alpha_data:
+            self._count(session, "failed")
+            return
+        is_data = alpha_data.get("is", {})
+
+        def finish():
+            self.write_row(alpha_expr, is_data)
+            self._finish_journal(journal_key)
+            self._count(session, "completed")
+            print(f"✅ 完成: {alpha_expr}... fitness={is_data.get('fitness')}")
+
+        if self.archive is None:
+            finish()
+        else:
+            self.archive.add(self.template, alpha_expr, alpha_data, recordsets, self.settings, status,
+                             on_written=finish)
+
+    async def flush_archive(self):
+        """定期写出归档缓冲（以及等待写出的结果与 journal）"""
+        while True:
+            await asyncio.sleep(self.archive.flush_seconds)
+            self.archive.flush_due()
+
+    def _finish_journal(self, sim_url, status=DONE):
+        if self.journal:
+            self.journal.mark_finished(sim_url, status)
+
+    def drop_blocked(self, index, alpha_expr):
+        """
+        去掉包含已知无效模式的 alpha（记为 FAILED:BLOCKED，不占用 simulation），
+        返回剩余的 (index, alpha_expr)；multi-simulation 只剩一个 alpha 时退化为单个提交
+        """
+        indices, exprs = (index, alpha_expr) if isinstance(alpha_expr, list) else ([index], [alpha_expr])
+        kept = []
+        for i, expr in zip(indices, exprs):
+            pattern = self.negative_cache.match(expr, self.settings)
+            if pattern is None:
+                kept.append((i, expr))
+                continue
+            self.write_row(expr, margin=f"FAILED:BLOCKED:{pattern}")
+            self.stats["blocked"] += 1
+            self.blocked_by[pattern] += 1
+            print(f"🚫 跳过已知无效模式 {pattern}: {expr[:60]}...")
+        if not kept:
+            return None, None
+        if len(kept) == 1:
+            return kept[0]
+        return [i for i, _ in kept], [expr for _, expr in kept]
+
+    async def worker(self, queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.task_done()
+                return
+            index, alpha_expr, sim_url = item
+            if not sim_url and self.negative_cache is not None:
+                index, alpha_expr = self.drop_blocked(index, alpha_expr)
+                if alpha_expr is None:
+                    queue.task_done()
+                    continue
+            # 恢复的在途 simulation 只能由提交它的账号读取，且不消耗预算
+            owner = None
+            if sim_url and self.journal:
+                owner = self.pool.get(self.journal.account_of(sim_url[0] if isinstance(sim_url, list) else sim_url))
+            # multi-simulation 在 WQ 上是一个并发 simulation：只占一个 slot，但按包含的 alpha 数扣预算
+            n_alphas = len(alpha_expr) if isinstance(alpha_expr, list) else 1
+            cost = 0 if sim_url else n_alphas
+            session = None if self.retired and cost else await self.pool.acquire(owner, cost)
+            if session is None:
+                # 正在 drain 或模板已淘汰：不再提交，留给下次运行
+                self.stats["skipped"] += n_alphas
+                queue.task_done()
+                continue
+            self._tick(+1)
+            try:
+                if isinstance(alpha_expr, list):
+                    await self.run_multi(session, index, alpha_expr, sim_url)
+                else:
+                    await self.run_one(session, index, alpha_expr, sim_url)
+            except Exception as e:
+                logging.error(f"回测 {alpha_expr} 出错: {e}")
+            finally:
+                self._tick(-1)
+                await self.pool.release(session)
+                queue.task_done()
+
+    def drain(self):
+        """收到 SIGINT / SIGTERM：停止提交新的 alpha，等在途 simulation 结束后正常退出；再次收到信号时立即退出"""
+        if self.draining:
+            raise KeyboardInterrupt
+        self.draining = True
+        print(f"🛑 Draining: no new submissions, waiting for {self._in_flight} in-flight simulations "
+              f"(signal again to abort)")
+        asyncio.get_running_loop().create_task(self.pool.drain())
+
+    def pack(self, alphas):
+        """
+        把待回测项（惰性）整理成队列项：journal 中属于同一个 multi-simulation 的 alpha 重新归为一组恢复，
+        multi_size > 1 时新 alpha 每 multi_size 个打包；分组项为 ([index, ...], [expr, ...], [journal key, ...] 或 None)。
+        恢复的在途项排在新 alpha 之前，读到第一个新 alpha 时输出全部恢复的分组
+        """
+        groups, chunk = {}, []
+
+        def flush_groups():
+            for members in sorted(groups.values()):
+                members.sort()
+                yield [m[1] for m in members], [m[2] for m in members], [m[3] for m in members]
+            groups.clear()
+
+        def flush_chunk():
+            if len(chunk) == 1:
+                yield chunk[0][0], chunk[0][1], None
+            elif chunk:
+                yield [index for index, _ in chunk], [expr for _, expr in chunk], None
+            chunk.clear()
+
+        for index, expr, url in alphas:
+            parent_url, position = split_multi_key(url) if url else (None, None)
+            if position is not None:
+                groups.setdefault(parent_url, []).append((position, index, expr, url))
+                continue
+            if not url:
+                yield from flush_groups()
+            if url or self.multi_size <= 1:
+                yield index, expr, url
+                continue
+            chunk.append((index, expr))
+            if len(chunk) >= self.multi_size:
+                yield from flush_chunk()
+        yield from flush_groups()
+        yield from flush_chunk()
+
+    async def produce(self, alphas, queue):
+        """
+        在线程中逐批读取待回测项（读文件、本地校验、查结果库），放入有界队列，
+        第一批读到即可开始提交；drain 或模板被淘汰后停止读取
+        """
+        items = self.pack(alphas)
+        try:
+            while not (self.draining or self.retired):
+                batch = await asyncio.to_thread(list, itertools.islice(items, PRODUCE_BATCH))
+                if not batch:
+                    break
+                for item in batch:
+                    await queue.put(item)
+        finally:
+            self.produced.set()
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+    async def run(self, alphas, total=None):
+        """alphas: (index, expr, progress_url or None) 的可迭代对象，可以是边读文件边产生的生成器；total 仅用于进度显示"""
+        self.total = total if total is not None else len(alphas) if hasattr(alphas, "__len__") else 0
+        queue = asyncio.Queue(maxsize=self.concurrency)
+
+        if self.check_early_stop():
+            print(f"⛔ Template {self.template} is retired ({self.retired}), only in-flight simulations are polled")
+        self._started_at = self._last_tick = time.monotonic()
+        workers = [asyncio.create_task(self.worker(queue)) for _ in range(self.concurrency)]
+        producer = asyncio.create_task(self.produce(alphas, queue))
+        self.poller.start()
+        flusher = asyncio.create_task(self.flush_archive()) if self.archive is not None else None
+        try:
+            await asyncio.gather(producer, *workers)
+            if self._fetches:
+                await asyncio.gather(*list(self._fetches))
+            if self.archive is not None:
+                self.archive.flush()
+        finally:
+            if flusher is not None:
+                flusher.cancel()
+            await self.poller.close()
+
+
+class EvaluationContext:
+    """
+    一个评估进程内共享的资源：会话池、结果库、journal、负缓存、归档与本地校验器。
+    每个 alpha 文件（或工作队列分发的一段）由 run_file() 创建一个调度器，所有调度器共用会话池，
+    工作队列模式下整个进程只登录一次、只有一个事件循环，不在工作项之间重建这些资源。
+    """
+
+    def __init__(self, pool, multi_size=None, profile=None):
+        self.pool = pool
+        self.profile = profile
+        self.settings = get_settings(profile)
+        self.multi_size = ConfigLoader.get("wq_multi_simulation_size", 0) if multi_size is None else multi_size
+        self.store = ResultStore()
+        self.journal = SimJournal()
+        self.negative_cache = NegativeCache()
+        self.archive = AlphaArchive()
+        self.early_stop = EarlyStopRules.from_config()
+        # 本地静态校验：无效表达式直接记为失败，可修复的表达式以修复后的形式提交
+        self.validator = load_validator()
+        self.schedulers = set()
+        self.draining = False
+        self._writers = {}
+        self._resumed = set()
+
+    def writer(self, name, template_name):
+        """每个回测 CSV 只打开一次，同一模板的相邻工作项共用一个写入器"""
+        if name not in self._writers:
+            out_csv = BACKTEST_DIR / f"{name}_backtest.csv"
+            csv_file = open(out_csv, "a", newline="", encoding="utf-8")
+            writer = ResultWriter(csv.DictWriter(csv_file, fieldnames=FIELDNAMES), csv_file, self.store,
+                                  template_name, self.settings)
+            if csv_file.tell() == 0:
+                writer.writeheader()
+            self._writers[name] = (csv_file, writer)
+        return self._writers[name][1]
+
+    def resume(self, name):
+        """上次被中断时仍在途的 simulation：继续轮询，不重新提交（每个模板在本进程内只恢复一次）"""
+        if name in self._resumed:
+            return {}
+        self._resumed.add(name)
+        resumed = {}
+        for alpha_expr, progress_url in self.journal.outstanding(name):
+            if self.store.is_finished(alpha_expr, self.settings):
+                self.journal.mark_finished(progress_url)
+                continue
+            resumed[alpha_expr] = progress_url
+        if resumed:
+            print(f"♻️ 从 journal 恢复 {len(resumed)} 个在途 simulation")
+        return resumed
+
+    def drain(self):
+        """收到 SIGINT / SIGTERM：所有调度器停止提交，等在途 simulation 结束后正常退出；再次收到信号时立即退出"""
+        if self.draining:
+            raise KeyboardInterrupt
+        self.draining = True
+        in_flight = sum(s._in_flight for s in self.schedulers)
+        print(f"🛑 Draining: no new submissions, waiting for {in_flight} in-flight simulations "
+              f"(signal again to abort)")
+        for scheduler in self.schedulers:
+            scheduler.draining = True
+        asyncio.get_running_loop().create_task(self.pool.drain())
+
+    async def run_file(self, alphas_json_file, alpha_range=None, produced=None, byte_offset=None):
+        """
+        回测一个 alpha 文件，alpha_range=(start, stop) 时只回测该段，byte_offset 为该段第一条 alpha 的字节偏移
+        （工作队列入队时记录）；返回回测 CSV 路径，格式无法识别时返回 None。
+        produced 在该文件的所有 alpha 都已交给调度器（或无需回测）时置位
+        """
+        produced = produced or asyncio.Event()
+        try:
+            return await self._run_file(alphas_json_file, alpha_range, produced, byte_offset)
+        finally:
+            produced.set()
+
+    async def _run_file(self, alphas_json_file, alpha_range, produced, byte_offset=None):
+        print(f"🔬 Start backtest for {alphas_json_file}")
+        if alpha_range is not None:
+            # 工作队列分发的段：入队时已确认格式与条数，不再扫描整个文件
+            n_alphas = alpha_range[1]
+        else:
+            n_alphas = count_alphas(alphas_json_file)
+        if n_alphas is None or read_header(alphas_json_file) is None:
+            print("❌ 不识别的 alpha JSON 格式")
+            return None
+        # alpha 文件逐行惰性读取，alpha_range 时只读取 [start, stop) 段（工作队列分发的 chunk），有偏移时直接 seek
+        offset, stop = alpha_range if alpha_range is not None else (0, None)
+        alphas = iter_alphas(alphas_json_file, offset, stop, byte_offset)
+        total = max(0, min(n_alphas, stop if stop is not None else n_alphas) - offset)
+        if alpha_range is not None:
+            print(f"🧩 Alpha range [{offset}, {offset + total})")
+
+        template_name = Path(alphas_json_file).stem
+        settings = self.settings
+        name = run_name(template_name, self.profile)
+        out_csv = BACKTEST_DIR / f"{name}_backtest.csv"
+        # 批量评估器中 LLM 修复过的表达式以 alpha_overrides.jsonl 中的版本为准
+        alphas = apply_overrides(alphas, template_name)
+
+        # 是否已回测只查全局结果库（主键索引）；结果库出现之前的旧 CSV 只在第一次运行时导入一次
+        store = self.store
+        imported = store.import_csv(out_csv, template_name, settings)
+        if imported:
+            print(f"📥 已从 {out_csv.name} 导入 {imported} 条旧回测结果")
+        resumed = self.resume(name)
+
+        # 全局结果库：跨模板去重，同一表达式在同一 settings 下只回测一次
+        retired = store.retired_reason(template_name)
+        if retired and not resumed:
+            # 提前终止规则已淘汰该模板（python -m evaluator.early_stop --revive 可恢复）
+            print(f"⛔ 模板 {template_name} 已淘汰，跳过: {retired}")
+            return str(out_csv)
+        writer = self.writer(name, template_name)
+
+        validator = self.validator
+        seen_hashes = set(canonical_hash(expr) for expr in resumed)
+        counts = Counter()
+
+        def todo():
+            """待回测项：先是恢复的在途 simulation，再是边读文件边校验、去重的新 alpha"""
+            for expr, url in resumed.items():
+                yield 0, expr, url
+            for i, expr in enumerate(alphas, offset + 1):
+                if expr in resumed:
+                    continue
+                if validator:
+                    check = validator.validate(expr)
+                    if not check.ok:
+                        counts["invalid"] += 1
+                        print(f"🚫 本地校验未通过: {expr[:60]}... {'; '.join(check.errors)}")
+                        if store.get(expr, settings) is None:
+                            writer.writerow({"alpha": expr, "margin": INVALID})
+                        continue
+                    if check.repairs:
+                        print(f"🔧 自动修复: {'; '.join(check.repairs)}")
+                    expr = check.fixed_expr
+                # 语义等价的表达式（同一文件内或已在结果库中）只回测一次
+                h = canonical_hash(expr)
+                if h in seen_hashes or store.is_finished(expr, settings):
+                    counts["skipped"] += 1
+                    continue
+                seen_hashes.add(h)
+                yield i, expr, None
+
+        scheduler = SlidingWindowScheduler(self.pool, writer, journal=self.journal, template=template_name,
+                                           multi_size=self.multi_size, early_stop=self.early_stop,
+                                           negative_cache=self.negative_cache, settings=settings, journal_name=name,
+                                           archive=self.archive, produced=produced)
+        scheduler.draining = self.draining
+        self.schedulers.add(scheduler)
+        try:
+            await scheduler.run(todo(), total=total)
+        finally:
+            self.schedulers.discard(scheduler)
+        if counts["skipped"]:
+            print(f"⚠️ {counts['skipped']} 条 alpha 与已回测 / 待回测的表达式等价，跳过")
+        if counts["invalid"]:
+            print(f"🚫 {counts['invalid']} 条 alpha 未通过本地校验，未提交")
+        print(f"📊 submitted={scheduler.stats['submitted']}, resumed={scheduler.stats['resumed']}, "
+              f"completed={scheduler.stats['completed']}, failed={scheduler.stats['failed']}, "
+              f"skipped={scheduler.stats['skipped']}, blocked={scheduler.stats['blocked']}, "
+              f"slot utilisation={scheduler.utilisation():.1%}, "
+              f"polls={scheduler.poller.stats['polls']}, accounts={len(self.pool.active)}"
+              + (f", retired: {scheduler.retired}" if scheduler.retired else ""))
+        if scheduler.blocked_by:
+            self.negative_cache.record_hits(scheduler.blocked_by)
+        if scheduler.draining:
+            print(f"🛑 Drained, results saved to {out_csv}")
+        else:
+            print(f"🎯 回测完成，结果已保存 {out_csv}")
+        return str(out_csv)
+
+    def close(self):
+        # 先写出归档：其回调还要写 CSV、结果库与 journal
+        self.archive.close()
+        for csv_file, _ in self._writers.values():
+            csv_file.close()
+        self.journal.close()
+        self.store.close()
+        self.negative_cache.close()
+
+
+@contextlib.asynccontextmanager
+async def evaluation_context(concurrency, multi_size=None, profile=None):
+    """登录会话池并创建共享资源；SIGINT / SIGTERM 时 drain 所有调度器"""
+    budget = QuotaBudget.from_config()
+    loop = asyncio.get_running_loop()
+    try:
+        async with SessionPool.from_config(concurrency, budget) as pool:
+            ctx = EvaluationContext(pool, multi_size, profile)
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                with contextlib.suppress(NotImplementedError, RuntimeError):
+                    loop.add_signal_handler(sig, ctx.drain)
+            try:
+                yield ctx
+                pool.report()
+            finally:
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    with contextlib.suppress(NotImplementedError, RuntimeError):
+                        loop.remove_signal_handler(sig)
+                ctx.close()
+    finally:
+        budget.close()
+
+
+async def _run_backtest_async(alphas_json_file, concurrency, multi_size=None, alpha_range=None, profile=None):
+    async with evaluation_context(concurrency, multi_size, profile) as ctx:
+        out_csv = await ctx.run_file(alphas_json_file, alpha_range)
+    if ctx.draining:
+        # 交给调用方结束循环
+        raise KeyboardInterrupt
+    return out_csv
+
+
+def run_backtest_async_by_wq_api(alphas_json_file, concurrency=15, multi_size=None, alpha_range=None, profile=None):
+    """
+    异步滑动窗口回测指定 alphas json 文件，每个账号始终保持 concurrency 个 simulation 在途
+    （config.yaml 中为账号单独配置的 concurrency 优先）；
+    multi_size 为每个 multi-simulation 打包的 alpha 数，默认取 config.yaml 的 wq_multi_simulation_size；
+    alpha_range=(start, stop) 时只回测文件中该段 alpha；profile 为 settings 配置档，默认取 settings_profile
+    """
+    return asyncio.run(_run_backtest_async(alphas_json_file, concurrency, multi_size, alpha_range, profile))
+
+
+async def _keep_lease(queue, lease):
+    """持有租约期间每 ttl/3 续约；续约失败说明租约已被接管，只告警不中断当前回测"""
+    while True:
+        await asyncio.sleep(queue.ttl / 3)
+        if not await asyncio.to_thread(queue.renew, lease):
+            print(f"⚠️ 租约续约失败（已过期被接管）: {lease.file} [{lease.start}, {lease.stop})")
+            return
+
+
+async def _run_lease(ctx, queue, lease, produced):
+    """回测一个工作项；返回 True 表示整段都已处理（未被 drain 打断）"""
+    heartbeat = asyncio.create_task(_keep_lease(queue, lease))
+    try:
+        await ctx.run_file(lease.file, (lease.start, lease.stop), produced, lease.byte_offset)
+    finally:
+        heartbeat.cancel()
+    return not ctx.draining
+
+
+def _settle(queue, task, lease):
+    """工作项结束：完成、出错（多次出错后标记 FAILED）或被 drain 打断时交还租约"""
+    error = task.exception()
+    if error is not None:
+        print(f"❌ 工作项出错 {lease.file} [{lease.start}, {lease.stop}): {error!r}")
+        queue.release(lease, repr(error))
+    elif not task.result():
+        queue.release(lease)
+    elif not queue.complete(lease):
+        print(f"⚠️ 租约已被接管，工作项 {lease.id} 未标记完成: {lease.file} [{lease.start}, {lease.stop})")
+
+
+async def _run_worker_async(queue, concurrency, multi_size=None, profile=None, chooser=None, worker_id=None):
+    async with evaluation_context(concurrency, multi_size, profile) as ctx:
+        running = {}  # 回测任务 -> 租约
+        try:
+            while not ctx.draining:
+                lease = await asyncio.to_thread(queue.lease, worker_id, None, chooser)
+                if lease is None:
+                    if running:
+                        # 等本进程的工作项结束（期间其他进程可能入队或释放了工作项）
+                        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    else:
+                        expires = await asyncio.to_thread(queue.next_expiry)
+                        if expires is None:
+                            break
+                        # 其他进程仍持有租约：等待过期后接管
+                        await asyncio.sleep(min(max(expires - time.time(), 0.1), queue.ttl / 3))
+                        done = set()
+                else:
+                    # 当前工作项的 alpha 全部进入窗口后立即领取下一个，上一个的在途 simulation 与下一个并行，
+                    # 窗口不会在工作项边界排空
+                    produced = asyncio.Event()
+                    task = asyncio.create_task(_run_lease(ctx, queue, lease, produced))
+                    running[task] = lease
+                    waiter = asyncio.create_task(produced.wait())
+                    await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                    waiter.cancel()
+                    done = {t for t in running if t.done()}
+                for t in done:
+                    _settle(queue, t, running.pop(t))
+            if running:
+                await asyncio.wait(running)
+        finally:
+            for t, lease in running.items():
+                if t.done():
+                    _settle(queue, t, lease)
+                else:
+                    t.cancel()
+                    queue.release(lease)
+    if ctx.draining:
+        raise KeyboardInterrupt
+
+
+def run_backtest_worker(queue, concurrency=15, multi_size=None, profile=None, chooser=None, worker_id=None):
+    """
+    工作队列模式：持续从 queue（work_queue.WorkQueue）领取工作项并回测，直到所有工作项都已结束。
+    整个进程只有一个事件循环与一个会话池，相邻工作项在同一个滑动窗口中衔接；
+    chooser 为模板选择函数（template_bandit），出错的工作项交还队列，多次出错后标记为 FAILED
+    """
+    return asyncio.run(_run_worker_async(queue, concurrency, multi_size, profile, chooser, worker_id))
+
+
+if __name__ == "__main__":
+    test_file = BASE_DIR / "data" / "alpha_db" / "all_alphas" / "your_template_alphas.json"
+    run_backtest_async_by_wq_api(test_file)
@@ -1,33 +1,38 @@
 # backtest_with_wq.py
-import json
 import csv
 import logging
+from collections import deque
 from pathlib import Path
 from time import sleep
-import requests
-from openai import OpenAI
-from requests.auth import HTTPBasicAuth
 
-from evaluator.construct_prompts import build_fix_fast_expression_prompt
+from evaluator.alpha_archive import AlphaArchive, AlphaFetcher
+from evaluator.expr_repair import RepairPool, append_override, apply_overrides
+from evaluator.result_store import INVALID, ResultStore, ResultWriter
+from evaluator.sim_settings import get_settings, run_name
+from evaluator.sim_journal import SimJournal, LOST
+from utils.alpha_file import count_alphas, iter_alphas
 from utils.config_loader import ConfigLoader
+from utils.fast_expr import canonical_hash
+from utils.fast_expr_validator import load_validator
+from utils.negative_cache import NegativeCache
+from utils.rate_limiter import get_limiter
+from utils.wq_client import WQSession
 
 BASE_DIR = Path(__file__).resolve().parents[1]
-BACKTEST_DIR = BASE_DIR / "data" / "alpha_db_v2" / "backtest_result"
+BACKTEST_DIR = Path(ConfigLoader.get("backtest_result_dir") or BASE_DIR / "data" / "alpha_db_v2" / "backtest_result")
 BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
 
+WQ_API_BASE = ConfigLoader.get("worldquant_api_base")
+SUBMIT_ATTEMPTS = 5  # 网络异常 / 未返回 Location 时的最大提交次数（限流不计入）
+
 logging.basicConfig(filename='backtest_with_wq.log', level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
 def sign_in():
-    """登录 WQ Brain 并返回 session"""
-    username = ConfigLoader.get('worldquant_account')
-    password = ConfigLoader.get('worldquant_password')
-
-    sess = requests.Session()
-    sess.auth = HTTPBasicAuth(username, password)
-    resp = sess.post(ConfigLoader.get('worldquant_api_auth'))
-    print(f"Login status: {resp.status_code}")
+    """登录 WQ Brain 并返回 session（请求带默认超时，会话过期时自动重新登录）"""
+    sess = WQSession()
+    sess.sign_in()
     return sess
 
 
@@ -35,30 +40,26 @@ def run_backtest_mul_by_wq_api(alphas_json_file, batch_size=15):
     """批量回测指定 alphas json 文件，采用等待队列方式提升效率"""
     sess = sign_in()
 
-    # === 1. 读 alpha JSON ===
-    with open(alphas_json_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
+    # === 1. 读 alpha 文件（逐行惰性读取） ===
     print(f"🔬 Start backtest for {alphas_json_file}")
-    if "GeneratedAlphas" in data:
-        alphas = [item["alpha"] for item in data["GeneratedAlphas"]]
-    elif isinstance(data, list):
-        alphas = [item["alpha"] for item in data]
-    else:
+    n_alphas = count_alphas(alphas_json_file)
+    if n_alphas is None:
         print("❌ 不识别的 alpha JSON 格式")
         return None
+    alphas = iter_alphas(alphas_json_file)
 
     template_name = Path(alphas_json_file).stem
-    out_csv = BACKTEST_DIR / f"{template_name}_backtest.csv"
-
-    # === 2. 已有结果，跳过 ===
-    finished_alphas = set()
-    if out_csv.exists():
-        with open(out_csv, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                finished_alphas.add(row["alpha"])
-        print(f"⚠️ 已有 {len(finished_alphas)} 条回测结果，将跳过这些 alpha")
+    # settings 取 config.yaml 的 settings_profile；非 default 配置档的结果写入 "<模板>__<配置档>_backtest.csv"
+    settings = get_settings()
+    out_csv = BACKTEST_DIR / f"{run_name(template_name)}_backtest.csv"
+    # 之前 LLM 修复过的表达式以 alpha_overrides.jsonl 中的版本为准
+    alphas = apply_overrides(alphas, template_name)
+
+    # === 2. 已有结果，跳过：只查全局结果库，结果库出现之前的旧 CSV 只导入一次 ===
+    store = ResultStore()
+    imported = store.import_csv(out_csv, template_name, settings)
+    if imported:
+        print(f"📥 已从 {out_csv.name} 导入 {imported} 条旧回测结果")
 
     # === 3. 准备写入 ===
     fieldnames = ["alpha", "sharpe", "turnover", "fitness", "returns", "drawdown", "margin"]
@@ -71,80 +72,169 @@ def run_backtest_mul_by_wq_api(alphas_json_file, batch_size=15):
     def make_payload(expr):
         return {
             "type": "REGULAR",
-            "settings": {
-                "instrumentType": "EQUITY",
-                "region": "USA",
-                "universe": "TOP3000",
-                "delay": 1,
-                "decay": 0,
-                "neutralization": "SUBINDUSTRY",
-                "truncation": 0.01,
-                "pasteurization": "ON",
-                "unitHandling": "VERIFY",
-                "nanHandling": "OFF",
-                "language": "FASTEXPR",
-                "visualization": False,
-            },
+            "settings": settings,
             "regular": expr
         }
 
+    # 结果同时写入模板 CSV 与全局结果库（跨模板去重）
+    writer = ResultWriter(writer, csv_file, store, template_name, settings)
+
     # === 5. 提交 & 管理 pending 队列 ===
     pending = {}  # sim_id -> {"alpha": expr, "progress_url": url}
-    retry_queue = []
-
-    for i, alpha_expr in enumerate(alphas, 1):
-        if alpha_expr in finished_alphas:
+    limiter = get_limiter()
+
+    # 恢复上次被中断时仍在途的 simulation，继续轮询而不是重新提交
+    journal = SimJournal()
+    negative_cache = NegativeCache()
+    repair_pool = RepairPool.from_config()
+    fetcher = AlphaFetcher.from_config(sess)
+    archive = AlphaArchive()
+    for alpha_expr, sim_url in journal.outstanding(run_name(template_name), multi=False):
+        if store.is_finished(alpha_expr, settings):
+            journal.mark_finished(sim_url)
             continue
-
-        # 提交 alpha
-        try:
-            resp = sess.post("https://api.worldquantbrain.com/simulations", json=make_payload(alpha_expr))
-            if resp.status_code not in (200, 201):
-                if "SIMULATION_LIMIT_EXCEEDED" in resp.text:
-                    retry_queue.append(alpha_expr)
+        sim_id = sim_url.split("/")[-1]
+        pending[sim_id] = {"alpha": alpha_expr, "progress_url": sim_url, "first_time": True}
+    resumed_alphas = set(info["alpha"] for info in pending.values())
+    seen_hashes = set(canonical_hash(expr) for expr in resumed_alphas)
+    validator = load_validator()
+    if pending:
+        print(f"♻️ 从 journal 恢复 {len(pending)} 个在途 simulation")
+        monitor_pending(sess, pending, writer, alphas_json_file, journal, negative_cache, settings,
+                        repair_pool, fetcher, archive)
+
+    def fresh():
+        """边读 alpha 文件边校验、去重，产生 (序号, 表达式, 已失败次数)"""
+        for i, alpha_expr in enumerate(alphas, 1):
+            if alpha_expr in resumed_alphas:
+                continue
+            # 本地静态校验：无效表达式不提交，可修复的表达式以修复后的形式提交
+            if validator:
+                check = validator.validate(alpha_expr)
+                if not check.ok:
+                    print(f"🚫 本地校验未通过: {alpha_expr[:60]}... {'; '.join(check.errors)}")
+                    if store.get(alpha_expr, settings) is None:
+                        writer.writerow({"alpha": alpha_expr, "margin": INVALID})
                     continue
-                print(f"❌ 提交失败: {resp.status_code}, {resp.text}")
+                alpha_expr = check.fixed_expr
+
+            # 语义等价的表达式只回测一次
+            h = canonical_hash(alpha_expr)
+            if h in seen_hashes or store.is_finished(alpha_expr, settings):
                 continue
+            seen_hashes.add(h)
+            yield i, alpha_expr, 0
+
+    # 待提交：被限流的 alpha 放回 retry 队首，优先于文件中的新 alpha 重新提交
+    todo = fresh()
+    retry = deque()
+    while True:
+        item = retry.popleft() if retry else next(todo, None)
+        if item is None:
+            break
+        i, alpha_expr, attempts = item
+        # 包含已从 ERROR 中学到的无效字段 / 运算符组合：不提交
+        pattern = negative_cache.match(alpha_expr, settings)
+        if pattern:
+            print(f"🚫 跳过已知无效模式 {pattern}: {alpha_expr[:60]}...")
+            writer.writerow({"alpha": alpha_expr, "margin": f"FAILED:BLOCKED:{pattern}"})
+            continue
+        limiter.wait()
+        try:
+            resp = sess.post(f"{WQ_API_BASE}/simulations", json=make_payload(alpha_expr))
+        except Exception as e:
+            logging.error(f"提交 {alpha_expr} 出错: {e}")
+            if attempts + 1 < SUBMIT_ATTEMPTS:
+                retry.appendleft((i, alpha_expr, attempts + 1))
+            sleep(limiter.on_error())
+            continue
 
-            sim_url = resp.headers.get("Location")
-            if not sim_url:
-                retry_queue.append(alpha_expr)
+        delay = limiter.on_response(resp.status_code, resp.headers, resp.text)
+        if resp.status_code not in (200, 201):
+            if delay > 0:
+                # 限流 / 并发上限：放回队首；槽位已满时先等当前批次跑完
+                retry.appendleft((i, alpha_expr, attempts))
+                if "SIMULATION_LIMIT_EXCEEDED" in resp.text and pending:
+                    monitor_pending(sess, pending, writer, alphas_json_file, journal, negative_cache, settings,
+                                    repair_pool, fetcher, archive)
+                else:
+                    sleep(delay)
                 continue
+            print(f"❌ 提交失败: {resp.status_code}, {resp.text}")
+            continue
 
-            sim_id = sim_url.split("/")[-1]
-            pending[sim_id] = {"alpha": alpha_expr, "progress_url": sim_url, "first_time": True}
+        sim_url = resp.headers.get("Location")
+        if not sim_url:
+            if attempts + 1 < SUBMIT_ATTEMPTS:
+                retry.appendleft((i, alpha_expr, attempts + 1))
+            continue
 
-            print(f"📩 提交成功: {i}/{len(alphas)} -> {alpha_expr[:50]}...")
+        sim_id = sim_url.split("/")[-1]
+        pending[sim_id] = {"alpha": alpha_expr, "progress_url": sim_url, "first_time": True}
+        journal.record_submitted(run_name(template_name), alpha_expr, sim_url)
 
-            # 控制批量大小
-            if len(pending) >= batch_size:
-                monitor_pending(sess, pending, writer, alphas_json_file)
-        except Exception as e:
-            logging.error(f"提交 {alpha_expr} 出错: {e}")
-            retry_queue.append(alpha_expr)
+        print(f"📩 提交成功: {i}/{n_alphas} -> {alpha_expr[:50]}...")
+
+        # 控制批量大小
+        if len(pending) >= batch_size:
+            monitor_pending(sess, pending, writer, alphas_json_file, journal, negative_cache, settings,
+                            repair_pool, fetcher, archive)
 
     # 处理剩余的
     if pending:
-        monitor_pending(sess, pending, writer, alphas_json_file)
+        monitor_pending(sess, pending, writer, alphas_json_file, journal, negative_cache, settings,
+                        repair_pool, fetcher, archive)
 
+    # 先写出归档：其回调还要写 CSV、结果库与 journal
+    archive.close()
     csv_file.close()
+    journal.close()
+    negative_cache.close()
+    if repair_pool is not None:
+        repair_pool.close()
+    fetcher.close()
+    store.close()
     print(f"🎯 回测完成，结果已保存 {out_csv}")
     return str(out_csv)
 
 
-def monitor_pending(sess, pending, writer, alphas_json_file):
-    """监控 pending 队列直到全部完成"""
-    client = OpenAI(
-        base_url=ConfigLoader.get("openai_base_url"),
-        api_key=ConfigLoader.get("openai_api_key"),
-    )
-
+def monitor_pending(sess, pending, writer, alphas_json_file, journal=None, negative_cache=None, settings=None,
+                    repair_pool=None, fetcher=None, archive=None):
+    """
+    监控 pending 队列直到全部完成；完成的 alpha 交给后台线程读取详情，
+    失败的表达式交给后台修复池，修复完成后重新提交
+    """
+    template_name = Path(alphas_json_file).stem
+    limiter = get_limiter()
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = AlphaFetcher.from_config(sess)
     while pending:
         finished_ids = []
         for sim_id, info in list(pending.items()):
+            if "repair" in info:
+                # 等待后台修复，不再轮询原 simulation
+                if info["repair"].done():
+                    submit_repaired(sess, pending, info, writer, alphas_json_file, journal, settings)
+                    finished_ids.append(sim_id)
+                continue
+            if "fetch" in info:
+                # 等待后台读取 alpha 详情；journal 由 store_result 在结果写出后标记
+                if info["fetch"].done():
+                    pending.pop(sim_id, None)
+                    store_result(info, writer, template_name, settings, archive, journal)
+                continue
             try:
+                limiter.wait()
                 status_resp = sess.get(info["progress_url"])
-                if status_resp.status_code == 429:
+                if limiter.on_response(status_resp.status_code, status_resp.headers) > 0:
+                    continue
+                if status_resp.status_code == 404:
+                    # 从 journal 恢复的 simulation 已在服务器上失效，下次运行时重新提交
+                    print(f"⚠️ simulation 已失效: {info['progress_url']}")
+                    if journal:
+                        journal.mark_finished(info["progress_url"], LOST)
+                    pending.pop(sim_id, None)
                     continue
 
                 status_json = status_resp.json()
@@ -156,35 +246,15 @@ def monitor_pending(sess, pending, writer, alphas_json_file):
                         finished_ids.append(sim_id)
                         continue
 
-                    # 获取结果
-                    alpha_data = None
-                    for _ in range(10):
-                        alpha_resp = sess.get(f"https://api.worldquantbrain.com/alphas/{alpha_id}")
-                        if alpha_resp.status_code == 200:
-                            alpha_data = alpha_resp.json()
-                            break
-                        sleep(3)
-
-                    if not alpha_data:
-                        finished_ids.append(sim_id)
-                        continue
-
-                    is_data = alpha_data.get("is", {})
-                    writer.writerow({
-                        "alpha": info["alpha"],
-                        "sharpe": is_data.get("sharpe"),
-                        "turnover": is_data.get("turnover"),
-                        "fitness": is_data.get("fitness"),
-                        "returns": is_data.get("returns"),
-                        "drawdown": is_data.get("drawdown"),
-                        "margin": is_data.get("margin"),
-                    })
-                    finished_ids.append(sim_id)
-                    print(f"✅ 完成: {info['alpha']}... fitness={is_data.get('fitness')}")
+                    # 获取结果：交给后台线程，不阻塞其他任务的轮询
+                    info["status"] = status
+                    info["fetch"] = fetcher.submit(alpha_id)
 
                 elif status == "ERROR":
-                    if info["first_time"]: # 失败直接退出，修复带来的收益过低，时间损耗过高 TODO
-                        # 二次失败，写入 None
+                    if negative_cache is not None:
+                        negative_cache.learn(info["alpha"], status_json, settings)
+                    if repair_pool is None or not info["first_time"]:
+                        # 未启用修复（默认：修复带来的收益过低，时间损耗过高），或修复后的表达式再次失败
                         writer.writerow({
                             "alpha": info["alpha"],
                             "sharpe": None,
@@ -194,102 +264,13 @@ def monitor_pending(sess, pending, writer, alphas_json_file):
                             "drawdown": None,
                             "margin": f"FAILED:{status}"
                         })
-                        print(f"❌ 二次失败: {info['alpha'][:60]}...")
+                        print(f"❌ {'二次失败' if not info['first_time'] else '模拟失败'}: {info['alpha'][:60]}...")
                         finished_ids.append(sim_id)
                     else:
-                        # === 使用 LLM 修复表达式 ===
-                        print(f"❌ 模拟失败: {info['alpha'][:60]}...")
-                        fix_exp_prompt = build_fix_fast_expression_prompt(info["alpha"], str(status_json))
-                        try:
-                            resp = client.chat.completions.create(
-                                model=ConfigLoader.get("reasoner_model_name"),
-                                messages=[
-                                    {"role": "system", "content": "You are an expert in Fast Expression syntax repair."},
-                                    {"role": "user", "content": fix_exp_prompt}
-                                ],
-                                temperature=0.2,
-                            )
-                            fixed_expr = resp.choices[0].message.content.strip()
-                            print(f"🧩 修复后的表达式: {fixed_expr}")
-
-                            # === 替换 alphas_json_file 文件中的旧 alpha
-                            try:
-                                with open(alphas_json_file, "r", encoding="utf-8") as f:
-                                    text = f.read()
-                                if info["alpha"] not in text:
-                                    print("⚠️ 原始表达式未在文件中找到，跳过替换")
-                                else:
-                                    new_text = text.replace(info["alpha"], fixed_expr, 1)  # 仅替换第一次出现
-                                    with open(alphas_json_file, "w", encoding="utf-8") as f:
-                                        f.write(new_text)
-                                    print(f"💾 已在 {alphas_json_file} 中替换修复后的表达式")
-                            except Exception as e:
-                                print(f"❌ 替换 {alphas_json_file} 中表达式失败: {e}")
-
-                            # === 再次提交修复后的表达式 ===
-                            payload = {
-                                "type": "REGULAR",
-                                "settings": {
-                                    "instrumentType": "EQUITY",
-                                    "region": "ASI",
-                                    "universe": "MINVOL1M",
-                                    "delay": 1,
-                                    "decay": 6,
-                                    "neutralization": "SUBINDUSTRY",
-                                    "truncation": 0.01,
-                                    "pasteurization": "ON",
-                                    "unitHandling": "VERIFY",
-                                    "nanHandling": "ON",
-                                    "maxTrade": "ON",
-                                    "language": "FASTEXPR",
-                                    "visualization": False,
-                                },
-                                "regular": fixed_expr
-                            }
-
-                            new_resp = sess.post("https://api.worldquantbrain.com/simulations", json=payload)
-                            if new_resp.status_code not in (200, 201):
-                                print(f"⚠️ 修复后提交失败 {new_resp.status_code}: {new_resp.text}")
-                                writer.writerow({
-                                    "alpha": info["alpha"],
-                                    "sharpe": None,
-                                    "turnover": None,
-                                    "fitness": None,
-                                    "returns": None,
-                                    "drawdown": None,
-                                    "margin": "FIX_FAIL_SUBMIT"
-                                })
-                                finished_ids.append(sim_id)
-                                continue
-
-                            new_url = new_resp.headers.get("Location")
-                            if not new_url:
-                                print("⚠️ 修复后提交未返回Location，跳过")
-                                finished_ids.append(sim_id)
-                                continue
-
-                            # 替换原 pending 任务为新任务
-                            new_id = new_url.split("/")[-1]
-                            pending[new_id] = {
-                                "alpha": fixed_expr,
-                                "progress_url": new_url,
-                                "first_time": False  # 标记为已修复
-                            }
-                            finished_ids.append(sim_id)
-                            print(f"🔁 已重新提交修复后的表达式 {new_id}")
-
-                        except Exception as e:
-                            logging.error(f"修复表达式失败: {e}")
-                            writer.writerow({
-                                "alpha": info["alpha"],
-                                "sharpe": None,
-                                "turnover": None,
-                                "fitness": None,
-                                "returns": None,
-                                "drawdown": None,
-                                "margin": "FIX_FAIL_LLM"
-                            })
-                            finished_ids.append(sim_id)
+                        # === 交给后台 LLM 修复池，不阻塞其他任务的轮询 ===
+                        print(f"❌ 模拟失败，已提交后台修复: {info['alpha'][:60]}...")
+                        info["error"] = status_json.get("message") or str(status_json)
+                        info["repair"] = repair_pool.submit(info["alpha"], info["error"])
 
                 else:
                     print(f"⏳ {info['alpha'][:40]}... simulation status: {status}")
@@ -298,9 +279,97 @@ def monitor_pending(sess, pending, writer, alphas_json_file):
                 logging.error(f"检查 {sim_id} 出错: {e}")
 
         for fid in finished_ids:
-            pending.pop(fid, None)
+            info = pending.pop(fid, None)
+            if info and journal:
+                journal.mark_finished(info["progress_url"])
 
+        if archive is not None:
+            archive.flush_due()
         sleep(5)
+    if own_fetcher:
+        fetcher.close()
+
+
+def store_result(info, writer, template_name, settings, archive=None, journal=None):
+    """
+    完整详情写入归档，归档写入磁盘后再写 alpha 指标、把 journal 标记为完成；
+    读取失败时不写结果、保留 journal 记录，下次运行时继续读取。返回是否读取成功
+    """
+    try:
+        alpha_data, recordsets = info["fetch"].result()
+    except Exception as e:
+        logging.error(f"读取 alpha 详情出错: {e!r}")
+        alpha_data, recordsets = None, {}
+    if not alpha_data:
+        print(f"⚠️ 未能读取 alpha 结果，下次运行时重试: {info['alpha'][:60]}...")
+        return False
+    is_data = alpha_data.get("is", {})
+
+    def finish():
+        writer.writerow({
+            "alpha": info["alpha"],
+            "sharpe": is_data.get("sharpe"),
+            "turnover": is_data.get("turnover"),
+            "fitness": is_data.get("fitness"),
+            "returns": is_data.get("returns"),
+            "drawdown": is_data.get("drawdown"),
+            "margin": is_data.get("margin"),
+        })
+        if journal:
+            journal.mark_finished(info["progress_url"])
+        print(f"✅ 完成: {info['alpha']}... fitness={is_data.get('fitness')}")
+
+    if archive is None:
+        finish()
+    else:
+        archive.add(template_name, info["alpha"], alpha_data, recordsets, settings, info.get("status"),
+                    on_written=finish)
+    return True
+
+
+def submit_repaired(sess, pending, info, writer, alphas_json_file, journal=None, settings=None):
+    """后台修复完成后：追加覆盖记录，重新提交修复后的表达式并替换 pending 中的原任务"""
+    template_name = Path(alphas_json_file).stem
+    fixed_expr = info["repair"].result()
+    failed_row = {"alpha": info["alpha"], "sharpe": None, "turnover": None, "fitness": None,
+                  "returns": None, "drawdown": None}
+    if not fixed_expr:
+        print(f"⚠️ LLM 修复失败: {info['alpha'][:60]}...")
+        writer.writerow(dict(failed_row, margin="FIX_FAIL_LLM"))
+        return
+    print(f"🧩 修复后的表达式: {fixed_expr}")
+    append_override(template_name, info["alpha"], fixed_expr, info.get("error"))
+
+    limiter = get_limiter()
+    limiter.wait()
+    try:
+        new_resp = sess.post(f"{WQ_API_BASE}/simulations",
+                             json={"type": "REGULAR", "settings": settings, "regular": fixed_expr})
+    except Exception as e:
+        logging.error(f"提交修复后的表达式出错: {e}")
+        writer.writerow(dict(failed_row, margin="FIX_FAIL_SUBMIT"))
+        return
+    limiter.on_response(new_resp.status_code, new_resp.headers, new_resp.text)
+    if new_resp.status_code not in (200, 201):
+        print(f"⚠️ 修复后提交失败 {new_resp.status_code}: {new_resp.text}")
+        writer.writerow(dict(failed_row, margin="FIX_FAIL_SUBMIT"))
+        return
+
+    new_url = new_resp.headers.get("Location")
+    if not new_url:
+        print("⚠️ 修复后提交未返回Location，跳过")
+        return
+
+    # 替换原 pending 任务为新任务
+    new_id = new_url.split("/")[-1]
+    pending[new_id] = {
+        "alpha": fixed_expr,
+        "progress_url": new_url,
+        "first_time": False  # 标记为已修复
+    }
+    if journal:
+        journal.record_submitted(run_name(template_name), fixed_expr, new_url)
+    print(f"🔁 已重新提交修复后的表达式 {new_id}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+# bench_evaluator.py
+"""
+离线评估器压测：启动 mock_wq_server，让评估器在子进程中对它回测一批合成 alpha，
+最后根据服务端记录报告 alphas/hour、slot 利用率、time-to-result p50/p99 以及每个结果消耗的请求数。
+
+    python -m evaluator.bench_evaluator --alphas 60 --evaluator async --latency-mean 10
+
+子进程在临时目录中运行，WORLDQUANT_API_BASE / WORLDQUAN_API_AUTH 指向 mock 服务，
+BACKTEST_RESULT_DIR 指向临时目录，因此不会写入真实的结果库、journal 或回测 CSV。
+--multi-size N 通过 WQ_MULTI_SIMULATION_SIZE 让评估器每 N 个 alpha 打包成一个 multi-simulation；
+--accounts N 通过 WORLDQUANT_ACCOUNTS 让异步评估器使用 N 个账号（mock 按账号分别限制并发）。
+--format json 生成旧的整体 JSON alpha 文件（默认 jsonl），用于对比首次提交的延迟。
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from evaluator.mock_wq_server import PV_FIELDS, MockBrainServer, add_config_arguments, config_from_args
+from utils.alpha_file import AlphaFileWriter, is_jsonl
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+EVALUATORS = {
+    "async": "from evaluator.backtest_with_wq_async import run_backtest_async_by_wq_api as run; "
+             "run({file!r}, concurrency={concurrency})",
+    "mul": "from evaluator.backtest_with_wq_mul import run_backtest_mul_by_wq_api as run; "
+           "run({file!r}, batch_size={concurrency})",
+    "single": "from evaluator.backtest_with_wq import run_backtest_by_wq_api as run; run({file!r})",
+}
+
+
+def make_alphas_file(path, n_alphas):
+    """生成 n 个互不等价的合成 alpha（字段、窗口与常数不同），.jsonl 与 generate_alpha 的输出一致，.json 为旧格式"""
+    header = {"Template": "rank(ts_mean(<field/>, <d/>)) * <k/>"}
+
+    def alphas():
+        for i in range(n_alphas):
+            field = PV_FIELDS[i % len(PV_FIELDS)]
+            yield {"alpha": f"rank(ts_mean({field}, {5 + i % 40})) * {i + 1}", "fields_or_ops_used": [field]}
+
+    if is_jsonl(path):
+        with AlphaFileWriter(path, header) as writer:
+            for item in alphas():
+                writer.write(item)
+        return path
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**header, "GeneratedAlphas": list(alphas())}, f, indent=2)
+    return path
+
+
+def run_benchmark(n_alphas=60, evaluator="async", concurrency=10, timeout=3600, verbose=False, multi_size=0,
+                  accounts=1, file_format="jsonl", **server_config):
+    workdir = Path(tempfile.mkdtemp(prefix="wq_bench_"))
+    server_config.setdefault("concurrency_limit", concurrency)
+    try:
+        alphas_file = make_alphas_file(workdir / f"bench_alphas.{file_format}", n_alphas)
+        shutil.copy(BASE_DIR / "config.yaml", workdir / "config.yaml")
+        with MockBrainServer(**server_config) as server:
+            env = dict(os.environ,
+                       PYTHONPATH=str(BASE_DIR),
+                       WORLDQUANT_API_BASE=server.base_url,
+                       WORLDQUAN_API_AUTH=f"{server.base_url}/authentication",
+                       WORLDQUANT_ACCOUNT="bench",
+                       WORLDQUANT_PASSWORD="bench",
+                       BACKTEST_RESULT_DIR=str(workdir / "backtest_result"),
+                       WQ_MULTI_SIMULATION_SIZE=str(multi_size),
+                       WORLDQUANT_ACCOUNTS=",".join(f"bench{i}:bench" for i in range(accounts)))
+            code = EVALUATORS[evaluator].format(file=str(alphas_file), concurrency=concurrency)
+            print(f"🚀 {evaluator} evaluator: {n_alphas} alphas against {server.base_url} "
+                  f"(limit={server.brain.config['concurrency_limit']}, latency={server.brain.config['latency_mean']}s)")
+            start = time.time()
+            proc = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, timeout=timeout,
+                                  stdout=None if verbose else subprocess.DEVNULL,
+                                  stderr=None if verbose else subprocess.PIPE, text=True)
+            elapsed = time.time() - start
+            if proc.returncode != 0:
+                print(f"❌ Evaluator exited with {proc.returncode}\n{proc.stderr or ''}")
+            report = server.brain.stats()
+        report["evaluator"] = evaluator
+        report["returncode"] = proc.returncode
+        report["process_seconds"] = round(elapsed, 2)
+        if report.get("first_submitted_at"):
+            # 包含子进程启动与 import 的时间
+            report["first_submission_seconds"] = round(report["first_submitted_at"] - start, 3)
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(report):
+    if not report.get("simulations"):
+        print("⚠️ No simulations were submitted")
+        return
+    print(f"📊 {report['evaluator']}: {report['results']}/{report['simulations']} results "
+          f"in {report['wall_seconds']}s (process {report['process_seconds']}s)")
+    print(f"   alphas/hour        {report['alphas_per_hour']}")
+    if report.get("first_submission_seconds") is not None:
+        print(f"   first submission   {report['first_submission_seconds']:.2f}s after start")
+    if report.get("multi_simulations"):
+        print(f"   multi-simulations  {report['multi_simulations']}")
+    print(f"   slot utilisation   {report['slot_utilisation']:.1%}")
+    print(f"   time-to-result     p50={report['ttr_p50']:.1f}s  p99={report['ttr_p99']:.1f}s")
+    print(f"   detection lag p50  {report['detect_lag_p50']:.1f}s")
+    if report.get("errors"):
+        print(f"   errors             {report['errors']}")
+    print(f"   requests           {report['requests']} ({report['requests_per_result']}/result, "
+          f"{report['throttled']} throttled)")
+    for key, n in report["by_endpoint"].items():
+        print(f"     {key:<32}{n:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark an evaluator against the mock WQ Brain server")
+    parser.add_argument("--alphas", type=int, default=60)
+    parser.add_argument("--evaluator", choices=sorted(EVALUATORS), default="async")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--multi-size", type=int, default=0, help="alphas packed per multi-simulation (async only)")
+    parser.add_argument("--accounts", type=int, default=1, help="number of mock accounts (async only)")
+    parser.add_argument("--format", choices=["jsonl", "json"], default="jsonl", help="alpha file format")
+    parser.add_argument("--verbose", action="store_true", help="show the evaluator's own output")
+    parser.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    report = run_benchmark(args.alphas, args.evaluator, args.concurrency, verbose=args.verbose,
+                           multi_size=args.multi_size, accounts=args.accounts, file_format=args.format,
+                           **config_from_args(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    print_report(report)
@@ -0,0 +1,112 @@
+# bench_ts_kernels.py
+"""
+ts_kernels 与朴素 pandas rolling 实现的速度 / 结果对比。
+
+    python -m evaluator.bench_ts_kernels
+
+pandas 没有内置实现的运算（ts_rank / ts_decay_linear / ts_arg_max）使用 rolling.apply，
+只在 APPLY_COLS 列上计时并按列数线性外推，否则单次运行需要数分钟。
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from evaluator import ts_kernels
+
+APPLY_COLS = 20
+
+
+def _timeit(fn, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _mask_head(a, d):
+    a = np.array(a, dtype=float)
+    a[:d - 1] = np.nan
+    return a
+
+
+def _decay_weights(w):
+    weights = np.arange(1, len(w) + 1, dtype=float)
+    valid = ~np.isnan(w)
+    return np.nansum(w * weights) / weights[valid].sum() if valid.any() else np.nan
+
+
+def _rank_last(w):
+    valid = w[~np.isnan(w)]
+    if np.isnan(w[-1]) or len(valid) < 2:
+        return np.nan
+    return (valid < w[-1]).sum() / (len(valid) - 1)
+
+
+def _arg_max(w):
+    if np.all(np.isnan(w)):
+        return np.nan
+    return float(np.nanargmax(w[::-1]))
+
+
+def pandas_baselines(df, other, d):
+    """返回 {op: (callable, 是否为 apply 实现)}"""
+    roll = df.rolling(d, min_periods=1)
+    return {
+        "ts_mean": (lambda: _mask_head(roll.mean(), d), False),
+        "ts_sum": (lambda: _mask_head(roll.sum(), d), False),
+        "ts_std_dev": (lambda: _mask_head(roll.std(ddof=0), d), False),
+        "ts_max": (lambda: _mask_head(roll.max(), d), False),
+        "ts_min": (lambda: _mask_head(roll.min(), d), False),
+        "ts_corr": (lambda: _mask_head(df.rolling(d, min_periods=2).corr(other), d), False),
+        "ts_decay_linear": (lambda: _mask_head(
+            df.iloc[:, :APPLY_COLS].rolling(d, min_periods=1).apply(_decay_weights, raw=True), d), True),
+        "ts_rank": (lambda: _mask_head(
+            df.iloc[:, :APPLY_COLS].rolling(d, min_periods=1).apply(_rank_last, raw=True), d), True),
+        "ts_arg_max": (lambda: _mask_head(
+            df.iloc[:, :APPLY_COLS].rolling(d, min_periods=1).apply(_arg_max, raw=True), d), True),
+    }
+
+
+def kernel_calls(x, y, d):
+    return {
+        "ts_mean": lambda: ts_kernels.ts_mean(x, d),
+        "ts_sum": lambda: ts_kernels.ts_sum(x, d),
+        "ts_std_dev": lambda: ts_kernels.ts_std_dev(x, d),
+        "ts_max": lambda: ts_kernels.ts_max(x, d),
+        "ts_min": lambda: ts_kernels.ts_min(x, d),
+        "ts_corr": lambda: ts_kernels.ts_corr(x, y, d),
+        "ts_decay_linear": lambda: ts_kernels.ts_decay_linear(x, d),
+        "ts_rank": lambda: ts_kernels.ts_rank(x, d),
+        "ts_arg_max": lambda: ts_kernels.ts_arg_max(x, d),
+    }
+
+
+def run_benchmark(T=1260, N=500, windows=(20, 60, 252), seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.normal(size=(T, N)), axis=0)
+    y = x + rng.normal(size=(T, N)) * 5
+    df, other = pd.DataFrame(x), pd.DataFrame(y)
+
+    print(f"📐 T={T}, N={N}")
+    print(f"{'op':<16}{'d':>5}{'kernel ms':>12}{'pandas ms':>12}{'speedup':>10}{'max |diff|':>14}")
+    for d in windows:
+        kernels = kernel_calls(x, y, d)
+        for name, (baseline, is_apply) in pandas_baselines(df, other, d).items():
+            k_time, k_out = _timeit(kernels[name])
+            p_time, p_out = _timeit(baseline, repeat=1)
+            cols = p_out.shape[1]
+            if is_apply:
+                p_time *= N / cols  # 按列数外推
+            diff = np.nanmax(np.abs(k_out[:, :cols] - p_out)) if np.isfinite(p_out).any() else float("nan")
+            mark = "*" if is_apply else " "
+            print(f"{name:<16}{d:>5}{k_time * 1e3:>12.1f}{p_time * 1e3:>11.1f}{mark}"
+                  f"{p_time / k_time:>9.1f}x{diff:>14.2e}")
+    print("* rolling.apply timed on a column subset and extrapolated to N columns")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -18,4 +18,20 @@ def build_fix_fast_expression_prompt(alpha_expression : str, error_mes : str):
         .replace("{{ fast_expression }}", alpha_expression)
         .replace("{{ error_mes }}", error_mes)
     )
-    return prompt_filled
\ No newline at end of file
+    return prompt_filled
+
+
+def build_fix_fast_expression_batch_prompt(items):
+    """items: [(alpha_expression, error_mes), ...]，要求模型按顺序返回修复后表达式的 JSON 数组"""
+    with open(PROMPT_FILE, "r", encoding="utf-8") as f:
+        prompt_yaml = yaml.safe_load(f)
+    template_str = prompt_yaml.get("fix_fast_expression_batch", "")
+    if not template_str:
+        raise ValueError("fix_fast_expression_batch not found in template_evaluating.yaml")
+
+    cases = "\n\n".join(f"[{i}]\nExpression: {expr}\nError: {error}" for i, (expr, error) in enumerate(items))
+    return (
+        template_str
+        .replace("{{ n }}", str(len(items)))
+        .replace("{{ cases }}", cases)
+    )
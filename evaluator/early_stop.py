@@ -0,0 +1,91 @@
+# early_stop.py
+"""
+模板提前终止规则：一个模板的前 K 个结果已经说明它不可用时，不再把配额花在剩余的展开式上。
+
+- 错误率：至少 min_results 个结果后，失败（ERROR / FAILED / 本地校验不通过）比例 ≥ max_error_rate；
+- fitness 下限：至少 min_results 个完成结果后，平均 fitness ≤ fitness_floor；
+- 逐次减半（可选）：完成数每到一档 min_results·2^k，与同样到达该档的其他模板比较平均 fitness，
+  落在下半区的模板淘汰（至少有 HALVING_MIN_PEERS 个同档模板时才比较）。
+
+触发后模板记入结果库的 retired_templates 表（含原因与统计），评估器停止提交该模板的新 alpha，
+在途 simulation 正常结束；之后领取到该模板的工作项直接跳过。
+
+    python -m evaluator.early_stop                   # 列出已淘汰的模板
+    python -m evaluator.early_stop --revive NAME     # 恢复某个模板
+"""
+import argparse
+import statistics
+
+from evaluator.result_store import ResultStore
+from utils.config_loader import ConfigLoader
+
+CHECK_EVERY = 10          # 每写入多少个结果检查一次
+HALVING_MIN_PEERS = 3
+
+
+class EarlyStopRules:
+    def __init__(self, min_results=50, max_error_rate=0.9, fitness_floor=-0.5, halving=False):
+        self.min_results = min_results
+        self.max_error_rate = max_error_rate
+        self.fitness_floor = fitness_floor
+        self.halving = halving
+
+    @classmethod
+    def from_config(cls):
+        return cls(ConfigLoader.get("early_stop_min_results", 50),
+                   ConfigLoader.get("early_stop_max_error_rate", 0.9),
+                   ConfigLoader.get("early_stop_fitness_floor", -0.5),
+                   ConfigLoader.get("early_stop_halving", False))
+
+    @property
+    def enabled(self):
+        return self.min_results > 0
+
+    def _halving_reason(self, store, template, summary):
+        rung = self.min_results
+        while rung * 2 <= summary["completed"]:
+            rung *= 2
+        means = store.mean_fitness_by_template(rung)
+        if template not in means or len(means) - 1 < HALVING_MIN_PEERS:
+            return None
+        median = statistics.median(means.values())
+        if means[template] < median:
+            return (f"sequential halving: mean fitness {means[template]:.3f} below median {median:.3f} "
+                    f"of {len(means)} templates at {rung} results")
+        return None
+
+    def evaluate(self, store, template):
+        """按规则检查模板，返回 (淘汰原因或 None, 统计)"""
+        summary = store.template_summary(template)
+        if not self.enabled or summary["n"] < self.min_results:
+            return None, summary
+        error_rate = summary["errors"] / summary["n"]
+        if error_rate >= self.max_error_rate:
+            return f"error rate {error_rate:.0%} after {summary['n']} results", summary
+        if summary["completed"] >= self.min_results:
+            if summary["mean_fitness"] <= self.fitness_floor:
+                return (f"mean fitness {summary['mean_fitness']:.3f} <= {self.fitness_floor} "
+                        f"after {summary['completed']} results"), summary
+            if self.halving:
+                return self._halving_reason(store, template, summary), summary
+        return None, summary
+
+    def check(self, store, template):
+        """触发规则时把模板记为淘汰并返回原因，否则返回 None"""
+        reason, summary = self.evaluate(store, template)
+        if reason:
+            store.retire(template, reason, summary)
+            print(f"⛔ Template {template} retired: {reason}")
+        return reason
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or revive templates retired by early-stop rules")
+    parser.add_argument("--revive", metavar="TEMPLATE")
+    args = parser.parse_args()
+    store = ResultStore()
+    if args.revive:
+        print(f"♻️ {args.revive} revived" if store.unretire(args.revive) else f"⚠️ {args.revive} is not retired")
+    for name, why in store.retired_templates().items():
+        print(f"   ⛔ {name}: {why}")
+    store.close()
@@ -0,0 +1,234 @@
+# expr_repair.py
+"""
+后台 LLM 表达式修复。
+
+- RepairPool 在后台线程中调用 reasoner 模型，submit() 立即返回 Future，轮询循环不再被慢速的修复请求阻塞；
+- 等待中的修复请求按 batch_size 合并成一个批量 prompt（最多等 batch_wait 秒凑批），批量结果无法解析时逐个修复；
+- (表达式, 错误信息) → 修复结果缓存在 SQLite（backtest_result/repair_cache.db），同样的错误不会再次调用 LLM；
+- 修复结果追加写入 alpha_overrides.jsonl，评估器读取 alpha 文件时用 apply_overrides() 替换，
+  不再整体重写源 JSON 文件。
+
+    llm_repair_workers: 2        # LLM_REPAIR_WORKERS，0 表示不修复（失败直接记为 FAILED）
+    llm_repair_batch_size: 8     # LLM_REPAIR_BATCH_SIZE
+"""
+import hashlib
+import json
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+
+from evaluator.construct_prompts import build_fix_fast_expression_batch_prompt, build_fix_fast_expression_prompt
+from utils.config_loader import ConfigLoader
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BACKTEST_DIR = Path(ConfigLoader.get("backtest_result_dir") or BASE_DIR / "data" / "alpha_db_v2" / "backtest_result")
+BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+REPAIR_CACHE_DB = BACKTEST_DIR / "repair_cache.db"
+ALPHA_OVERRIDES = BACKTEST_DIR / "alpha_overrides.jsonl"
+
+BATCH_WAIT = 2.0
+SYSTEM_PROMPT = "You are an expert in Fast Expression syntax repair."
+
+_overrides_lock = Lock()
+
+
+# =========================
+# 覆盖文件
+# =========================
+def append_override(template, alpha, fixed, error=None, path=ALPHA_OVERRIDES):
+    """追加一条修复记录（只追加，不改写源 alpha 文件）"""
+    line = json.dumps({"template": template, "alpha": alpha, "fixed": fixed, "error": error, "ts": time.time()},
+                      ensure_ascii=False)
+    with _overrides_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def load_overrides(template=None, path=ALPHA_OVERRIDES):
+    """读取覆盖记录，返回 {原表达式: 修复后的表达式}；同一表达式以最后一条为准"""
+    overrides = {}
+    if not Path(path).exists():
+        return overrides
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 写入中途被中断的最后一行
+            if template is None or item.get("template") == template:
+                overrides[item["alpha"]] = item["fixed"]
+    return overrides
+
+
+def apply_overrides(alphas, template, path=ALPHA_OVERRIDES):
+    """用覆盖记录替换 alpha 序列中已修复的表达式（惰性替换，alphas 可以是逐行读取的生成器）"""
+    overrides = load_overrides(template, path)
+    if not overrides:
+        return alphas
+    print(f"🧩 {Path(path).name} 中有 {len(overrides)} 条修复记录，已修复的 alpha 使用修复版本")
+    return (overrides.get(expr, expr) for expr in alphas)
+
+
+def _clean(text):
+    """去掉模型输出中的代码块标记与首尾空白"""
+    text = re.sub(r"^```[a-zA-Z]*\s*|\s*```$", "", (text or "").strip())
+    return text.strip()
+
+
+# =========================
+# 缓存
+# =========================
+class RepairCache:
+    def __init__(self, db_path=REPAIR_CACHE_DB):
+        self._lock = Lock()
+        self.conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS repairs (
+                key        TEXT PRIMARY KEY,
+                alpha      TEXT,
+                error      TEXT,
+                fixed      TEXT,
+                created_at REAL
+            )
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def key(expr, error):
+        return hashlib.sha1(f"{expr}\n{error}".encode("utf-8")).hexdigest()
+
+    def get(self, expr, error):
+        """命中返回 (True, 修复结果或 None)，未命中返回 (False, None)"""
+        with self._lock:
+            row = self.conn.execute("SELECT fixed FROM repairs WHERE key = ?", (self.key(expr, error),)).fetchone()
+        return (True, row[0]) if row else (False, None)
+
+    def put(self, expr, error, fixed):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO repairs VALUES (?, ?, ?, ?, ?)",
+                              (self.key(expr, error), expr, error, fixed, time.time()))
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# =========================
+# 后台修复池
+# =========================
+class RepairPool:
+    def __init__(self, workers=2, batch_size=8, batch_wait=BATCH_WAIT, cache=None, client=None):
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.cache = cache or RepairCache()
+        self._client = client
+        self._queue = queue.Queue()
+        self._inflight = {}
+        self._lock = Lock()
+        self.stats = {"requests": 0, "cache_hits": 0, "llm_calls": 0, "repaired": 0, "failed": 0}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="repair")
+        self._batcher = threading.Thread(target=self._collect, daemon=True)
+        self._batcher.start()
+
+    @classmethod
+    def from_config(cls):
+        """llm_repair_workers 为 0（默认）时返回 None：失败直接记录，不花 LLM 调用和第二次 simulation 修复"""
+        workers = ConfigLoader.get("llm_repair_workers", 0)
+        if not workers:
+            return None
+        return cls(workers, ConfigLoader.get("llm_repair_batch_size", 8))
+
+    @property
+    def client(self):
+        # 所有修复请求共用一个客户端
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(base_url=ConfigLoader.get("openai_base_url"),
+                                  api_key=ConfigLoader.get("openai_api_key"))
+        return self._client
+
+    def submit(self, expr, error):
+        """提交修复请求，返回 Future，结果为修复后的表达式（修复失败为 None）"""
+        self.stats["requests"] += 1
+        hit, fixed = self.cache.get(expr, error)
+        if hit:
+            self.stats["cache_hits"] += 1
+            future = Future()
+            future.set_result(fixed)
+            return future
+        key = RepairCache.key(expr, error)
+        with self._lock:
+            # 同一 (表达式, 错误) 的并发请求共享一个 Future
+            if key in self._inflight:
+                return self._inflight[key]
+            future = self._inflight[key] = Future()
+        self._queue.put((expr, error, future))
+        return future
+
+    def _collect(self):
+        """凑批：取到第一个请求后最多再等 batch_wait 秒或凑满 batch_size 个"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._executor.submit(self._repair_batch, batch)
+                    return
+                batch.append(item)
+            self._executor.submit(self._repair_batch, batch)
+
+    def _call(self, prompt):
+        self.stats["llm_calls"] += 1
+        resp = self.client.chat.completions.create(
+            model=ConfigLoader.get("reasoner_model_name"),
+            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+            temperature=0.2,
+        )
+        return resp.choices[0].message.content
+
+    def _repair_batch(self, batch):
+        fixes = None
+        if len(batch) > 1:
+            try:
+                fixes = json.loads(_clean(self._call(build_fix_fast_expression_batch_prompt(
+                    [(expr, error) for expr, error, _ in batch]))))
+                if not isinstance(fixes, list) or len(fixes) != len(batch):
+                    fixes = None
+            except Exception as e:
+                logging.error(f"批量修复失败，改为逐个修复: {e}")
+        for i, (expr, error, future) in enumerate(batch):
+            fixed, answered = None, False
+            try:
+                fixed = _clean(fixes[i] if fixes is not None else
+                               self._call(build_fix_fast_expression_prompt(expr, error)))
+                answered = True
+            except Exception as e:
+                logging.error(f"修复表达式失败: {e}")
+            fixed = fixed if fixed and fixed != expr else None
+            self.stats["repaired" if fixed else "failed"] += 1
+            if answered:
+                # 请求本身出错（网络 / 配额）时不缓存，下次仍会重试
+                self.cache.put(expr, error, fixed)
+            with self._lock:
+                self._inflight.pop(RepairCache.key(expr, error), None)
+            future.set_result(fixed)
+
+    def close(self):
+        self._queue.put(None)
+        self._batcher.join()
+        self._executor.shutdown(wait=True)
+        self.cache.close()
@@ -0,0 +1,216 @@
+# local_batch.py
+"""
+模板展开的批量本地评估：公共子表达式只计算一次。
+
+同一模板展开出的 alpha 只有占位符叶子不同，表达式树的大部分是共享的。
+BatchEvaluator 按块解析表达式，把所有子树合并成一个 DAG（结构相同的子树即同一节点），
+统计每个节点在块内被引用的次数：
+- 被引用不止一次的中间面板放进按字节数限制的 LRU 缓存；
+- 节点的剩余引用数降为 0 时立即释放，缓存里只留下后续还会用到的面板；
+- 跨块仍会被用到的面板由 LRU 保留，超出内存上限时淘汰最久未使用的。
+
+因此评估 N 个展开的代价约等于不同子树的数量，而不是 N 次完整计算。
+含赋值语句（;）的表达式中引用了局部变量的子树不参与缓存。
+"""
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from evaluator.local_engine import LocalEngine
+from utils.fast_expr import FastExprSyntaxError, Node, parse
+
+# 只缓存会产生面板的运算节点；数字 / 字符串 / 字段由数据源或常量直接给出
+CACHEABLE_KINDS = {"call", "binop", "unary", "ternary"}
+
+
+class PanelCache:
+    """按面板字节数限制容量的 LRU 缓存"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        value = self._data[key]
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        size = value.nbytes if isinstance(value, np.ndarray) else 0
+        if size > self.max_bytes:
+            return
+        if key in self._data:
+            self.discard(key)
+        self._data[key] = value
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, old = self._data.popitem(last=False)
+            self.nbytes -= old.nbytes if isinstance(old, np.ndarray) else 0
+            self.evictions += 1
+
+    def discard(self, key):
+        value = self._data.pop(key, None)
+        if value is not None:
+            self.nbytes -= value.nbytes if isinstance(value, np.ndarray) else 0
+
+
+def _subtrees(node: Node):
+    """后序遍历可缓存的子树；seq 中赋值之后的语句可能引用局部变量，跳过"""
+    if node.kind == "seq":
+        if node.args and node.args[0].kind == "assign":
+            yield from _subtrees(node.args[0].args[0])
+        return
+    if node.kind == "assign":
+        return
+    for child in node.args:
+        yield from _subtrees(child)
+    for _, value in node.kwargs:
+        yield from _subtrees(value)
+    if node.kind in CACHEABLE_KINDS:
+        yield node
+
+
+class BatchEvaluator(LocalEngine):
+    """
+    在 LocalEngine 之上增加子表达式 DAG 与 LRU 缓存。
+    max_cache_mb 限制缓存的中间面板总大小；chunk_size 为一次构建 DAG 的表达式数量。
+    """
+
+    def __init__(self, source=None, max_cache_mb=1024, chunk_size=5000):
+        super().__init__(source)
+        self.cache = PanelCache(int(max_cache_mb * 1024 * 1024))
+        self.chunk_size = chunk_size
+        self.remaining = Counter()
+        self.stats = {"alphas": 0, "nodes": 0, "distinct": 0, "computed": 0, "hits": 0}
+
+    # -------------------------
+    # DAG 构建与引用计数
+    # -------------------------
+    def _plan(self, trees):
+        """统计块内每个子树被引用的次数"""
+        refs = Counter()
+        for tree in trees:
+            refs.update(_subtrees(tree))
+        self.stats["nodes"] += sum(refs.values())
+        self.stats["distinct"] += sum(1 for node in refs if node not in self.cache)
+        self.remaining = refs
+
+    def _release(self, node):
+        """节点被使用一次：引用数归零时释放缓存"""
+        if node not in self.remaining:
+            return
+        self.remaining[node] -= 1
+        if self.remaining[node] <= 0:
+            del self.remaining[node]
+            self.cache.discard(node)
+
+    def _release_subtree(self, node):
+        """命中缓存时子节点不会再被访问，补扣它们的引用数"""
+        for sub in _subtrees(node):
+            if sub is not node:
+                self._release(sub)
+
+    # -------------------------
+    # 带缓存的求值
+    # -------------------------
+    def _eval(self, node: Node, local_vars):
+        if local_vars or node.kind not in CACHEABLE_KINDS:
+            return super()._eval(node, local_vars)
+        if node in self.cache:
+            self.stats["hits"] += 1
+            value = self.cache.get(node)
+            self._release_subtree(node)
+        else:
+            self.stats["computed"] += 1
+            value = super()._eval(node, local_vars)
+            if isinstance(value, np.ndarray) and self.remaining.get(node, 0) > 1:
+                value.flags.writeable = False  # 缓存的面板被多个父节点共享，禁止原地修改
+                self.cache.put(node, value)
+        self._release(node)
+        return value
+
+    def evaluate_batch(self, exprs):
+        """
+        逐个 yield (expr, 面板或 None, 错误信息或 None)，顺序与输入一致。
+        exprs 可以是任意可迭代对象（例如生成器），按 chunk_size 分块构建 DAG。
+        返回的面板可能与缓存共享内存，是只读的。
+        """
+        chunk = []
+        for expr in exprs:
+            chunk.append(expr)
+            if len(chunk) >= self.chunk_size:
+                yield from self._evaluate_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self._evaluate_chunk(chunk)
+
+    def _evaluate_chunk(self, exprs):
+        parsed = []
+        for expr in exprs:
+            try:
+                parsed.append((expr, parse(expr), None))
+            except FastExprSyntaxError as e:
+                parsed.append((expr, None, f"{type(e).__name__}: {e}"))
+        self._plan([tree for _, tree, _ in parsed if tree is not None])
+
+        for expr, tree, err in parsed:
+            self.stats["alphas"] += 1
+            if tree is None:
+                yield expr, None, err
+                continue
+            panel, err = self.try_evaluate(tree)
+            if err is not None:
+                # 求值中途失败，未访问到的子树不会再走 _release；整棵树补扣一次（多扣只会提前释放）
+                for sub in _subtrees(tree):
+                    self._release(sub)
+            yield expr, panel, err
+
+        # 块结束：引用数只在块内有意义，剩余的缓存交给 LRU 管理
+        self.remaining = Counter()
+
+    def report(self):
+        s = self.stats
+        saved = 1 - s["computed"] / s["nodes"] if s["nodes"] else 0.0
+        return (f"alphas={s['alphas']}, subtrees={s['nodes']}, distinct={s['distinct']}, "
+                f"computed={s['computed']}, cache hits={s['hits']}, saved={saved:.1%}, "
+                f"cache={self.cache.nbytes / 1024 ** 2:.0f}MB/{len(self.cache)} panels, "
+                f"evictions={self.cache.evictions}")
+
+
+def evaluate_template_batch(exprs, source=None, max_cache_mb=1024, chunk_size=5000):
+    """对一个模板的全部展开做批量评估，参数与 evaluate_many 一致"""
+    evaluator = BatchEvaluator(source, max_cache_mb=max_cache_mb, chunk_size=chunk_size)
+    yield from evaluator.evaluate_batch(exprs)
+
+
+if __name__ == "__main__":
+    from itertools import product
+
+    from evaluator.local_engine import evaluate_many
+
+    template = "group_neutralize(rank(ts_decay_linear(ts_corr({a}, {b}, 20), 10)) * rank(-ts_delta(close, {d})), {g})"
+    fields = ["close", "open", "vwap", "volume", "returns"]
+    exprs = [template.format(a=a, b=b, d=d, g=g)
+             for a, b, d, g in product(fields, fields, [3, 5, 10], ["industry", "subindustry"])]
+
+    start = time.time()
+    evaluator = BatchEvaluator()
+    batch_ok = sum(1 for _, panel, _ in evaluator.evaluate_batch(exprs) if panel is not None)
+    batch_elapsed = time.time() - start
+    print(f"✅ Batch: {batch_ok}/{len(exprs)} alphas in {batch_elapsed:.2f}s")
+    print(f"📊 {evaluator.report()}")
+
+    start = time.time()
+    naive_ok = sum(1 for _, panel, _ in evaluate_many(exprs) if panel is not None)
+    naive_elapsed = time.time() - start
+    print(f"✅ Naive: {naive_ok}/{len(exprs)} alphas in {naive_elapsed:.2f}s "
+          f"(speedup {naive_elapsed / batch_elapsed:.1f}x)")
@@ -0,0 +1,166 @@
+# local_data.py
+"""
+本地评估引擎的数据源。
+
+数据源只需提供 get(name) -> np.ndarray (dates × instruments)，以及 dates / instruments 两个属性。
+分组字段（market / sector / industry / subindustry ...）返回整数编码的面板。
+真实数据通过 config.yaml 的 local_panels_npz（环境变量 LOCAL_PANELS_NPZ）配置，见 configured_source()；
+SyntheticDataSource 只用于离线测试与演示，不能用来给真实 alpha 打分或筛选。
+"""
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+from utils.config_loader import ConfigLoader
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+LOCAL_DATA_DIR = BASE_DIR / "data" / "local_panels"
+
+# 分组字段及合成数据中的分组数量
+GROUP_FIELDS = {"market": 1, "country": 1, "exchange": 3, "sector": 11, "industry": 60, "subindustry": 150}
+
+
+class PanelDataSource:
+    """由 {字段名: 面板} 字典构成的数据源，可从 npz 文件加载真实数据"""
+
+    def __init__(self, panels: dict, dates=None, instruments=None):
+        if not panels:
+            raise ValueError("❌ Empty panel dict")
+        shape = next(iter(panels.values())).shape
+        for name, panel in panels.items():
+            if panel.shape != shape:
+                raise ValueError(f"❌ Panel {name} has shape {panel.shape}, expected {shape}")
+        self.panels = panels
+        self.shape = shape
+        self.dates = np.arange(shape[0]) if dates is None else np.asarray(dates)
+        self.instruments = np.arange(shape[1]) if instruments is None else np.asarray(instruments)
+
+    @classmethod
+    def from_npz(cls, path):
+        """npz 中每个数组是一个字段面板；可选 __dates__ / __instruments__"""
+        with np.load(path, allow_pickle=False) as npz:
+            panels = {k: npz[k] for k in npz.files if not k.startswith("__")}
+            dates = npz["__dates__"] if "__dates__" in npz.files else None
+            instruments = npz["__instruments__"] if "__instruments__" in npz.files else None
+        return cls(panels, dates, instruments)
+
+    def has(self, name):
+        return name in self.panels
+
+    def get(self, name):
+        if name not in self.panels:
+            raise KeyError(f"Field not found in local data: {name}")
+        return self.panels[name]
+
+
+class SyntheticDataSource:
+    """
+    合成数据源，用于离线测试与预筛选。
+    价格为几何布朗运动；成交量、市值等派生字段与价格相关；分组字段为固定的随机分组。
+    未知字段按字段名的哈希生成确定性的 AR(1) 面板（带少量 NaN），
+    这样任意生成的 alpha 都能在本地跑通。
+    """
+
+    def __init__(self, n_dates=504, n_instruments=300, seed=42, nan_ratio=0.01):
+        self.shape = (n_dates, n_instruments)
+        self.seed = seed
+        self.nan_ratio = nan_ratio
+        self.dates = np.arange(n_dates)
+        self.instruments = np.arange(n_instruments)
+        self.panels = {}
+        self._build_price_panels()
+
+    def _rng(self, name):
+        digest = hashlib.md5(f"{self.seed}:{name}".encode("utf-8")).digest()
+        return np.random.default_rng(int.from_bytes(digest[:8], "little"))
+
+    def _build_price_panels(self):
+        T, N = self.shape
+        rng = self._rng("__prices__")
+        # 共同市场因子 + 个股噪声
+        market = rng.normal(0.0003, 0.01, size=(T, 1))
+        beta = rng.uniform(0.5, 1.5, size=(1, N))
+        idio = rng.normal(0, 0.02, size=(T, N))
+        returns = market * beta + idio
+        close = 20 * np.exp(np.cumsum(returns, axis=0)) * rng.uniform(0.5, 5, size=(1, N))
+        intraday = np.abs(rng.normal(0, 0.01, size=(T, N)))
+        open_ = close * (1 + rng.normal(0, 0.005, size=(T, N)))
+        high = np.maximum(open_, close) * (1 + intraday)
+        low = np.minimum(open_, close) * (1 - intraday)
+        volume = np.exp(rng.normal(13, 0.5, size=(T, N)) + 5 * np.abs(returns))
+        shares = rng.uniform(5e7, 5e9, size=(1, N))
+
+        self.panels.update({
+            "returns": returns,
+            "close": close,
+            "open": open_,
+            "high": high,
+            "low": low,
+            "vwap": (high + low + close) / 3,
+            "volume": volume,
+            "cap": close * shares,
+            "sharesout": np.repeat(shares, T, axis=0),
+        })
+        self.panels["adv20"] = _trailing_mean(volume, 20)
+
+        for name, n_groups in GROUP_FIELDS.items():
+            groups = self._rng(name).integers(0, n_groups, size=(1, N))
+            self.panels[name] = np.repeat(groups, T, axis=0)
+
+    def _make_field(self, name):
+        """未知字段：确定性 AR(1) 面板"""
+        T, N = self.shape
+        rng = self._rng(name)
+        noise = rng.normal(0, 1, size=(T, N))
+        phi = rng.uniform(0.8, 0.99)
+        panel = np.empty((T, N))
+        panel[0] = noise[0]
+        for t in range(1, T):
+            panel[t] = phi * panel[t - 1] + noise[t]
+        panel = panel * rng.uniform(0.1, 10) + rng.normal(0, 5)
+        if self.nan_ratio > 0:
+            panel[rng.random((T, N)) < self.nan_ratio] = np.nan
+        return panel
+
+    def has(self, name):
+        return True
+
+    def get(self, name):
+        if name not in self.panels:
+            self.panels[name] = self._make_field(name)
+        return self.panels[name]
+
+    def save_npz(self, path=None):
+        """把已生成的面板保存为 npz，可用 PanelDataSource.from_npz 重新加载"""
+        if path is None:
+            LOCAL_DATA_DIR.mkdir(parents=True, exist_ok=True)
+            path = LOCAL_DATA_DIR / f"synthetic_{self.seed}.npz"
+        np.savez_compressed(path, __dates__=self.dates, __instruments__=self.instruments, **self.panels)
+        return path
+
+
+def configured_panels_path():
+    """local_panels_npz 配置的 npz 路径（相对路径相对于项目根目录），未配置或文件不存在时返回 None"""
+    path = ConfigLoader.get("local_panels_npz")
+    if not path:
+        return None
+    path = Path(path) if Path(path).is_absolute() else BASE_DIR / path
+    if not path.exists():
+        print(f"⚠️ local_panels_npz 不存在: {path}")
+        return None
+    return path
+
+
+def configured_source():
+    """按配置加载真实面板数据源，未配置时返回 None"""
+    path = configured_panels_path()
+    return PanelDataSource.from_npz(path) if path is not None else None
+
+
+def _trailing_mean(x, d):
+    """简单的滚动均值（前 d-1 天为 NaN）"""
+    c = np.cumsum(np.vstack([np.zeros((1, x.shape[1])), x]), axis=0)
+    out = np.full(x.shape, np.nan)
+    out[d - 1:] = (c[d:] - c[:-d]) / d
+    return out
@@ -0,0 +1,571 @@
+# local_engine.py
+"""
+本地 Fast Expression 评估引擎（NumPy）。
+
+在 (dates × instruments) 面板上计算 utils.fast_expr 解析出的 AST，用于在消耗平台配额之前
+批量预筛选生成的 alpha。覆盖 utils/template_op_gener.TYPE_MAP 中的算术、逻辑、条件、ts_*、
+截面标准化与 group_* 运算符；不支持的运算符抛出 NotImplementedError。
+
+NaN 约定：时间序列运算在窗口不足 d 天时输出 NaN，窗口内的 NaN 被忽略（成对运算忽略任一侧为 NaN 的日期）；
+截面 / 分组运算只在非 NaN 的股票之间计算。
+"""
+import time
+import warnings
+
+import numpy as np
+
+from evaluator import ts_kernels
+from evaluator.local_data import SyntheticDataSource
+from utils.fast_expr import INFIX_TO_CALL, FastExprSyntaxError, Node, parse
+
+OPERATORS = {}
+
+
+def op(*names):
+    """注册运算符实现"""
+    def deco(fn):
+        for name in names:
+            OPERATORS[name] = fn
+        return fn
+    return deco
+
+
+def _f(x):
+    """转为 float 面板 / 标量"""
+    if isinstance(x, np.ndarray):
+        return x.astype(float, copy=False)
+    return float(x)
+
+
+def _bool(x):
+    x = np.asarray(x, dtype=float)
+    return np.where(np.isnan(x), False, x > 0)
+
+
+def _int(d):
+    return int(round(float(d)))
+
+
+# =========================
+# 算术
+# =========================
+@op("add")
+def op_add(*xs, filter=False):
+    if _truthy(filter):
+        xs = [np.nan_to_num(_f(x)) for x in xs]
+    out = _f(xs[0])
+    for x in xs[1:]:
+        out = out + _f(x)
+    return out
+
+
+@op("multiply")
+def op_multiply(*xs, filter=False):
+    if _truthy(filter):
+        xs = [np.where(np.isnan(_f(x)), 1.0, _f(x)) for x in xs]
+    out = _f(xs[0])
+    for x in xs[1:]:
+        out = out * _f(x)
+    return out
+
+
+@op("max")
+def op_max(*xs):
+    out = _f(xs[0])
+    for x in xs[1:]:
+        out = np.maximum(out, _f(x))
+    return out
+
+
+@op("min")
+def op_min(*xs):
+    out = _f(xs[0])
+    for x in xs[1:]:
+        out = np.minimum(out, _f(x))
+    return out
+
+
+@op("subtract")
+def op_subtract(x, y, filter=False):
+    if _truthy(filter):
+        x, y = np.nan_to_num(_f(x)), np.nan_to_num(_f(y))
+    return _f(x) - _f(y)
+
+
+@op("divide")
+def op_divide(x, y):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = _f(x) / _f(y)
+    return np.where(np.isinf(out), np.nan, out)
+
+
+@op("power")
+def op_power(x, y):
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        return np.power(_f(x), _f(y))
+
+
+@op("signed_power")
+def op_signed_power(x, y):
+    x = _f(x)
+    return np.sign(x) * np.power(np.abs(x), _f(y))
+
+
+@op("sign")
+def op_sign(x):
+    return np.sign(_f(x))
+
+
+@op("abs")
+def op_abs(x):
+    return np.abs(_f(x))
+
+
+@op("log")
+def op_log(x):
+    x = _f(x)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(x > 0, np.log(np.where(x > 0, x, 1.0)), np.nan)
+
+
+@op("sqrt")
+def op_sqrt(x):
+    x = _f(x)
+    return np.where(x >= 0, np.sqrt(np.abs(x)), np.nan)
+
+
+@op("inverse")
+def op_inverse(x):
+    return op_divide(1.0, x)
+
+
+@op("reverse")
+def op_reverse(x):
+    return -_f(x)
+
+
+@op("tanh")
+def op_tanh(x):
+    return np.tanh(_f(x))
+
+
+@op("sigmoid")
+def op_sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-_f(x)))
+
+
+# =========================
+# 逻辑 & 条件（真值用 1.0 / 0.0 表示）
+# =========================
+def _truthy(v):
+    if isinstance(v, str):
+        return v.lower() == "true"
+    return bool(v)
+
+
+@op("is_nan")
+def op_is_nan(x):
+    return np.isnan(_f(x)).astype(float)
+
+
+@op("not")
+def op_not(x):
+    return (~_bool(x)).astype(float)
+
+
+@op("and")
+def op_and(a, b):
+    return (_bool(a) & _bool(b)).astype(float)
+
+
+@op("or")
+def op_or(a, b):
+    return (_bool(a) | _bool(b)).astype(float)
+
+
+def _compare(fn):
+    def impl(a, b):
+        with np.errstate(invalid="ignore"):
+            return fn(_f(a), _f(b)).astype(float)
+    return impl
+
+
+op("less")(_compare(np.less))
+op("greater")(_compare(np.greater))
+op("less_equal")(_compare(np.less_equal))
+op("greater_equal")(_compare(np.greater_equal))
+op("equal")(_compare(np.equal))
+op("not_equal")(_compare(np.not_equal))
+
+
+@op("if_else")
+def op_if_else(cond, a, b):
+    cond = _f(cond)
+    out = np.where(_bool(cond), _f(a), _f(b))
+    return np.where(np.isnan(cond), np.nan, out)
+
+
+@op("trade_when")
+def op_trade_when(entry, alpha, exit_):
+    """entry>0 时更新为 alpha；exit>0 时平仓 (NaN)；否则保持前一天的值"""
+    alpha = np.broadcast_to(_f(alpha), np.shape(alpha) if np.ndim(alpha) else np.shape(entry))
+    entry = np.broadcast_to(_bool(entry), alpha.shape)
+    exit_ = np.broadcast_to(_bool(exit_), alpha.shape)
+    out = np.full(alpha.shape, np.nan)
+    prev = np.full(alpha.shape[1:], np.nan)
+    for t in range(alpha.shape[0]):
+        cur = np.where(entry[t], alpha[t], prev)
+        cur = np.where(exit_[t], np.nan, cur)
+        out[t] = prev = cur
+    return out
+
+
+# =========================
+# 时间序列（向量化内核，见 ts_kernels）
+# =========================
+def _ts(kernel):
+    def impl(x, d):
+        return kernel(_f(x), _int(d))
+    return impl
+
+
+for _name in ("ts_mean", "ts_sum", "ts_std_dev", "ts_product", "ts_min", "ts_max", "ts_av_diff",
+              "ts_zscore", "ts_skewness", "ts_count_nans", "ts_arg_max", "ts_arg_min"):
+    op(_name)(_ts(getattr(ts_kernels, _name)))
+
+ts_mean = OPERATORS["ts_mean"]
+ts_min = OPERATORS["ts_min"]
+ts_max = OPERATORS["ts_max"]
+
+
+@op("ts_min_diff")
+def ts_min_diff(x, d):
+    return _f(x) - ts_min(x, d)
+
+
+@op("ts_delay")
+def ts_delay(x, d):
+    x = _f(x)
+    d = _int(d)
+    out = np.full(x.shape, np.nan)
+    if d < x.shape[0]:
+        out[d:] = x[:x.shape[0] - d]
+    return out
+
+
+@op("ts_delta")
+def ts_delta(x, d):
+    return _f(x) - ts_delay(x, d)
+
+
+@op("ts_decay_linear")
+def ts_decay_linear(x, d, dense=False):
+    return ts_kernels.ts_decay_linear(_f(x), _int(d))
+
+
+@op("ts_rank")
+def ts_rank(x, d, constant=0):
+    """今天的值在过去 d 天中的分位 [0,1]"""
+    return ts_kernels.ts_rank(_f(x), _int(d), float(constant))
+
+
+@op("ts_scale")
+def ts_scale(x, d, constant=0):
+    lo, hi = ts_min(x, d), ts_max(x, d)
+    return op_divide(_f(x) - lo, hi - lo) + float(constant)
+
+
+@op("ts_min_max_diff")
+def ts_min_max_diff(x, d, f=0.5):
+    return _f(x) - float(f) * (ts_min(x, d) + ts_max(x, d))
+
+
+@op("ts_min_max_cps")
+def ts_min_max_cps(x, d, f=2):
+    return ts_min(x, d) + ts_max(x, d) - float(f) * _f(x)
+
+
+@op("ts_backfill")
+def ts_backfill(x, lookback=None, k=1, ignore="NAN", d=None):
+    """用最近 d 天内最后一个非 NaN 值填充 NaN"""
+    d = _int(lookback if lookback is not None else d)
+    x = _f(x)
+    T = x.shape[0]
+    idx = np.where(np.isnan(x), -1, np.arange(T)[:, None])
+    last = np.maximum.accumulate(idx, axis=0)
+    filled = np.take_along_axis(x, np.maximum(last, 0), axis=0)
+    age = np.arange(T)[:, None] - last
+    return np.where((last >= 0) & (age < d), filled, np.nan)
+
+
+@op("days_from_last_change")
+def days_from_last_change(x):
+    x = _f(x)
+    T = x.shape[0]
+    changed = np.vstack([np.ones((1, x.shape[1]), dtype=bool), x[1:] != x[:-1]])
+    last = np.maximum.accumulate(np.where(changed, np.arange(T)[:, None], 0), axis=0)
+    return (np.arange(T)[:, None] - last).astype(float)
+
+
+@op("ts_covariance")
+def ts_covariance(y, x, d):
+    x, y = np.broadcast_arrays(_f(x), _f(y))
+    return ts_kernels.ts_covariance(y, x, _int(d))
+
+
+@op("ts_corr")
+def ts_corr(x, y, d):
+    x, y = np.broadcast_arrays(_f(x), _f(y))
+    return ts_kernels.ts_corr(x, y, _int(d))
+
+
+@op("ts_regression")
+def ts_regression(y, x, d, lag=0, rettype=0):
+    """rettype: 0 残差, 1 截距, 2 斜率, 3 拟合值"""
+    x = ts_delay(x, lag) if _int(lag) > 0 else _f(x)
+    x, y = np.broadcast_arrays(x, _f(y))
+    beta = op_divide(ts_covariance(y, x, d), ts_covariance(x, x, d))
+    alpha = ts_mean(y, d) - beta * ts_mean(x, d)
+    fitted = alpha + beta * x
+    return {0: y - fitted, 1: alpha, 2: beta, 3: fitted}.get(_int(rettype), y - fitted)
+
+
+# =========================
+# 截面运算（按行 / 按分组）
+# =========================
+def _segment_rank(x, keys):
+    """在 keys 相同的元素内计算 [0,1] 分位（NaN 不参与）；keys 与 x 同形状的整数数组"""
+    x = _f(x)
+    flat = x.ravel()
+    out = np.full(flat.shape, np.nan)
+    valid_idx = np.flatnonzero(~np.isnan(flat))
+    if valid_idx.size == 0:
+        return out.reshape(x.shape)
+    k = keys.ravel()[valid_idx]
+    order = np.lexsort((flat[valid_idx], k))
+    sk = k[order]
+    n_valid = valid_idx.size
+    starts = np.r_[0, np.flatnonzero(sk[1:] != sk[:-1]) + 1]
+    counts = np.diff(np.r_[starts, n_valid])
+    seg_start = np.repeat(starts, counts)
+    seg_count = np.repeat(counts, counts)
+    pos = np.arange(n_valid) - seg_start
+    out[valid_idx[order]] = np.where(seg_count > 1, pos / np.maximum(seg_count - 1, 1), 0.5)
+    return out.reshape(x.shape)
+
+
+def _row_rank(x):
+    """按行排名的快速路径：沿 axis=1 的 argsort 比扁平化 lexsort 快一个数量级"""
+    T, N = x.shape
+    order = np.argsort(x, axis=1, kind="stable")  # NaN 排在最后
+    ranks = np.empty(x.shape, dtype=float)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(N, dtype=float), x.shape), axis=1)
+    n = (~np.isnan(x)).sum(axis=1, keepdims=True)
+    out = np.where(n > 1, ranks / np.maximum(n - 1, 1), 0.5)
+    return np.where(np.isnan(x), np.nan, out)
+
+
+def _row_keys(x):
+    return np.broadcast_to(np.arange(x.shape[0])[:, None], x.shape)
+
+
+def _group_keys(group):
+    group = np.asarray(group)
+    _, codes = np.unique(group, return_inverse=True)
+    codes = codes.reshape(group.shape)
+    n_groups = int(codes.max()) + 1
+    return _row_keys(group) * n_groups + codes, n_groups
+
+
+def _segment_stat(x, keys, n_keys):
+    """返回每个元素所在分组的 (均值, 标准差, 计数)"""
+    x = _f(x)
+    flat = x.ravel()
+    k = keys.ravel()
+    valid = ~np.isnan(flat)
+    v = np.where(valid, flat, 0.0)
+    cnt = np.bincount(k, weights=valid, minlength=n_keys)
+    s = np.bincount(k, weights=v, minlength=n_keys)
+    s2 = np.bincount(k, weights=v * v, minlength=n_keys)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s / cnt
+        std = np.sqrt(np.maximum(s2 / cnt - mean ** 2, 0))
+    return mean[k].reshape(x.shape), std[k].reshape(x.shape), cnt[k].reshape(x.shape)
+
+
+@op("rank")
+def cs_rank(x, rate=2):
+    return _row_rank(_f(x))
+
+
+@op("zscore")
+def cs_zscore(x):
+    x = _f(x)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return op_divide(x - np.nanmean(x, axis=1, keepdims=True), np.nanstd(x, axis=1, keepdims=True))
+
+
+@op("scale")
+def cs_scale(x, scale=1, longscale=0, shortscale=0):
+    x = _f(x)
+    gross = np.nansum(np.abs(x), axis=1, keepdims=True)
+    return op_divide(x, gross) * float(scale)
+
+
+@op("normalize")
+def cs_normalize(x, useStd=False, limit=0.0):
+    x = _f(x)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        out = x - np.nanmean(x, axis=1, keepdims=True)
+        if _truthy(useStd):
+            out = op_divide(out, np.nanstd(x, axis=1, keepdims=True))
+    if float(limit) > 0:
+        out = np.clip(out, -float(limit), float(limit))
+    return out
+
+
+@op("winsorize")
+def cs_winsorize(x, std=4):
+    x = _f(x)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        m = np.nanmean(x, axis=1, keepdims=True)
+        s = np.nanstd(x, axis=1, keepdims=True)
+    return np.clip(x, m - float(std) * s, m + float(std) * s)
+
+
+@op("group_mean")
+def group_mean(x, group, weight=None):
+    keys, n_groups = _group_keys(group)
+    x = np.broadcast_to(_f(x), keys.shape)
+    mean, _, _ = _segment_stat(x, keys, keys.shape[0] * n_groups)
+    return mean
+
+
+@op("group_neutralize")
+def group_neutralize(x, group):
+    return _f(x) - group_mean(x, group)
+
+
+@op("group_zscore")
+def group_zscore(x, group):
+    keys, n_groups = _group_keys(group)
+    x = np.broadcast_to(_f(x), keys.shape)
+    mean, std, _ = _segment_stat(x, keys, keys.shape[0] * n_groups)
+    return op_divide(x - mean, std)
+
+
+@op("group_rank")
+def group_rank(x, group):
+    keys, _ = _group_keys(group)
+    return _segment_rank(np.broadcast_to(_f(x), keys.shape), keys)
+
+
+@op("group_scale")
+def group_scale(x, group):
+    """分组内 (x - min) / (max - min)"""
+    keys, n_groups = _group_keys(group)
+    x = np.broadcast_to(_f(x), keys.shape)
+    flat, k = x.ravel(), keys.ravel()
+    lo = np.full(keys.shape[0] * n_groups, np.inf)
+    hi = np.full(keys.shape[0] * n_groups, -np.inf)
+    valid = ~np.isnan(flat)
+    np.minimum.at(lo, k[valid], flat[valid])
+    np.maximum.at(hi, k[valid], flat[valid])
+    lo, hi = lo[k].reshape(x.shape), hi[k].reshape(x.shape)
+    return op_divide(x - lo, hi - lo)
+
+
+@op("densify")
+def densify(group):
+    _, codes = np.unique(np.asarray(group), return_inverse=True)
+    return codes.reshape(np.shape(group)).astype(float)
+
+
+# =========================
+# 引擎
+# =========================
+BOOLEAN_IDENTS = {"true": 1.0, "false": 0.0}
+
+
+class LocalEngine:
+    """在本地数据源上计算 Fast Expression，返回 (dates × instruments) 面板"""
+
+    def __init__(self, source=None):
+        self.source = source if source is not None else SyntheticDataSource()
+
+    def evaluate(self, expr):
+        """expr 可以是表达式字符串或 utils.fast_expr.Node"""
+        tree = parse(expr) if isinstance(expr, str) else expr
+        out = self._eval(tree, {})
+        return np.broadcast_to(_f(out), self.source.shape).copy() if np.ndim(out) == 0 else out
+
+    def try_evaluate(self, expr):
+        """返回 (面板, None) 或 (None, 错误信息)，用于批量预筛选"""
+        try:
+            return self.evaluate(expr), None
+        except (FastExprSyntaxError, NotImplementedError, KeyError, TypeError, ValueError) as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    def _eval(self, node: Node, local_vars):
+        kind = node.kind
+        if kind == "num":
+            return float(node.value)
+        if kind == "str":
+            return node.value
+        if kind == "ident":
+            if node.value in local_vars:
+                return local_vars[node.value]
+            if node.value in BOOLEAN_IDENTS:
+                return BOOLEAN_IDENTS[node.value]
+            return self.source.get(node.value)
+        if kind == "seq":
+            result = None
+            for statement in node.args:
+                result = self._eval(statement, local_vars)
+            return result
+        if kind == "assign":
+            local_vars[node.value] = self._eval(node.args[0], local_vars)
+            return local_vars[node.value]
+        if kind == "binop":
+            return self._call(INFIX_TO_CALL[node.value], node.args, (), local_vars)
+        if kind == "unary":
+            if node.value == "-":
+                return -_f(self._eval(node.args[0], local_vars))
+            if node.value == "+":
+                return self._eval(node.args[0], local_vars)
+            return self._call("not", node.args, (), local_vars)
+        if kind == "ternary":
+            return self._call("if_else", node.args, (), local_vars)
+        return self._call(node.value, node.args, node.kwargs, local_vars)
+
+    def _call(self, name, args, kwargs, local_vars):
+        fn = OPERATORS.get(name)
+        if fn is None:
+            raise NotImplementedError(f"Operator not supported locally: {name}")
+        values = [self._eval(a, local_vars) for a in args]
+        kw = {k: self._eval(v, local_vars) for k, v in kwargs}
+        return fn(*values, **kw)
+
+
+def evaluate_many(exprs, source=None):
+    """批量计算，逐个 yield (expr, 面板或 None, 错误信息或 None)"""
+    engine = LocalEngine(source)
+    for expr in exprs:
+        panel, err = engine.try_evaluate(expr)
+        yield expr, panel, err
+
+
+if __name__ == "__main__":
+    exprs = [
+        "rank(ts_mean(close, 20))",
+        "group_neutralize(rank(-ts_delta(close, 5)), subindustry)",
+        "ts_corr(close, volume, 10)",
+        "trade_when(volume > adv20, rank(-returns), -1)",
+    ] * 25
+    start = time.time()
+    ok = sum(1 for _, panel, _ in evaluate_many(exprs) if panel is not None)
+    elapsed = time.time() - start
+    print(f"✅ Evaluated {ok}/{len(exprs)} alphas in {elapsed:.2f}s ({len(exprs) / elapsed * 60:.0f} alphas/min)")
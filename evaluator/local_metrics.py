@@ -0,0 +1,251 @@
+# local_metrics.py
+"""
+本地计算与平台 IS 指标同口径的 sharpe / turnover / fitness / returns / drawdown / margin。
+
+alpha 信号面板按 simulation settings（settings 配置档，见 sim_settings.py）转换成持仓权重：
+    decay（线性衰减） -> neutralization（按市场 / 行业分组去均值） -> 按总头寸缩放为 1 -> truncation（单票权重上限）
+第 t 行的权重在 delay 天后建仓，赚取下一天的收益：pnl[t] = Σ w[t-1-delay] · returns[t]。
+
+指标定义（收益均以账面规模的一半为分母，与平台一致）：
+    returns  = 年化日均收益
+    sharpe   = 日均收益 / 日收益标准差 · sqrt(252)
+    turnover = 日均交易额 / 账面规模
+    fitness  = sharpe · sqrt(|returns| / max(turnover, 0.125))
+    drawdown = 累计收益的最大回撤
+    margin   = 总收益 / 总交易额
+
+所有运算都带一个 alpha 维度 (K, T, N)，一次处理一批 alpha。
+"""
+import time
+
+import numpy as np
+
+from evaluator.local_batch import BatchEvaluator
+from evaluator.local_data import SyntheticDataSource, configured_source
+from evaluator.sim_settings import get_settings
+
+TRADING_DAYS = 252
+MIN_TURNOVER = 0.125      # fitness 公式中换手率的下限
+TRUNCATION_ITERS = 10     # 截断后重新缩放会把其他股票推过上限，迭代几次收敛
+METRIC_FIELDS = ["sharpe", "turnover", "fitness", "returns", "drawdown", "margin"]
+
+# neutralization 设置 -> 数据源中的分组字段；MARKET 为全体去均值，NONE 不做中性化
+NEUTRALIZATION_GROUPS = {"MARKET": None, "SECTOR": "sector", "INDUSTRY": "industry", "SUBINDUSTRY": "subindustry"}
+
+
+def _stack(panels):
+    x = np.asarray(panels, dtype=float)
+    return x[None] if x.ndim == 2 else x
+
+
+def apply_decay(x, decay):
+    """线性衰减：今天权重 decay，昨天 decay-1 ... ；NaN 不计入权重。decay <= 1 时不变"""
+    if decay <= 1:
+        return x
+    num = np.zeros_like(x)
+    den = np.zeros_like(x)
+    for lag in range(decay):
+        shifted = np.full_like(x, np.nan)
+        shifted[:, lag:] = x[:, :x.shape[1] - lag]
+        valid = ~np.isnan(shifted)
+        weight = decay - lag
+        num += weight * np.where(valid, shifted, 0.0)
+        den += weight * valid
+    with np.errstate(invalid="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def neutralize(x, groups):
+    """每个 alpha、每一天、每个分组内去均值；groups 为 (T, N) 整数面板，None 表示整个市场"""
+    K, T, N = x.shape
+    if groups is None:
+        valid = ~np.isnan(x)
+        counts = valid.sum(axis=2, keepdims=True)
+        sums = np.where(valid, x, 0.0).sum(axis=2, keepdims=True)
+        return x - sums / np.maximum(counts, 1)
+    _, codes = np.unique(np.nan_to_num(groups, nan=-1), return_inverse=True)
+    codes = codes.reshape(T, N)
+    G = int(codes.max()) + 1
+    keys = (np.arange(K)[:, None, None] * T + np.arange(T)[None, :, None]) * G + codes[None]
+    valid = ~np.isnan(x)
+    sums = np.bincount(keys[valid], weights=x[valid], minlength=K * T * G)
+    counts = np.bincount(keys[valid], minlength=K * T * G)
+    with np.errstate(invalid="ignore"):
+        means = sums / counts
+    return x - means[keys]
+
+
+def scale_and_truncate(x, truncation):
+    """按总头寸缩放到 1，再把单票权重截断到 truncation 以内"""
+    w = np.nan_to_num(x, nan=0.0, posinf=0.0, neginf=0.0)
+
+    def rescale(w):
+        gross = np.abs(w).sum(axis=2, keepdims=True)
+        return np.where(gross > 0, w / np.where(gross > 0, gross, 1.0), 0.0)
+
+    w = rescale(w)
+    if 0 < truncation < 1:
+        for _ in range(TRUNCATION_ITERS):
+            if np.abs(w).max(initial=0.0) <= truncation + 1e-12:
+                break
+            w = rescale(np.clip(w, -truncation, truncation))
+    return w
+
+
+def alpha_to_weights(panels, settings=None, groups=None):
+    """
+    (K, T, N) 或 (T, N) 的信号面板 -> 持仓权重；settings 为空时取当前配置档（settings_profile），
+    groups 为中性化分组面板（None 表示按市场）
+    """
+    settings = settings or get_settings()
+    x = _stack(panels)
+    x = apply_decay(x, int(settings.get("decay", 0)))
+    if str(settings.get("neutralization", "NONE")).upper() != "NONE":
+        x = neutralize(x, groups)
+    return scale_and_truncate(x, float(settings.get("truncation", 0) or 0))
+
+
+def weights_to_pnl(weights, returns, delay=1):
+    """
+    权重 (K, T, N) 与收益面板 (T, N) -> (日收益 (K, T)，日交易额 (K, T)，是否持仓 (K, T))，
+    日收益与交易额均以总头寸为单位
+    """
+    K, T, N = weights.shape
+    lag = delay + 1
+    r = np.nan_to_num(np.asarray(returns, dtype=float))
+    held = np.zeros_like(weights)
+    held[:, lag:] = weights[:, :T - lag]
+    daily = (held * r[None]).sum(axis=2)
+    traded = np.abs(np.diff(held, axis=1, prepend=0.0)).sum(axis=2)
+    active = np.abs(held).sum(axis=2) > 0
+    return daily, traded, active
+
+
+def weights_to_metrics(weights, returns, delay=1):
+    """权重 (K, T, N) 与收益面板 (T, N) -> 每个 alpha 的指标字典列表"""
+    daily, traded, active = weights_to_pnl(weights, returns, delay)
+    rows = []
+    for k in range(weights.shape[0]):
+        days = np.flatnonzero(active[k])
+        if len(days) < 2:
+            rows.append({name: None for name in METRIC_FIELDS})
+            continue
+        start = days[0]
+        pnl = daily[k, start:] * 2                             # 以半个账面为分母
+        trade = traded[k, start + 1:]                           # 建仓当天的交易不计入换手
+        mean, std = pnl.mean(), pnl.std()
+        sharpe = mean / std * np.sqrt(TRADING_DAYS) if std > 0 else 0.0
+        ann_returns = mean * TRADING_DAYS
+        turnover = trade.mean() if len(trade) else 0.0
+        cum = np.cumsum(pnl)
+        drawdown = float(np.max(np.maximum.accumulate(np.maximum(cum, 0)) - cum))
+        total_traded = trade.sum() * 2
+        rows.append({
+            "sharpe": float(sharpe),
+            "turnover": float(turnover),
+            "fitness": float(sharpe * np.sqrt(abs(ann_returns) / max(turnover, MIN_TURNOVER))),
+            "returns": float(ann_returns),
+            "drawdown": drawdown,
+            "margin": float(cum[-1] / total_traded) if total_traded > 0 else 0.0,
+        })
+    return rows
+
+
+class LocalMetrics:
+    """
+    绑定数据源与 settings 的批量指标计算器，收益与分组面板只读取一次；settings 为空时取 profile 配置档。
+    source 为空时使用 local_panels_npz 配置的真实数据，未配置时报错（合成数据需显式传入 SyntheticDataSource()）
+    """
+
+    def __init__(self, source=None, settings=None, profile=None):
+        if source is None:
+            source = configured_source()
+        if source is None:
+            raise ValueError("❌ No local panel data: set local_panels_npz (LOCAL_PANELS_NPZ) to an npz of real panels, "
+                             "or pass SyntheticDataSource() explicitly for offline tests")
+        self.source = source
+        self.settings = dict(settings or get_settings(profile))
+        self.returns = self.source.get("returns")
+        self.delay = int(self.settings.get("delay", 1))
+        neutralization = str(self.settings.get("neutralization", "NONE")).upper()
+        group_field = NEUTRALIZATION_GROUPS.get(neutralization)
+        if neutralization not in NEUTRALIZATION_GROUPS and neutralization != "NONE":
+            print(f"⚠️ Neutralization {neutralization} not supported locally, using MARKET")
+        self.groups = self.source.get(group_field) if group_field else None
+
+    def compute(self, panels, with_pnl=False):
+        """一批信号面板 -> 指标字典列表；with_pnl=True 时同时返回日收益序列 (K, T)"""
+        weights = alpha_to_weights(panels, self.settings, self.groups)
+        rows = weights_to_metrics(weights, self.returns, self.delay)
+        if with_pnl:
+            daily, _, _ = weights_to_pnl(weights, self.returns, self.delay)
+            return rows, daily
+        return rows
+
+    def score_pnl(self, exprs, batch_size=64, evaluator=None):
+        """
+        计算表达式并按输入顺序逐个 yield (与回测 CSV 同结构的行, 日收益序列)；
+        本地无法计算的表达式指标为 None 并附带 error，日收益为 None。
+        """
+        evaluator = evaluator or BatchEvaluator(self.source)
+        batch = []
+        for expr, panel, err in evaluator.evaluate_batch(exprs):
+            batch.append((expr, panel, err))
+            if len(batch) >= batch_size:
+                yield from self._flush(batch)
+                batch = []
+        if batch:
+            yield from self._flush(batch)
+
+    def _flush(self, batch):
+        """按输入顺序 yield；只有成功计算出面板的表达式参与指标计算"""
+        ok = [panel for _, panel, _ in batch if panel is not None]
+        rows, daily = self.compute(np.stack(ok), with_pnl=True) if ok else ([], [])
+        results = iter(zip(rows, daily))
+        for expr, panel, err in batch:
+            if panel is None:
+                yield {"alpha": expr, **{name: None for name in METRIC_FIELDS}, "error": err}, None
+            else:
+                row, pnl = next(results)
+                yield {"alpha": expr, **row, "error": None}, pnl
+
+    def score_alphas(self, exprs, batch_size=64, evaluator=None):
+        """只要指标行，见 score_pnl"""
+        for row, _ in self.score_pnl(exprs, batch_size=batch_size, evaluator=evaluator):
+            yield row
+
+    def rank_alphas(self, exprs, key="fitness", top=None, batch_size=64):
+        """按 key 从高到低排序（本地无法计算的排在最后），返回前 top 行"""
+        rows = list(self.score_alphas(exprs, batch_size=batch_size))
+        rows.sort(key=lambda row: -np.inf if row[key] is None or np.isnan(row[key]) else row[key], reverse=True)
+        return rows[:top] if top else rows
+
+
+if __name__ == "__main__":
+    import sys
+
+    from utils.alpha_file import iter_alphas
+
+    source = None
+    if len(sys.argv) > 1:
+        exprs = list(iter_alphas(sys.argv[1]))
+    else:
+        # 演示：内置表达式在合成数据上打分
+        source = SyntheticDataSource()
+        exprs = [
+            "rank(-ts_delta(close, 5))",
+            "rank(ts_mean(returns, 20))",
+            "-rank(ts_corr(close, volume, 10))",
+            "group_neutralize(rank(-returns), subindustry)",
+            "rank(volume / adv20)",
+        ]
+    start = time.time()
+    ranked = LocalMetrics(source).rank_alphas(exprs, top=20)
+    print(f"✅ Scored {len(exprs)} alphas in {time.time() - start:.2f}s")
+    for row in ranked:
+        if row["error"]:
+            print(f"❌ {row['alpha']}: {row['error']}")
+        else:
+            print(f"📈 fitness={row['fitness']:.2f} sharpe={row['sharpe']:.2f} turnover={row['turnover']:.2%} "
+                  f"returns={row['returns']:.2%} drawdown={row['drawdown']:.2%} margin={row['margin'] * 1e4:.1f}bps "
+                  f"| {row['alpha']}")
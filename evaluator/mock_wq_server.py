@@ -0,0 +1,494 @@
+# mock_wq_server.py
+"""
+离线的 WorldQuant Brain API 替身，用于在不消耗真实配额的情况下压测评估器。
+
+实现的接口：
+    POST /authentication            Basic 认证，返回会话 cookie
+    POST /simulations               返回 201 + Location；在途数超过上限时 429 SIMULATION_LIMIT_EXCEEDED；
+                                    body 为列表时创建 multi-simulation（最多 multi_simulation_max 个，只占一个并发槽位）
+    GET  /simulations/{id}          进行中返回 {"progress": x} + Retry-After；结束后返回 COMPLETE / WARNING / ERROR，
+                                    multi-simulation 结束后返回 {"children": [...]}，子 simulation 按普通 simulation 读取
+    GET  /alphas/{id}               返回带 is 指标与 checks 的 alpha 详情
+    GET  /alphas/{id}/recordsets/{pnl|yearly-stats}
+                                    与 is 指标一致的日 PnL 序列 / 年度统计；生成前返回空响应 + Retry-After
+    GET  /operators                 运算符列表（优先读取 data/wq_operators/operators.csv）
+    GET  /data-fields               按 dataset.id / limit / offset 分页的字段列表
+
+延迟、错误率、限流等行为由 DEFAULT_CONFIG 中的参数控制。MockBrain.handle() 与传输层无关，
+既可以挂在 MockBrainServer（标准库 ThreadingHTTPServer）上，也可以直接给 httpx.MockTransport 使用。
+
+    python -m evaluator.mock_wq_server --port 8765
+    WORLDQUANT_API_BASE=http://127.0.0.1:8765 WORLDQUAN_API_AUTH=http://127.0.0.1:8765/authentication python3 main_evaluator.py
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+OPERATORS_CSV = BASE_DIR / "data" / "wq_operators" / "operators.csv"
+FIELDS_DIR = BASE_DIR / "data" / "wq_fields"
+
+DEFAULT_CONFIG = {
+    "concurrency_limit": 10,          # 每个会话同时在途的 simulation 上限
+    "latency_mean": 20.0,             # simulation 平均耗时（秒）
+    "latency_jitter": 10.0,           # 耗时在 mean ± jitter 内均匀分布
+    "error_rate": 0.05,               # 结束状态为 ERROR 的比例（与表达式内容无关的随机错误）
+    "invalid_fields": "",             # 逗号分隔的不可用字段，包含它们的表达式总是 ERROR（unknown variable）
+    "warning_rate": 0.10,             # 结束状态为 WARNING 的比例
+    "throttle_rate": 0.0,             # 任意已认证请求随机返回 429 的概率
+    "max_requests_per_second": 50,    # 每个会话每秒请求数上限，超出返回 429
+    "retry_after": 2.0,               # 429 响应的 Retry-After（秒）
+    "progress_retry_after": 1.0,      # 轮询进行中 simulation 时的 Retry-After（秒）
+    "poll_error_rate": 0.0,           # 轮询 simulation 时随机返回 403 HTML 错误页（网关 / 代理故障）的概率
+    "alpha_ready_delay": 0.0,         # simulation 结束后 /alphas/{id} 可读取前的延迟（秒）
+    "recordset_ready_delay": 0.0,     # alpha 可读取后 recordsets 仍在生成的时间（秒）
+    "session_ttl": None,              # 会话有效期（秒），过期后返回 401；None 表示不过期
+    "multi_simulation_max": 10,       # 一个 multi-simulation 最多包含的 alpha 数，0 表示不支持
+    "seed": 0,
+}
+
+ERROR_MESSAGES = [
+    "Unexpected character in expression",
+    "Simulation failed due to an internal error",
+]
+INVALID_FIELD_MESSAGE = 'Attempted to use unknown variable "{field}"'
+PV_FIELDS = ["close", "open", "high", "low", "vwap", "volume", "returns", "cap", "adv20", "sharesout"]
+
+
+def _json(status, payload, headers=None):
+    return status, dict(headers or {}, **{"Content-Type": "application/json"}), json.dumps(payload).encode("utf-8")
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+class MockBrain:
+    """WQ Brain API 的内存实现，线程安全，同时记录压测统计"""
+
+    def __init__(self, **config):
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"❌ Unknown mock config: {sorted(unknown)}")
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.rng = random.Random(self.config["seed"])
+        self.invalid_fields = {f.strip() for f in self.config["invalid_fields"].split(",") if f.strip()}
+        self._lock = threading.Lock()
+        self.sessions = {}        # token -> {"user", "created_at", "requests": deque}
+        self.simulations = {}     # sim id -> dict
+        self.alphas = {}          # alpha id -> sim id
+        self.requests = Counter()  # (endpoint, status) -> 次数
+        self.started_at = time.time()
+
+    # =========================
+    # 入口
+    # =========================
+    def handle(self, method, url, headers, body=b""):
+        """返回 (status, headers, body bytes)；url 可以是完整 URL 或路径"""
+        parsed = urlparse(url)
+        path = parsed.path.rstrip("/") or "/"
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        headers = {k.lower(): v for k, v in headers.items()}
+        base = f"http://{headers['host']}" if "host" in headers else ""
+        endpoint = self._endpoint(method, path)
+        with self._lock:
+            status, resp_headers, resp_body = self._dispatch(endpoint, method, path, query, headers, body, base)
+            self.requests[(endpoint, status)] += 1
+        return status, resp_headers, resp_body
+
+    @staticmethod
+    def _endpoint(method, path):
+        parts = path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] in ("simulations", "alphas"):
+            return f"{method} /{parts[0]}/{{id}}"
+        if len(parts) == 4 and parts[0] == "alphas" and parts[2] == "recordsets":
+            return f"{method} /alphas/{{id}}/recordsets/{parts[3]}"
+        return f"{method} {path}"
+
+    def _dispatch(self, endpoint, method, path, query, headers, body, base):
+        if endpoint == "POST /authentication":
+            return self._authenticate(headers)
+        session = self._session(headers)
+        if session is None:
+            return _json(401, {"detail": "Incorrect authentication credentials."})
+        throttled = self._throttle(session)
+        if throttled:
+            return throttled
+
+        if endpoint == "POST /simulations":
+            return self._create_simulation(session, body, base)
+        if endpoint == "GET /simulations/{id}":
+            return self._get_simulation(path.rsplit("/", 1)[-1])
+        if endpoint == "GET /alphas/{id}":
+            return self._get_alpha(path.rsplit("/", 1)[-1])
+        if endpoint.startswith("GET /alphas/{id}/recordsets/"):
+            parts = path.strip("/").split("/")
+            return self._get_recordset(parts[1], parts[3])
+        if endpoint == "GET /operators":
+            return _json(200, self._operators())
+        if endpoint == "GET /data-fields":
+            return self._data_fields(query)
+        return _json(404, {"detail": "Not found."})
+
+    # =========================
+    # 认证与限流
+    # =========================
+    def _authenticate(self, headers):
+        auth = headers.get("authorization", "")
+        if not auth.startswith("Basic "):
+            return _json(401, {"detail": "Authentication credentials were not provided."})
+        user = base64.b64decode(auth[6:]).decode("utf-8", "replace").split(":", 1)[0]
+        token = uuid.uuid4().hex
+        self.sessions[token] = {"user": user, "created_at": time.time(), "requests": deque()}
+        return _json(201, {"user": {"id": user}, "token": {"expiry": self.config["session_ttl"] or 14400}},
+                     {"Set-Cookie": f"t={token}; Path=/; HttpOnly"})
+
+    def _session(self, headers):
+        cookies = dict(part.strip().split("=", 1) for part in headers.get("cookie", "").split(";") if "=" in part)
+        session = self.sessions.get(cookies.get("t"))
+        ttl = self.config["session_ttl"]
+        if session is not None and ttl is not None and time.time() - session["created_at"] > ttl:
+            return None
+        return session
+
+    def _too_many(self, detail="Too many requests."):
+        return _json(429, {"detail": detail}, {"Retry-After": str(self.config["retry_after"])})
+
+    def _throttle(self, session):
+        now = time.time()
+        window = session["requests"]
+        while window and now - window[0] > 1.0:
+            window.popleft()
+        window.append(now)
+        if len(window) > self.config["max_requests_per_second"]:
+            return self._too_many()
+        if self.config["throttle_rate"] and self.rng.random() < self.config["throttle_rate"]:
+            return self._too_many()
+        return None
+
+    # =========================
+    # simulation / alpha
+    # =========================
+    def _in_flight(self, user, now):
+        """占用并发槽位的在途 simulation 数（multi-simulation 的子 simulation 不单独占槽位）"""
+        return sum(1 for sim in self.simulations.values()
+                   if sim["user"] == user and sim["parent"] is None and sim["completes_at"] > now)
+
+    def _create_simulation(self, session, body, base):
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            return _json(400, {"detail": "JSON parse error."})
+        payloads = payload if isinstance(payload, list) else [payload]
+        if not payloads or not all(isinstance(p, dict) and p.get("regular") for p in payloads):
+            return _json(400, {"regular": ["This field is required."]})
+        if isinstance(payload, list) and len(payloads) > self.config["multi_simulation_max"]:
+            return _json(400, {"detail": f"Multi-simulation accepts at most "
+                                         f"{self.config['multi_simulation_max']} alphas."})
+        now = time.time()
+        if self._in_flight(session["user"], now) >= self.config["concurrency_limit"]:
+            return self._too_many("SIMULATION_LIMIT_EXCEEDED")
+
+        if isinstance(payload, list):
+            parent = self._new_simulation(session["user"], None, now, "COMPLETE")
+            children = [self._new_simulation(session["user"], p, now, parent=parent["id"]) for p in payloads]
+            parent["children"] = [child["id"] for child in children]
+            parent["completes_at"] = max(child["completes_at"] for child in children)
+            sim = parent
+        else:
+            sim = self._new_simulation(session["user"], payload, now)
+        return _json(201, {}, {"Location": f"{base}/simulations/{sim['id']}",
+                               "Retry-After": str(self.config["progress_retry_after"])})
+
+    def _new_simulation(self, user, payload, now, status=None, parent=None):
+        cfg = self.config
+        duration = max(0.5, self.rng.uniform(cfg["latency_mean"] - cfg["latency_jitter"],
+                                             cfg["latency_mean"] + cfg["latency_jitter"]))
+        invalid = [f for f in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", (payload or {}).get("regular", ""))
+                   if f in self.invalid_fields]
+        if status is None and invalid:
+            status = "ERROR"
+        if status is None:
+            roll = self.rng.random()
+            status = "ERROR" if roll < cfg["error_rate"] else (
+                "WARNING" if roll < cfg["error_rate"] + cfg["warning_rate"] else "COMPLETE")
+        sim_id = uuid.uuid4().hex[:12]
+        sim = {
+            "id": sim_id, "user": user, "payload": payload, "status": status, "parent": parent, "children": None,
+            "submitted_at": now, "completes_at": now + duration, "observed_at": None, "fetched_at": None,
+            "alpha": None if status == "ERROR" or payload is None else uuid.uuid4().hex[:7],
+            "message": INVALID_FIELD_MESSAGE.format(field=invalid[0]) if invalid else self.rng.choice(ERROR_MESSAGES),
+        }
+        self.simulations[sim_id] = sim
+        if sim["alpha"]:
+            self.alphas[sim["alpha"]] = sim_id
+        return sim
+
+    def _get_simulation(self, sim_id):
+        sim = self.simulations.get(sim_id)
+        if sim is None:
+            return _json(404, {"detail": "Not found."})
+        if self.rng.random() < self.config["poll_error_rate"]:
+            return 403, {"Content-Type": "text/html"}, b"<html><body><h1>403 Forbidden</h1></body></html>"
+        now = time.time()
+        if now < sim["completes_at"]:
+            elapsed = now - sim["submitted_at"]
+            progress = elapsed / (sim["completes_at"] - sim["submitted_at"])
+            retry_after = min(self.config["progress_retry_after"], sim["completes_at"] - now)
+            return _json(200, {"progress": round(progress, 2)}, {"Retry-After": f"{max(retry_after, 0.1):.1f}"})
+        if sim["observed_at"] is None:
+            sim["observed_at"] = now
+        if sim["children"] is not None:
+            return _json(200, {"id": sim_id, "type": "REGULAR", "status": sim["status"], "children": sim["children"]})
+        payload = sim["payload"]
+        result = {"id": sim_id, "type": payload.get("type", "REGULAR"), "settings": payload.get("settings", {}),
+                  "regular": payload["regular"], "status": sim["status"]}
+        if sim["status"] == "ERROR":
+            result["message"] = sim["message"]
+        else:
+            result["alpha"] = sim["alpha"]
+        return _json(200, result)
+
+    def _get_alpha(self, alpha_id):
+        sim = self.simulations.get(self.alphas.get(alpha_id))
+        now = time.time()
+        if sim is None or now < sim["completes_at"] + self.config["alpha_ready_delay"]:
+            return _json(404, {"detail": "Not found."})
+        if sim["fetched_at"] is None:
+            sim["fetched_at"] = now
+        expr = sim["payload"]["regular"]
+        return _json(200, {
+            "id": alpha_id,
+            "type": "REGULAR",
+            "settings": sim["payload"].get("settings", {}),
+            "regular": {"code": expr},
+            "status": "UNSUBMITTED",
+            "is": self._is_stats(expr, sim["status"], sim["payload"].get("settings")),
+        })
+
+    def _get_recordset(self, alpha_id, name):
+        sim = self.simulations.get(self.alphas.get(alpha_id))
+        now = time.time()
+        ready_at = None if sim is None else sim["completes_at"] + self.config["alpha_ready_delay"]
+        if sim is None or now < ready_at or name not in ("pnl", "yearly-stats"):
+            return _json(404, {"detail": "Not found."})
+        if now < ready_at + self.config["recordset_ready_delay"]:
+            return 200, {"Retry-After": f"{self.config['progress_retry_after']:.1f}"}, b""
+        expr, settings = sim["payload"]["regular"], sim["payload"].get("settings")
+        daily = self._daily_pnl(expr, settings, self._is_stats(expr, sim["status"], settings))
+        if name == "pnl":
+            return _json(200, {
+                "schema": {"name": "pnl", "properties": [{"name": "date", "type": "date"},
+                                                         {"name": "pnl", "type": "amount"}]},
+                "records": [[d.strftime("%Y-%m-%d"), round(v, 2)] for d, v in daily.cumsum().items()],
+            })
+        yearly = daily.groupby(daily.index.year)
+        return _json(200, {
+            "schema": {"name": "yearly-stats", "properties": [{"name": "year", "type": "year"},
+                                                              {"name": "pnl", "type": "amount"},
+                                                              {"name": "sharpe", "type": "decimal"}]},
+            "records": [[str(year), round(float(v.sum()), 2),
+                         round(float(v.mean() / v.std() * 252 ** 0.5), 2) if v.std() > 0 else None]
+                        for year, v in yearly],
+        })
+
+    @staticmethod
+    def _daily_pnl(expr, settings, is_stats):
+        """与 IS sharpe 一致的确定性日 PnL（5 年交易日）"""
+        key = "pnl" + expr + json.dumps(settings or {}, sort_keys=True)
+        rng = random.Random(int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:12], 16))
+        dates = pd.bdate_range(is_stats["startDate"], periods=252 * 5)
+        sd = is_stats["bookSize"] * 0.005
+        mean = is_stats["sharpe"] / 252 ** 0.5 * sd
+        return pd.Series([rng.gauss(mean, sd) for _ in dates], index=dates)
+
+    @staticmethod
+    def _is_stats(expr, status, settings=None):
+        """由表达式与 settings 的哈希生成确定性的 IS 指标（同一 alpha 换一组 settings 结果不同）"""
+        key = expr + json.dumps(settings or {}, sort_keys=True)
+        rng = random.Random(int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:12], 16))
+        sharpe = round(rng.gauss(0.6, 0.8), 2)
+        turnover = round(rng.uniform(0.02, 0.8), 4)
+        returns = round(sharpe * rng.uniform(0.03, 0.08), 4)
+        fitness = round(sharpe * (abs(returns) / max(turnover, 0.125)) ** 0.5, 2)
+        checks = [
+            {"name": "LOW_SHARPE", "result": "PASS" if sharpe >= 1.25 else "FAIL", "limit": 1.25, "value": sharpe},
+            {"name": "LOW_FITNESS", "result": "PASS" if fitness >= 1.0 else "FAIL", "limit": 1.0, "value": fitness},
+            {"name": "HIGH_TURNOVER", "result": "PASS" if turnover <= 0.7 else "FAIL", "limit": 0.7, "value": turnover},
+        ]
+        if status == "WARNING":
+            checks.append({"name": "CONCENTRATED_WEIGHT", "result": "WARNING"})
+        return {
+            "pnl": round(returns * 1e7 * 5, 0),
+            "bookSize": 20000000,
+            "longCount": rng.randint(800, 1600),
+            "shortCount": rng.randint(800, 1600),
+            "turnover": turnover,
+            "returns": returns,
+            "drawdown": round(rng.uniform(0.02, 0.3), 4),
+            "margin": round(returns / max(turnover, 1e-4) / 252, 6),
+            "sharpe": sharpe,
+            "fitness": fitness,
+            "startDate": "2018-01-20",
+            "checks": checks,
+        }
+
+    # =========================
+    # 元数据
+    # =========================
+    @staticmethod
+    def _operators():
+        if OPERATORS_CSV.exists():
+            return pd.read_csv(OPERATORS_CSV).where(lambda df: df.notna(), None).to_dict(orient="records")
+        from evaluator.local_engine import OPERATORS
+        return [{"name": name, "category": "Mock", "scope": ["REGULAR"], "definition": f"{name}(x)",
+                 "description": "", "documentation": None, "level": "ALL"} for name in sorted(OPERATORS)]
+
+    @staticmethod
+    def _data_fields(query):
+        dataset = query.get("dataset.id", "pv1")
+        csv_file = FIELDS_DIR / f"{dataset}.csv"
+        if csv_file.exists():
+            fields = pd.read_csv(csv_file).where(lambda df: df.notna(), None).to_dict(orient="records")
+        else:
+            names = PV_FIELDS if dataset.startswith("pv") else [f"{dataset}_field_{i}" for i in range(120)]
+            fields = [{"id": name, "description": name, "dataset": {"id": dataset, "name": dataset},
+                       "category": {"id": "mock", "name": "Mock"}, "region": query.get("region", "USA"),
+                       "delay": int(query.get("delay", 1)), "universe": query.get("universe", "TOP3000"),
+                       "type": "MATRIX", "coverage": 0.95, "userCount": 0, "alphaCount": 0} for name in names]
+        offset, limit = int(query.get("offset", 0)), int(query.get("limit", 50))
+        return _json(200, {"count": len(fields), "results": fields[offset:offset + limit]})
+
+    # =========================
+    # 压测统计
+    # =========================
+    def stats(self):
+        """alphas/hour、slot 利用率、time-to-result 分位数、每个 alpha 的请求数等"""
+        with self._lock:
+            sims = list(self.simulations.values())
+            requests = Counter(self.requests)
+            users = {s["user"] for s in sims}
+        if not sims:
+            return {"simulations": 0}
+        # 结果按单个 alpha 统计（multi-simulation 的父任务不算），槽位与检测延迟按占槽位的任务统计
+        alphas = [s for s in sims if s["children"] is None]
+        slots = [s for s in sims if s["parent"] is None]
+        start = min(s["submitted_at"] for s in sims)
+        done = [s for s in alphas if (s["fetched_at"] or s["observed_at"]) is not None]
+        end = max([s["fetched_at"] or s["observed_at"] for s in done] or [time.time()])
+        wall = max(end - start, 1e-9)
+        busy = sum(max(0.0, min(s["completes_at"], end) - s["submitted_at"]) for s in slots)
+        ttr = [(s["fetched_at"] or s["observed_at"]) - s["submitted_at"] for s in done]
+        lag = [s["observed_at"] - s["completes_at"] for s in slots if s["observed_at"] is not None]
+        total_requests = sum(requests.values())
+        return {
+            "simulations": len(alphas),
+            "multi_simulations": len(sims) - len(alphas),
+            "first_submitted_at": start,
+            "results": len(done),
+            "wall_seconds": round(wall, 2),
+            "alphas_per_hour": round(len(done) / wall * 3600, 1),
+            "slot_utilisation": round(busy / (wall * self.config["concurrency_limit"] * max(len(users), 1)), 4),
+            "ttr_p50": _percentile(ttr, 50),
+            "ttr_p99": _percentile(ttr, 99),
+            "detect_lag_p50": _percentile(lag, 50),
+            "requests": total_requests,
+            "requests_per_result": round(total_requests / max(len(done), 1), 2),
+            "throttled": sum(n for (_, status), n in requests.items() if status == 429),
+            "errors": sum(s["status"] == "ERROR" for s in alphas),
+            "by_endpoint": {f"{endpoint} {status}": n for (endpoint, status), n in sorted(requests.items())},
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    brain = None
+    protocol_version = "HTTP/1.1"
+
+    def _serve(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, headers, payload = self.brain.handle(self.command, self.path, dict(self.headers), body)
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = _serve
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockBrainServer:
+    """在后台线程中运行的 HTTP 服务，base_url 可直接作为 worldquant_api_base"""
+
+    def __init__(self, host="127.0.0.1", port=0, **config):
+        self.brain = MockBrain(**config)
+        handler = type("MockBrainHandler", (_Handler,), {"brain": self.brain})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_config_arguments(parser):
+    """把 DEFAULT_CONFIG 中的参数注册为命令行选项（--latency-mean 等），未指定的选项为 None"""
+    for key, default in DEFAULT_CONFIG.items():
+        kind = str if isinstance(default, str) else float if isinstance(default, float) or default is None else int
+        parser.add_argument(f"--{key.replace('_', '-')}", dest=key, type=kind, default=None,
+                            help=f"default: {default}")
+
+
+def config_from_args(args):
+    """从 argparse 结果中取出显式指定的 mock 参数"""
+    return {k: v for k, v in vars(args).items() if k in DEFAULT_CONFIG and v is not None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline WorldQuant Brain API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    server = MockBrainServer(args.host, args.port, **config_from_args(args))
+    print(f"🧪 Mock WQ Brain listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.brain.stats(), indent=2))
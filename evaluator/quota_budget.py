@@ -0,0 +1,145 @@
+# quota_budget.py
+"""
+simulation 配额预算：按账号限制每小时 / 每天的提交数，并支持静默时段。
+
+- 计数落在 SQLite（BACKTEST_DIR/quota.db），同一台机器上的多个评估进程共享同一份预算，重启后不会重新计数；
+- 小时 / 天窗口按本地时钟对齐，预算用完时 wait_time() 返回到下一个窗口边界的秒数，
+  调度器停止提交、让在途 simulation 正常结束，到边界时立即恢复；
+- 静默时段（如 "23:50-00:10"）内不提交，跨午夜的时段写成开始时间大于结束时间即可；
+- try_consume() 的检查与记录在同一个 BEGIN IMMEDIATE 事务中，多个进程不会同时通过检查而超支；
+  refund() 删除预扣的那条记录，跨过窗口边界退回时仍退回到原窗口。
+
+配置（config.yaml 或环境变量）：
+    wq_budget_per_hour: 300        # WQ_BUDGET_PER_HOUR，空表示不限
+    wq_budget_per_day: 5000        # WQ_BUDGET_PER_DAY
+    wq_quiet_hours: ["23:50-00:10"]   # WQ_QUIET_HOURS="23:50-00:10,12:00-12:05"
+"""
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+from threading import Lock
+
+from utils.config_loader import ConfigLoader
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BACKTEST_DIR = Path(ConfigLoader.get("backtest_result_dir") or BASE_DIR / "data" / "alpha_db_v2" / "backtest_result")
+BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+QUOTA_DB = BACKTEST_DIR / "quota.db"
+
+
+def parse_quiet_hours(value):
+    """["23:50-00:10", ...] 或 "23:50-00:10,12:00-12:05" -> [(start 分钟, end 分钟), ...]"""
+    if not value:
+        return []
+    items = value.split(",") if isinstance(value, str) else value
+    windows = []
+    for item in items:
+        start, _, end = str(item).strip().partition("-")
+        h1, m1 = (int(x) for x in start.split(":"))
+        h2, m2 = (int(x) for x in end.split(":"))
+        windows.append((h1 * 60 + m1, h2 * 60 + m2))
+    return windows
+
+
+class QuotaBudget:
+    def __init__(self, per_hour=None, per_day=None, quiet_hours=None, db_path=QUOTA_DB):
+        self.per_hour = per_hour
+        self.per_day = per_day
+        self.quiet_hours = parse_quiet_hours(quiet_hours)
+        self._lock = Lock()
+        # isolation_level=None：自己用 BEGIN IMMEDIATE 控制事务，保证检查与记录是原子的
+        self.conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS submissions (
+                account TEXT,
+                ts      REAL,
+                n       INTEGER
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_submissions ON submissions(account, ts)")
+
+    @classmethod
+    def from_config(cls):
+        return cls(ConfigLoader.get("wq_budget_per_hour"), ConfigLoader.get("wq_budget_per_day"),
+                   ConfigLoader.get("wq_quiet_hours"))
+
+    @property
+    def enabled(self):
+        return bool(self.per_hour or self.per_day or self.quiet_hours)
+
+    @property
+    def max_cost(self):
+        """一次提交最多能扣的 simulation 数（小时 / 天预算中较小的一个），不限时返回 None"""
+        limits = [limit for limit in (self.per_hour, self.per_day) if limit]
+        return min(limits) if limits else None
+
+    def _used(self, account, since):
+        row = self.conn.execute("SELECT COALESCE(SUM(n), 0) FROM submissions WHERE account = ? AND ts >= ?",
+                                (account, since)).fetchone()
+        return row[0]
+
+    def _quiet_wait(self, now):
+        """处于静默时段时返回到时段结束的秒数"""
+        minute = now.hour * 60 + now.minute + now.second / 60
+        for start, end in self.quiet_hours:
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return ((end - minute) % (24 * 60)) * 60 or 1.0
+        return 0.0
+
+    def wait_time(self, account, n=1, now=None):
+        """再提交 n 个 simulation 前需要等待的秒数，0 表示预算允许"""
+        with self._lock:
+            return self._wait_time(account, n, now or datetime.now())
+
+    def _wait_time(self, account, n, now):
+        quiet = self._quiet_wait(now)
+        if quiet:
+            return quiet
+        hour_start = now.replace(minute=0, second=0, microsecond=0)
+        day_start = hour_start.replace(hour=0)
+        waits = []
+        if self.per_hour and self._used(account, hour_start.timestamp()) + n > self.per_hour:
+            waits.append((hour_start + timedelta(hours=1) - now).total_seconds())
+        if self.per_day and self._used(account, day_start.timestamp()) + n > self.per_day:
+            waits.append((day_start + timedelta(days=1) - now).total_seconds())
+        return max(waits, default=0.0)
+
+    def try_consume(self, account, n=1):
+        """
+        预算允许时记下 n 次提交，返回 (0, 记录 id)；否则返回 (需要等待的秒数, None)，不记录。
+        n 超过 max_cost 时永远无法满足，直接报错
+        """
+        if self.max_cost is not None and n > self.max_cost:
+            raise ValueError(f"❌ Cost {n} exceeds the simulation budget of {self.max_cost}, it can never be submitted")
+        now = datetime.now()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                wait = self._wait_time(account, n, now)
+                charge = None
+                if wait <= 0:
+                    charge = self.conn.execute("INSERT INTO submissions VALUES (?, ?, ?)",
+                                               (account, now.timestamp(), n)).lastrowid
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return wait, charge
+
+    def refund(self, charge):
+        """提交最终没有成功（未拿到 Location）时退回 try_consume 记下的预扣，预算回到原来的窗口"""
+        with self._lock:
+            self.conn.execute("DELETE FROM submissions WHERE rowid = ?", (charge,))
+
+    def usage(self, account, now=None):
+        now = now or datetime.now()
+        hour_start = now.replace(minute=0, second=0, microsecond=0)
+        with self._lock:
+            return {"hour": self._used(account, hour_start.timestamp()),
+                    "day": self._used(account, hour_start.replace(hour=0).timestamp())}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,265 @@
+# result_store.py
+import csv
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from threading import Lock
+
+from utils.config_loader import ConfigLoader
+from utils.fast_expr import canonical_hash
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BACKTEST_DIR = Path(ConfigLoader.get("backtest_result_dir") or BASE_DIR / "data" / "alpha_db_v2" / "backtest_result")
+BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+RESULT_DB = BACKTEST_DIR / "results.db"
+
+FIELDNAMES = ["alpha", "sharpe", "turnover", "fitness", "returns", "drawdown", "margin"]
+# 未通过本地静态校验：只是记录，不算已回测（校验器的字段 / 运算符数据更新后重新校验）
+INVALID = "FAILED:INVALID"
+
+
+def expr_hash(expr: str) -> str:
+    """alpha 表达式的规范化哈希，语义等价的表达式（如 add(a,b) 与 b + a）得到相同的键"""
+    return canonical_hash(expr)
+
+
+def settings_hash(settings: dict) -> str:
+    """simulation settings 的哈希（键顺序无关）"""
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def row_status(row: dict) -> str:
+    """从 CSV 行推断回测状态：失败行的 margin 列记录了 FAILED:xxx / FIX_FAIL_xxx"""
+    margin = row.get("margin")
+    if isinstance(margin, str) and (margin.startswith("FAILED") or margin.startswith("FIX_FAIL")):
+        return margin
+    return "COMPLETE"
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ResultStore:
+    """
+    全局回测结果库（SQLite），以 (表达式哈希, settings 哈希) 为主键。
+    所有模板共用一个库，同一表达式无论来自哪个模板都只回测一次；
+    WAL 模式 + 进程内锁保证多线程 / 多进程并发写入安全。
+    """
+
+    def __init__(self, db_path=RESULT_DB):
+        self._lock = Lock()
+        self.conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                expr_hash     TEXT NOT NULL,
+                settings_hash TEXT NOT NULL,
+                alpha         TEXT,
+                template      TEXT,
+                settings      TEXT,
+                sharpe        REAL,
+                turnover      REAL,
+                fitness       REAL,
+                returns       REAL,
+                drawdown      REAL,
+                margin        TEXT,
+                status        TEXT,
+                created_at    REAL,
+                PRIMARY KEY (expr_hash, settings_hash)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_results_template ON results(template)")
+        # 已导入结果库的旧版回测 CSV（结果库出现之前写出的结果），每个文件只导入一次
+        self.conn.execute("CREATE TABLE IF NOT EXISTS imported_csv (path TEXT PRIMARY KEY, imported_at REAL)")
+        # 被提前终止规则淘汰的模板（见 early_stop.py）
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS retired_templates (
+                template   TEXT PRIMARY KEY,
+                reason     TEXT,
+                stats      TEXT,
+                retired_at REAL
+            )
+        """)
+        self.conn.commit()
+
+    def is_finished(self, expr: str, settings: dict) -> bool:
+        """主键索引查询，判断该表达式在该 settings 下是否已回测（本地校验失败的记录不算）"""
+        with self._lock:
+            cur = self.conn.execute(
+                "SELECT 1 FROM results WHERE expr_hash = ? AND settings_hash = ? AND status != ?",
+                (expr_hash(expr), settings_hash(settings), INVALID),
+            )
+            return cur.fetchone() is not None
+
+    def put(self, template: str, settings: dict, row: dict):
+        """写入一条回测结果，row 与回测 CSV 的列一致"""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    expr_hash(row["alpha"]), settings_hash(settings), row["alpha"], template,
+                    json.dumps(settings, sort_keys=True),
+                    row.get("sharpe"), row.get("turnover"), row.get("fitness"),
+                    row.get("returns"), row.get("drawdown"),
+                    None if row.get("margin") is None else str(row.get("margin")),
+                    row_status(row), time.time(),
+                ),
+            )
+            self.conn.commit()
+
+    def import_csv(self, csv_path, template: str, settings: dict) -> int:
+        """
+        把结果库出现之前的旧版回测 CSV 导入结果库（已有的结果不覆盖），返回导入的行数；
+        每个文件只读取一次，之后判断是否已回测只查结果库
+        """
+        csv_path = Path(csv_path)
+        with self._lock:
+            done = self.conn.execute("SELECT 1 FROM imported_csv WHERE path = ?", (str(csv_path),)).fetchone()
+        if done:
+            return 0
+        rows = []
+        if csv_path.exists():
+            with open(csv_path, "r", encoding="utf-8") as f:
+                rows = [row for row in csv.DictReader(f) if row.get("alpha")]
+        s_hash, s_json, now = settings_hash(settings), json.dumps(settings, sort_keys=True), time.time()
+        with self._lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(expr_hash(row["alpha"]), s_hash, row["alpha"], template, s_json,
+                  _to_float(row.get("sharpe")), _to_float(row.get("turnover")), _to_float(row.get("fitness")),
+                  _to_float(row.get("returns")), _to_float(row.get("drawdown")), row.get("margin") or None,
+                  row_status(row), now) for row in rows])
+            self.conn.execute("INSERT OR REPLACE INTO imported_csv VALUES (?, ?)", (str(csv_path), now))
+            self.conn.commit()
+            return self.conn.total_changes - before - 1
+
+    def get(self, expr: str, settings: dict):
+        """该表达式在该 settings 下的回测结果（dict），未回测时返回 None"""
+        with self._lock:
+            cur = self.conn.execute(
+                "SELECT alpha, sharpe, turnover, fitness, returns, drawdown, margin, status FROM results "
+                "WHERE expr_hash = ? AND settings_hash = ?", (expr_hash(expr), settings_hash(settings)))
+            row = cur.fetchone()
+        return dict(zip(FIELDNAMES + ["status"], row)) if row else None
+
+    def completed_alphas(self, settings: dict = None, limit=None, template: str = None):
+        """已成功回测的 alpha 表达式，按 fitness 从高到低；settings 为 None 时不区分 settings"""
+        sql = "SELECT alpha FROM results WHERE status = 'COMPLETE' AND fitness IS NOT NULL"
+        args = []
+        if settings is not None:
+            sql += " AND settings_hash = ?"
+            args.append(settings_hash(settings))
+        if template is not None:
+            sql += " AND template = ?"
+            args.append(template)
+        sql += " ORDER BY fitness DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        with self._lock:
+            return [row[0] for row in self.conn.execute(sql, args).fetchall()]
+
+    def template_results(self, settings: dict = None):
+        """所有结果的 (template, status, sharpe, fitness)，供模板预算分配器统计"""
+        sql = "SELECT template, status, sharpe, fitness FROM results"
+        args = []
+        if settings is not None:
+            sql += " WHERE settings_hash = ?"
+            args.append(settings_hash(settings))
+        with self._lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    def template_summary(self, template: str) -> dict:
+        """单个模板的结果统计：总数、失败数、完成数、平均 / 最好 fitness"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*), SUM(status != 'COMPLETE'), SUM(status = 'COMPLETE' AND fitness IS NOT NULL), "
+                "AVG(CASE WHEN status = 'COMPLETE' THEN fitness END), "
+                "MAX(CASE WHEN status = 'COMPLETE' THEN fitness END) FROM results WHERE template = ?",
+                (template,)).fetchone()
+        return {"n": row[0], "errors": row[1] or 0, "completed": row[2] or 0,
+                "mean_fitness": row[3], "best_fitness": row[4]}
+
+    def mean_fitness_by_template(self, min_completed: int = 1) -> dict:
+        """各模板已完成结果的平均 fitness（至少 min_completed 条）"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT template, AVG(fitness) FROM results WHERE status = 'COMPLETE' AND fitness IS NOT NULL "
+                "GROUP BY template HAVING COUNT(*) >= ?", (min_completed,)).fetchall()
+        return dict(rows)
+
+    def retire(self, template: str, reason: str, stats: dict = None):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO retired_templates VALUES (?, ?, ?, ?)",
+                              (template, reason, json.dumps(stats or {}), time.time()))
+            self.conn.commit()
+
+    def unretire(self, template: str) -> bool:
+        with self._lock:
+            cur = self.conn.execute("DELETE FROM retired_templates WHERE template = ?", (template,))
+            self.conn.commit()
+            return cur.rowcount > 0
+
+    def retired_reason(self, template: str):
+        """模板被淘汰的原因，未淘汰时返回 None"""
+        with self._lock:
+            row = self.conn.execute("SELECT reason FROM retired_templates WHERE template = ?",
+                                    (template,)).fetchone()
+        return row[0] if row else None
+
+    def retired_templates(self) -> dict:
+        with self._lock:
+            rows = self.conn.execute("SELECT template, reason FROM retired_templates ORDER BY retired_at").fetchall()
+        return dict(rows)
+
+    def export_csv(self, out_csv, template=None):
+        """导出为与旧版 *_backtest.csv 相同格式的 CSV"""
+        sql = f"SELECT {', '.join(FIELDNAMES)} FROM results"
+        args = []
+        if template is not None:
+            sql += " WHERE template = ?"
+            args.append(template)
+        sql += " ORDER BY created_at"
+        with self._lock:
+            rows = self.conn.execute(sql, args).fetchall()
+        with open(out_csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDNAMES)
+            writer.writerows(rows)
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class ResultWriter:
+    """
+    与 csv.DictWriter 接口兼容的写入器：每条结果同时追加到模板自己的 CSV（兼容旧流程）
+    并写入全局结果库。可以被多个线程同时调用（异步评估器的读取线程与事件循环）。
+    """
+
+    def __init__(self, writer, csv_file, store: ResultStore, template: str, settings: dict):
+        self.writer = writer
+        self.csv_file = csv_file
+        self.store = store
+        self.template = template
+        self.settings = settings
+        self._lock = Lock()
+
+    def writeheader(self):
+        self.writer.writeheader()
+
+    def writerow(self, row: dict):
+        with self._lock:
+            self.writer.writerow(row)
+            self.csv_file.flush()
+        self.store.put(self.template, self.settings, row)
@@ -0,0 +1,214 @@
+# select_candidates.py
+"""
+回测前的相关性感知候选筛选。
+
+同一模板的展开高度相关，逐个回测相当于把配额花在近似克隆上。本模块位于 generate_alpha 与 evaluator 之间：
+1. 用本地引擎 + local_metrics 计算每个 alpha 的日收益序列（PnL 代理）与本地 fitness；
+2. 以已回测成功的 alpha（ResultStore）作为初始集合；
+3. 按本地 fitness 从高到低贪心选择，与已选集合的最大 |相关系数| 低于阈值才入选。
+
+已选集合较小时精确计算相关性；超过 EXACT_LIMIT 后改用随机投影（signed random projection LSH）
+索引只与同桶的候选比较，复杂度与已选集合大小基本无关，代价是少量高相关对可能漏检。
+
+输出与输入格式相同的 alpha 文件（保存在 selected_alphas 目录、文件名不变），现有评估入口可直接使用。
+只有配置了真实面板数据（local_panels_npz）时才筛选：合成数据上的相关性与 fitness 与真实表现无关，
+未配置时 select_candidates() 直接跳过，selected_or_original() 也只返回原文件。
+"""
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from evaluator.local_data import configured_panels_path, configured_source
+from evaluator.local_metrics import LocalMetrics
+from evaluator.result_store import ResultStore
+from utils.alpha_file import AlphaFileWriter, alpha_files, is_jsonl, iter_items, read_header
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+ALPHA_DB = BASE_DIR / "data" / "alpha_db_v2" / "all_alphas"
+SELECTED_DIR = BASE_DIR / "data" / "alpha_db_v2" / "selected_alphas"
+
+CORR_THRESHOLD = 0.7     # 与平台自相关检查的阈值一致
+EXACT_LIMIT = 2000       # 已选集合小于该规模时精确计算
+MAX_SIMULATED = 5000     # 最多取多少个已回测 alpha 作为初始集合
+
+
+def _unit(pnl):
+    """日收益序列 -> 去均值后的单位向量，两条序列的点积即相关系数"""
+    v = np.nan_to_num(np.asarray(pnl, dtype=np.float32))
+    v = v - v.mean()
+    norm = np.linalg.norm(v)
+    return v / norm if norm > 0 else None
+
+
+class RandomProjectionIndex:
+    """
+    signed random projection LSH：每张表用 n_bits 个随机超平面把向量映射到桶，
+    余弦相近的向量大概率落入同一个桶。|相关| 检索时同时查询 v 与 -v 的桶。
+    """
+
+    def __init__(self, dim, n_bits=8, n_tables=16, seed=0):
+        rng = np.random.default_rng(seed)
+        self.planes = rng.normal(size=(n_tables, n_bits, dim)).astype(np.float32)
+        self.powers = 1 << np.arange(n_bits)
+        self.tables = [defaultdict(list) for _ in range(n_tables)]
+
+    def _codes(self, v):
+        return ((self.planes @ v) > 0).astype(np.int64) @ self.powers
+
+    def add(self, idx, v):
+        for table, code in zip(self.tables, self._codes(v)):
+            table[code].append(idx)
+
+    def candidates(self, v):
+        found = set()
+        for codes in (self._codes(v), self._codes(-v)):
+            for table, code in zip(self.tables, codes):
+                found.update(table.get(code, ()))
+        return found
+
+
+class DiversitySelector:
+    """维护已选 PnL 向量集合，判断新候选与集合的最大 |相关|"""
+
+    def __init__(self, dim, threshold=CORR_THRESHOLD, exact_limit=EXACT_LIMIT, seed=0):
+        self.threshold = threshold
+        self.exact_limit = exact_limit
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.size = 0
+        self.index = RandomProjectionIndex(dim, seed=seed)
+
+    def max_corr(self, v):
+        if self.size == 0:
+            return 0.0
+        if self.size <= self.exact_limit:
+            return float(np.abs(self.vectors[:self.size] @ v).max())
+        candidates = self.index.candidates(v)
+        if not candidates:
+            return 0.0
+        return float(np.abs(self.vectors[list(candidates)] @ v).max())
+
+    def add(self, v):
+        if self.size == len(self.vectors):
+            grown = np.empty((max(64, 2 * self.size), self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size] = v
+        self.index.add(self.size, v)
+        self.size += 1
+
+    def offer(self, v):
+        """与已选集合的最大 |相关| 低于阈值则加入并返回 True"""
+        if self.max_corr(v) >= self.threshold:
+            return False
+        self.add(v)
+        return True
+
+
+def _load_items(alphas_json_file):
+    header = read_header(alphas_json_file)
+    if header is None:
+        return {}, []
+    return header, list(iter_items(alphas_json_file))
+
+
+def _save_items(out_file, header, items):
+    """与输入相同的格式写出：.jsonl 逐行写，旧的 .json 整体写"""
+    if is_jsonl(out_file):
+        # 原子替换：重新筛选时正在读取旧文件的评估器不受影响，工作队列按 inode 变化重新切段
+        with AlphaFileWriter(out_file, header, atomic=True) as writer:
+            for item in items:
+                writer.write(item)
+        return
+    with open(out_file, "w", encoding="utf-8") as f:
+        json.dump({**header, "GeneratedAlphas": items}, f, indent=2, ensure_ascii=False)
+
+
+def select_candidates(alphas_json_file, threshold=CORR_THRESHOLD, max_alphas=None, min_fitness=None,
+                      keep_unscored=True, source=None, settings=None, out_file=None):
+    """
+    从 alphas JSON 中选出低相关的子集，写入 SELECTED_DIR/<同名文件> 并返回输出路径。
+    min_fitness: 本地 fitness 低于该值的直接丢弃；keep_unscored: 本地无法计算的 alpha 是否原样保留（排在最后）。
+    """
+    start = time.time()
+    alphas_json_file = Path(alphas_json_file)
+    if source is None:
+        source = configured_source()
+        if source is None:
+            print(f"⏭️ 未配置 local_panels_npz，跳过本地筛选: {alphas_json_file.name}")
+            return None
+    header, items = _load_items(alphas_json_file)
+    if not items:
+        print(f"⚠️ No alphas in {alphas_json_file}")
+        return None
+    metrics = LocalMetrics(source, settings)
+    dim = metrics.returns.shape[0]
+    selector = DiversitySelector(dim, threshold)
+
+    # === 已回测 alpha 作为初始集合 ===
+    store = ResultStore()
+    simulated = store.completed_alphas(metrics.settings, limit=MAX_SIMULATED)
+    store.close()
+    for _, pnl in metrics.score_pnl(simulated):
+        v = None if pnl is None else _unit(pnl)
+        if v is not None:
+            selector.add(v)
+    n_seed = selector.size
+
+    # === 本地打分 ===
+    scored, unscored = [], []
+    for item, (row, pnl) in zip(items, metrics.score_pnl(item["alpha"] for item in items)):
+        v = None if pnl is None else _unit(pnl)
+        if v is None or row["fitness"] is None:
+            unscored.append(item)
+        elif min_fitness is None or row["fitness"] >= min_fitness:
+            scored.append((row["fitness"], item, v))
+    scored.sort(key=lambda x: x[0], reverse=True)
+
+    # === 贪心选择 ===
+    selected = []
+    rejected = 0
+    for fitness, item, v in scored:
+        if max_alphas is not None and len(selected) >= max_alphas:
+            break
+        if selector.offer(v):
+            selected.append(item)
+        else:
+            rejected += 1
+    if keep_unscored:
+        room = len(unscored) if max_alphas is None else max(0, max_alphas - len(selected))
+        selected.extend(unscored[:room])
+
+    if out_file is None:
+        SELECTED_DIR.mkdir(parents=True, exist_ok=True)
+        out_file = SELECTED_DIR / alphas_json_file.name
+    _save_items(out_file, header, selected)
+
+    print(f"🎯 Selected {len(selected)}/{len(items)} alphas from {alphas_json_file.name} "
+          f"(seeded with {n_seed} simulated, {rejected} rejected as correlated >= {threshold}, "
+          f"{len(unscored)} not scorable locally) in {time.time() - start:.1f}s -> {out_file}")
+    return out_file
+
+
+def selected_or_original(alphas_json_file):
+    """
+    评估入口使用：存在筛选结果时返回筛选后的文件，否则返回原文件。
+    未配置真实面板数据，或筛选结果早于原文件（原文件之后被重新生成）时忽略筛选结果
+    """
+    selected = SELECTED_DIR / Path(alphas_json_file).name
+    if configured_panels_path() is None or not selected.exists():
+        return alphas_json_file
+    if selected.stat().st_mtime < Path(alphas_json_file).stat().st_mtime:
+        print(f"⚠️ 筛选结果早于 {Path(alphas_json_file).name}，使用原文件")
+        return alphas_json_file
+    return selected
+
+
+if __name__ == "__main__":
+    import sys
+
+    files = [Path(p) for p in sys.argv[1:]] or alpha_files(ALPHA_DB)
+    for json_file in files:
+        select_candidates(json_file)
@@ -0,0 +1,176 @@
+# session_pool.py
+"""
+多账号会话池：每个 WQ 账号一个已登录的 AsyncWQClient、一个独立的限流器和自己的并发上限。
+异步评估器每提交一个 alpha（或一个 multi-simulation）前从池中取空闲槽位最多的账号，
+结束后归还，因此吞吐量随账号数线性增长。
+
+账号来自 config.yaml 的 worldquant_accounts（或环境变量 WORLDQUANT_ACCOUNTS），
+未配置时退化为 worldquant_account / worldquant_password 单账号。
+配置了配额预算（quota_budget.py）时，预算用完的账号不再分派新的提交，直到下一个窗口边界。
+"""
+import asyncio
+import time
+
+import httpx
+
+from utils.config_loader import ConfigLoader
+from utils.rate_limiter import get_limiter
+from utils.wq_client import AsyncWQClient
+
+
+class AccountSession:
+    """单个账号的会话、限流器与配额统计"""
+
+    def __init__(self, account, password, concurrency):
+        self.name = account
+        self.password = password
+        self.concurrency = concurrency
+        self.limiter = get_limiter(f"wq:{account}")
+        self.client = None
+        self.in_flight = 0
+        self.active = False
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "limit_hits": 0}
+
+    @property
+    def free(self):
+        return self.concurrency - self.in_flight if self.active else 0
+
+    async def open(self):
+        # 会话过期（401）时 AsyncWQClient 自动重新登录，请求带默认超时与断路器
+        self.client = AsyncWQClient(self.name, self.password, pool_size=self.concurrency)
+        return await self.sign_in()
+
+    async def sign_in(self):
+        """登录，cookie 保存在 client 中"""
+        try:
+            resp = await self.client.sign_in()
+        except httpx.HTTPError as e:
+            print(f"❌ Login failed for {self.name}: {e}")
+            self.active = False
+            return False
+        print(f"Login status ({self.name}): {resp.status_code}")
+        self.active = resp.status_code in (200, 201)
+        return self.active
+
+    def on_limit_hit(self):
+        """服务端报告并发已满：说明该账号实际可用槽位少于配置值（例如被其他进程占用），收缩一个"""
+        self.stats["limit_hits"] += 1
+        if self.concurrency > 1:
+            self.concurrency -= 1
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+
+class SessionPool:
+    """
+    按空闲槽位分派账号；acquire() 在所有账号都占满时等待任意一个账号释放，
+    所有账号预算都用完时等待到最早的窗口边界
+    """
+
+    def __init__(self, accounts, concurrency=15, budget=None):
+        self.sessions = [AccountSession(a["account"], a["password"], int(a.get("concurrency") or concurrency))
+                         for a in accounts]
+        self.budget = budget if budget is not None and budget.enabled else None
+        self.draining = False
+        self._paused_until = 0.0
+        self._cond = asyncio.Condition()
+        self._charges = {}  # 调用 acquire() 的任务 -> 预扣预算的记录 id，提交失败时按它退回
+
+    @classmethod
+    def from_config(cls, concurrency=15, budget=None):
+        accounts = ConfigLoader.get("worldquant_accounts") or [{
+            "account": ConfigLoader.get("worldquant_account"),
+            "password": ConfigLoader.get("worldquant_password"),
+        }]
+        return cls(accounts, concurrency, budget)
+
+    async def __aenter__(self):
+        results = await asyncio.gather(*[s.open() for s in self.sessions])
+        if not any(results):
+            await self.close()
+            raise RuntimeError("❌ No WQ account could sign in")
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await asyncio.gather(*[s.close() for s in self.sessions])
+
+    @property
+    def active(self):
+        return [s for s in self.sessions if s.active]
+
+    @property
+    def capacity(self):
+        """所有已登录账号的槽位总数"""
+        return sum(s.concurrency for s in self.active)
+
+    def get(self, name):
+        """按账号名取会话（用于恢复 journal 中的在途 simulation），找不到时返回 None"""
+        return next((s for s in self.active if s.name == name), None)
+
+    async def acquire(self, preferred=None, cost=0):
+        """
+        占用一个槽位并返回对应账号：优先 preferred（恢复在途 simulation 时必须用提交它的账号），
+        否则取空闲槽位最多的账号，相同时取本次提交最少的账号。
+        无论 cost 多少都只占一个槽位（multi-simulation 是一个并发 simulation）；
+        cost 为本次提交包含的 alpha 数，从该账号的预算中预扣；drain() 之后新的提交返回 None
+        """
+        async with self._cond:
+            while True:
+                if self.draining and cost:
+                    return None
+                if preferred is not None and preferred.active:
+                    candidates = [preferred]
+                else:
+                    candidates = [s for s in self.active if s.free > 0]
+                wait = None
+                for session in sorted(candidates, key=lambda s: (s.free, -s.stats["submitted"]), reverse=True):
+                    delay, charge = self.budget.try_consume(session.name, cost) if self.budget and cost else (0.0, None)
+                    if delay <= 0:
+                        session.in_flight += 1
+                        if charge is not None:
+                            self._charges[asyncio.current_task()] = charge
+                        return session
+                    wait = delay if wait is None else min(wait, delay)
+                if wait is None:
+                    await self._cond.wait()
+                    continue
+                # 所有有空闲槽位的账号预算都已用完：停止提交，在途任务照常结束，到窗口边界再恢复
+                if time.time() + wait > self._paused_until + 1:
+                    self._paused_until = time.time() + wait
+                    print(f"⏸ Simulation budget exhausted, resuming in {wait / 60:.1f} min")
+                try:
+                    await asyncio.wait_for(self._cond.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, session):
+        self._charges.pop(asyncio.current_task(), None)
+        async with self._cond:
+            session.in_flight -= 1
+            self._cond.notify_all()
+
+    def refund(self, session):
+        """当前任务 acquire() 时预扣的预算没有用掉（提交失败）时退回"""
+        charge = self._charges.pop(asyncio.current_task(), None)
+        if self.budget and charge is not None:
+            self.budget.refund(charge)
+
+    async def drain(self):
+        """停止分派新的提交，等待中的 acquire() 立即返回 None；在途 simulation 不受影响"""
+        async with self._cond:
+            self.draining = True
+            self._cond.notify_all()
+
+    def report(self):
+        for s in self.sessions:
+            state = "active" if s.active else "inactive"
+            usage = self.budget.usage(s.name) if self.budget else None
+            print(f"   👤 {s.name} ({state}, slots={s.concurrency}): submitted={s.stats['submitted']}, "
+                  f"completed={s.stats['completed']}, failed={s.stats['failed']}, "
+                  f"limit hits={s.stats['limit_hits']}, throttled={s.limiter.stats['throttled']}"
+                  + (f", budget used hour={usage['hour']} day={usage['day']}" if usage else ""))
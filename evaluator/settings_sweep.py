@@ -0,0 +1,175 @@
+# settings_sweep.py
+"""
+simulation settings 扫描：为最有希望的 alpha 寻找可提交的 decay / neutralization / truncation 组合。
+
+不回测完整网格（4×4×3 = 48 次 / alpha），而是由粗到细逐维搜索：
+1. 从配置档的基准 settings 出发（结果库中已有的结果直接复用）；
+2. 粗扫：按 SWEEP_GRID 的顺序每次只改变一个维度，取该维度所有网格值中 fitness 最高的一个，再扫下一个维度；
+3. 细扫：对数值维度，在最优值与相邻网格值之间各取一个中点再试一次。
+每个 alpha 至多增加 12 次 simulation。同一步中所有 alpha 的候选并发提交（共享会话池与配额预算），
+结果按 (表达式哈希, settings 哈希) 写入结果库，重复运行时不会重复回测。
+
+    settings_sweep:                 # config.yaml，可选，覆盖 SWEEP_GRID
+      neutralization: [SUBINDUSTRY, INDUSTRY, SECTOR, MARKET]
+      decay: [0, 4, 10, 20]
+      truncation: [0.01, 0.05, 0.1]
+
+    python -m evaluator.settings_sweep --top 10 [--template NAME] [--profile default]
+
+每个 (alpha, settings) 的结果写入 backtest_result/settings_sweep.csv，结束时输出每个 alpha 的最优 settings。
+"""
+import argparse
+import asyncio
+import csv
+
+from evaluator.backtest_with_wq_async import BACKTEST_DIR, SlidingWindowScheduler
+from evaluator.quota_budget import QuotaBudget
+from evaluator.result_store import FIELDNAMES, ResultStore, settings_hash
+from evaluator.session_pool import SessionPool
+from evaluator.sim_settings import get_settings, settings_label
+from utils.config_loader import ConfigLoader
+
+SWEEP_CSV = BACKTEST_DIR / "settings_sweep.csv"
+SWEEP_TEMPLATE = "settings_sweep"   # 扫描结果在结果库中的 template，不计入各模板的统计
+SWEEP_GRID = {
+    "neutralization": ["SUBINDUSTRY", "INDUSTRY", "SECTOR", "MARKET"],
+    "decay": [0, 4, 10, 20],
+    "truncation": [0.01, 0.05, 0.1],
+}
+
+
+def midpoints(grid, best):
+    """细扫候选：最优值与相邻网格值之间的中点（decay 取整数）"""
+    values = sorted(grid)
+    if best not in values:
+        return []
+    i = values.index(best)
+    neighbours = values[max(i - 1, 0):i] + values[i + 1:i + 2]
+    points = []
+    for v in neighbours:
+        mid = (best + v) / 2
+        mid = int(round(mid)) if all(isinstance(x, int) for x in values) else round(mid, 4)
+        if mid not in (best, v):
+            points.append(mid)
+    return points
+
+
+def fitness_of(result):
+    if not result or result.get("status") != "COMPLETE" or result.get("fitness") is None:
+        return float("-inf")
+    return result["fitness"]
+
+
+class _SweepWriter:
+    """SlidingWindowScheduler 的 writer：结果写入结果库，并在扫描 CSV 中附上 settings"""
+
+    def __init__(self, store, settings, csv_writer, csv_file):
+        self.store = store
+        self.settings = settings
+        self.csv_writer = csv_writer
+        self.csv_file = csv_file
+
+    def writerow(self, row):
+        self.store.put(SWEEP_TEMPLATE, self.settings, row)
+        self.csv_writer.writerow(dict(row, settings=settings_label(self.settings)))
+        self.csv_file.flush()
+
+
+class SettingsSweep:
+    def __init__(self, store, pool, grid=None, csv_path=SWEEP_CSV):
+        self.store = store
+        self.pool = pool
+        self.grid = grid or ConfigLoader.get("settings_sweep") or SWEEP_GRID
+        self.csv_file = open(csv_path, "a", newline="", encoding="utf-8")
+        self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=FIELDNAMES + ["settings"], extrasaction="ignore")
+        if self.csv_file.tell() == 0:
+            self.csv_writer.writeheader()
+        self.simulated = 0
+
+    async def evaluate(self, pairs):
+        """回测 [(alpha, settings), ...] 中尚未回测过的组合：每种 settings 一个调度器，共享会话池并发运行"""
+        groups = {}
+        for alpha, settings in pairs:
+            if self.store.is_finished(alpha, settings):
+                continue
+            key = settings_hash(settings)
+            groups.setdefault(key, (settings, []))[1].append(alpha)
+        schedulers, runs = [], []
+        for settings, alphas in groups.values():
+            writer = _SweepWriter(self.store, settings, self.csv_writer, self.csv_file)
+            scheduler = SlidingWindowScheduler(self.pool, writer, settings=settings)
+            schedulers.append(scheduler)
+            runs.append(scheduler.run([(i, alpha, None) for i, alpha in enumerate(dict.fromkeys(alphas), 1)]))
+        await asyncio.gather(*runs)
+        self.simulated += sum(s.stats["submitted"] for s in schedulers)
+
+    async def _step(self, best, candidates_for):
+        """对每个 alpha 回测 candidates_for(当前最优 settings) 给出的候选，并更新最优 settings"""
+        pairs = [(alpha, c) for alpha, (settings, _) in best.items() for c in candidates_for(settings)]
+        await self.evaluate(pairs)
+        for alpha, settings in pairs:
+            fitness = fitness_of(self.store.get(alpha, settings))
+            if fitness > best[alpha][1]:
+                best[alpha] = (settings, fitness)
+
+    async def run(self, alphas, base_settings):
+        """返回 {alpha: (最优 settings, fitness)}"""
+        await self.evaluate([(alpha, base_settings) for alpha in alphas])
+        best = {alpha: (base_settings, fitness_of(self.store.get(alpha, base_settings))) for alpha in alphas}
+
+        for dim, values in self.grid.items():
+            print(f"🔭 Coarse sweep: {dim} in {values}")
+            await self._step(best, lambda s, d=dim, vs=values: [dict(s, **{d: v}) for v in vs if v != s.get(d)])
+
+        for dim, values in self.grid.items():
+            if all(isinstance(v, (int, float)) for v in values):
+                print(f"🔬 Fine sweep: {dim}")
+                await self._step(best, lambda s, d=dim, vs=values: [dict(s, **{d: v})
+                                                                    for v in midpoints(vs, s.get(d))])
+        return best
+
+    def close(self):
+        self.csv_file.close()
+
+
+async def _sweep(top, template, profile, concurrency):
+    base = get_settings(profile)
+    store = ResultStore()
+    alphas = store.completed_alphas(base, limit=top, template=template)
+    if not alphas:
+        print("⚠️ 结果库中没有可扫描的 alpha（请先用该配置档回测）")
+        store.close()
+        return None
+    print(f"🔭 Sweeping settings for {len(alphas)} alphas from {settings_label(base)}")
+    budget = QuotaBudget.from_config()
+    try:
+        async with SessionPool.from_config(concurrency, budget) as pool:
+            sweep = SettingsSweep(store, pool)
+            try:
+                best = await sweep.run(alphas, base)
+            finally:
+                sweep.close()
+    finally:
+        budget.close()
+    for alpha in alphas:
+        settings, fitness = best[alpha]
+        base_fitness = fitness_of(store.get(alpha, base))
+        print(f"   🏁 {alpha[:60]}... fitness {base_fitness} -> {fitness} ({settings_label(settings)})")
+    print(f"📊 {sweep.simulated} simulations for {len(alphas)} alphas, results in {SWEEP_CSV}")
+    store.close()
+    return best
+
+
+def run_settings_sweep(top=10, template=None, profile=None, concurrency=15):
+    """对结果库中 fitness 最高的 top 个 alpha 由粗到细扫描 settings，返回 {alpha: (最优 settings, fitness)}"""
+    return asyncio.run(_sweep(top, template, profile, concurrency))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coarse-to-fine simulation settings sweep for the best alphas")
+    parser.add_argument("--top", type=int, default=10, help="number of best alphas to sweep")
+    parser.add_argument("--template", help="only sweep alphas from this template")
+    parser.add_argument("--profile", help="settings profile used as the starting point")
+    parser.add_argument("--concurrency", type=int, default=15)
+    args = parser.parse_args()
+    run_settings_sweep(args.top, args.template, args.profile, args.concurrency)
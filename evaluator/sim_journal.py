@@ -0,0 +1,122 @@
+# sim_journal.py
+import sqlite3
+import time
+from pathlib import Path
+from threading import Lock
+
+from utils.config_loader import ConfigLoader
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BACKTEST_DIR = Path(ConfigLoader.get("backtest_result_dir") or BASE_DIR / "data" / "alpha_db_v2" / "backtest_result")
+BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+JOURNAL_DB = BACKTEST_DIR / "sim_journal.db"
+
+# 日志中的 simulation 状态
+PENDING = "PENDING"
+DONE = "DONE"
+LOST = "LOST"
+
+
+def multi_key(parent_url, index):
+    """multi-simulation 中第 index 个 alpha 的日志 key：所有子 alpha 共用父任务的 progress url"""
+    return f"{parent_url}#{index}"
+
+
+def split_multi_key(key):
+    """multi_key 的逆运算，返回 (progress url, index)；普通 simulation 的 index 为 None"""
+    url, sep, index = key.rpartition("#")
+    if sep and index.isdigit():
+        return url, int(index)
+    return key, None
+
+
+class SimJournal:
+    """
+    在途 simulation 的持久化日志（SQLite）。
+    每次提交成功后立即记录 progress_url，进程被杀后重启时可以继续轮询这些 url，
+    而不是重新提交 alpha，避免同一个 alpha 消耗两次 simulation 配额。
+    """
+
+    def __init__(self, db_path=JOURNAL_DB):
+        self._lock = Lock()
+        self.conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS simulations (
+                progress_url TEXT PRIMARY KEY,
+                sim_id       TEXT,
+                template     TEXT,
+                alpha        TEXT,
+                status       TEXT,
+                submitted_at REAL,
+                finished_at  REAL
+            )
+        """)
+        # 旧版本日志没有 account 列（多账号时记录提交该 simulation 的账号）
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(simulations)")}
+        if "account" not in columns:
+            self.conn.execute("ALTER TABLE simulations ADD COLUMN account TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sim_status ON simulations(status, template)")
+        self.conn.commit()
+
+    def record_submitted(self, template, alpha, progress_url, account=None):
+        """提交成功（拿到 Location）后立即落盘"""
+        sim_id = progress_url.rstrip("/").split("/")[-1]
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO simulations (progress_url, sim_id, template, alpha, status, submitted_at, account) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (progress_url, sim_id, template, alpha, PENDING, time.time(), account),
+            )
+            self.conn.commit()
+
+    def record_multi_submitted(self, template, alphas, parent_url, account=None):
+        """multi-simulation 提交成功后，每个 alpha 以 multi_key(parent_url, i) 落盘"""
+        sim_id = parent_url.rstrip("/").split("/")[-1]
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO simulations (progress_url, sim_id, template, alpha, status, submitted_at, account) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(multi_key(parent_url, i), sim_id, template, alpha, PENDING, now, account)
+                 for i, alpha in enumerate(alphas)],
+            )
+            self.conn.commit()
+
+    def mark_finished(self, progress_url, status=DONE):
+        """结果写入后标记完成；status=LOST 表示服务器上已找不到该 simulation"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE simulations SET status = ?, finished_at = ? WHERE progress_url = ?",
+                (status, time.time(), progress_url),
+            )
+            self.conn.commit()
+
+    def outstanding(self, template=None, multi=True):
+        """
+        返回尚未收集结果的 simulation: [(alpha, progress_url), ...]
+        multi=False 时不返回 multi-simulation 的子 alpha（只有异步评估器能恢复它们）
+        """
+        sql = "SELECT alpha, progress_url FROM simulations WHERE status = ?"
+        args = [PENDING]
+        if template is not None:
+            sql += " AND template = ?"
+            args.append(template)
+        sql += " ORDER BY submitted_at, progress_url"
+        with self._lock:
+            rows = self.conn.execute(sql, args).fetchall()
+        if not multi:
+            rows = [row for row in rows if split_multi_key(row[1])[1] is None]
+        return rows
+
+    def account_of(self, progress_url):
+        """提交该 simulation 的账号；旧记录或单账号时为 None"""
+        with self._lock:
+            row = self.conn.execute("SELECT account FROM simulations WHERE progress_url = ?",
+                                    (progress_url,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,66 @@
+# sim_settings.py
+"""
+simulation settings 配置档（profile）。
+
+config.yaml 的 settings_profiles 中每个配置档只需写出与 DEFAULT_SETTINGS 不同的键，
+settings_profile（环境变量 SETTINGS_PROFILE）选择评估器使用的配置档，默认 default：
+
+    settings_profile: default
+    settings_profiles:
+      usa_decay4:
+        decay: 4
+        neutralization: INDUSTRY
+
+结果库以 (表达式哈希, settings 哈希) 为主键，不同配置档的结果互不覆盖；
+非 default 配置档的回测 CSV 与 journal 以 "<模板>__<配置档>" 命名，避免与默认配置档的进度混在一起。
+"""
+from utils.config_loader import ConfigLoader
+
+DEFAULT_PROFILE = "default"
+DEFAULT_SETTINGS = {
+    "instrumentType": "EQUITY",
+    "region": "USA",
+    "universe": "TOP3000",
+    "delay": 1,
+    "decay": 0,
+    "neutralization": "SUBINDUSTRY",
+    "truncation": 0.01,
+    "pasteurization": "ON",
+    "unitHandling": "VERIFY",
+    "nanHandling": "OFF",
+    "language": "FASTEXPR",
+    "visualization": False,
+}
+
+
+def load_profiles():
+    """所有配置档：{名称: 完整 settings}，default 可以在 config.yaml 中被覆盖"""
+    profiles = {DEFAULT_PROFILE: dict(DEFAULT_SETTINGS)}
+    for name, overrides in (ConfigLoader.get("settings_profiles") or {}).items():
+        profiles[name] = dict(DEFAULT_SETTINGS, **(overrides or {}))
+    return profiles
+
+
+def active_profile():
+    return ConfigLoader.get("settings_profile") or DEFAULT_PROFILE
+
+
+def get_settings(profile=None):
+    """取配置档对应的 settings（profile 为空时取 settings_profile）"""
+    profile = profile or active_profile()
+    profiles = load_profiles()
+    if profile not in profiles:
+        raise ValueError(f"Unknown settings profile '{profile}', available: {', '.join(profiles)}")
+    return dict(profiles[profile])
+
+
+def run_name(template, profile=None):
+    """回测 CSV / journal 使用的名称：default 配置档保持原名"""
+    profile = profile or active_profile()
+    return template if profile == DEFAULT_PROFILE else f"{template}__{profile}"
+
+
+def settings_label(settings):
+    """便于阅读的 settings 简写，如 USA/TOP3000/D1 decay=4 INDUSTRY trunc=0.05"""
+    return (f"{settings.get('region')}/{settings.get('universe')}/D{settings.get('delay')} "
+            f"decay={settings.get('decay')} {settings.get('neutralization')} trunc={settings.get('truncation')}")
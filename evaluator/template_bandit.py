@@ -0,0 +1,160 @@
+# template_bandit.py
+"""
+模板间的 simulation 预算分配（多臂老虎机）。
+
+每个模板（alpha 文件）是一条臂，每个回测结果是一次奖励：
+    通过提交门槛（sharpe ≥ SHARPE_PASS 且 fitness ≥ FITNESS_PASS）  → 1
+    完成但未通过                                                     → PARTIAL_WEIGHT · clip(fitness / FITNESS_PASS, 0, 1)
+    失败（FAILED / FIX_FAIL）                                         → 0
+工作队列每次领取工作项前，从结果库重新统计各模板的奖励（其他进程 / 机器的结果也会计入），
+再用 Thompson 采样（Beta 后验）或 UCB1 选出下一个要回测的模板，产出高的模板获得更多 simulation，
+从未回测过的模板先被探索；被提前终止规则淘汰的模板（early_stop.py）不再分配。
+
+    template_bandit: thompson | ucb | off      # TEMPLATE_BANDIT，off 表示随机领取
+    python -m evaluator.template_bandit        # 输出各模板的分配报告
+"""
+import argparse
+import csv
+import math
+import random
+from collections import Counter
+from pathlib import Path
+
+from evaluator.result_store import ResultStore
+from utils.config_loader import ConfigLoader
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BACKTEST_DIR = Path(ConfigLoader.get("backtest_result_dir") or BASE_DIR / "data" / "alpha_db_v2" / "backtest_result")
+BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+ALLOCATION_REPORT = BACKTEST_DIR / "template_allocation.csv"
+
+SHARPE_PASS = 1.25
+FITNESS_PASS = 1.0
+PARTIAL_WEIGHT = 0.5
+UCB_C = 1.0
+
+REPORT_FIELDS = ["template", "simulated", "passed", "failed", "mean_reward", "mean_sharpe", "mean_fitness",
+                 "score", "chunks_allocated", "retired"]
+
+
+def template_of(file):
+    """alpha 文件 → 模板名，与结果库中的 template 列一致（筛选前后的文件同名）"""
+    return Path(file).stem
+
+
+def reward(status, sharpe, fitness):
+    if status != "COMPLETE" or fitness is None:
+        return 0.0
+    if sharpe is not None and sharpe >= SHARPE_PASS and fitness >= FITNESS_PASS:
+        return 1.0
+    return PARTIAL_WEIGHT * min(max(fitness / FITNESS_PASS, 0.0), 1.0)
+
+
+class TemplateBandit:
+    def __init__(self, policy="thompson", store=None, c=UCB_C, seed=None):
+        if policy not in ("thompson", "ucb"):
+            raise ValueError(f"Unknown bandit policy: {policy}")
+        self.policy = policy
+        self.store = store
+        self.c = c
+        self.rng = random.Random(seed)
+        self.arms = {}
+        self.allocated = Counter()
+        self.retired = {}
+
+    @classmethod
+    def from_config(cls, store=None):
+        """template_bandit 为 off 时返回 None（工作队列随机领取）"""
+        policy = (ConfigLoader.get("template_bandit") or "thompson").lower()
+        if policy == "off":
+            return None
+        return cls(policy, store or ResultStore())
+
+    def _arm(self, template):
+        return self.arms.setdefault(template, {"n": 0, "reward": 0.0, "passed": 0, "failed": 0,
+                                               "sharpe": 0.0, "fitness": 0.0, "completed": 0})
+
+    def observe(self, template, status, sharpe, fitness):
+        arm = self._arm(template)
+        r = reward(status, sharpe, fitness)
+        arm["n"] += 1
+        arm["reward"] += r
+        arm["passed"] += r == 1.0
+        if status != "COMPLETE":
+            arm["failed"] += 1
+        elif sharpe is not None and fitness is not None:
+            arm["completed"] += 1
+            arm["sharpe"] += sharpe
+            arm["fitness"] += fitness
+
+    def refresh(self):
+        """从结果库重新统计所有模板（包含其他工作进程写入的结果）"""
+        self.arms = {}
+        self.retired = self.store.retired_templates()
+        for template, status, sharpe, fitness in self.store.template_results():
+            if template:
+                self.observe(template, status, sharpe, fitness)
+
+    def score(self, template):
+        """Thompson：Beta(1 + 奖励, 1 + n - 奖励) 的一次采样；UCB1：均值 + c·sqrt(2 ln N / n)"""
+        arm = self._arm(template)
+        n, r = arm["n"], arm["reward"]
+        if self.policy == "thompson":
+            return self.rng.betavariate(1 + r, 1 + n - r)
+        if n == 0:
+            return math.inf
+        total = sum(a["n"] for a in self.arms.values())
+        return r / n + self.c * math.sqrt(2 * math.log(max(total, 1)) / n)
+
+    def choose(self, files):
+        """WorkQueue.lease 的 chooser：从仍有待回测工作项的文件中选一个"""
+        if self.store is not None:
+            self.refresh()
+        # 只剩已淘汰模板时仍返回其中一个，评估器会直接跳过并把工作项标记完成
+        files = [f for f in files if template_of(f) not in self.retired] or files
+        scores = {file: self.score(template_of(file)) for file in files}
+        chosen = max(files, key=lambda f: (scores[f], self.rng.random()))
+        self.allocated[template_of(chosen)] += 1
+        if self.store is not None:
+            self.write_report()
+        return chosen
+
+    def report(self):
+        rows = []
+        for template, arm in sorted(self.arms.items()):
+            n, completed = arm["n"], arm["completed"]
+            rows.append({
+                "template": template,
+                "simulated": n,
+                "passed": arm["passed"],
+                "failed": arm["failed"],
+                "mean_reward": round(arm["reward"] / n, 4) if n else None,
+                "mean_sharpe": round(arm["sharpe"] / completed, 4) if completed else None,
+                "mean_fitness": round(arm["fitness"] / completed, 4) if completed else None,
+                # 后验均值 / UCB 上界，便于对比各模板当前的分配倾向
+                "score": round((1 + arm["reward"]) / (2 + n), 4) if self.policy == "thompson"
+                else round(self.score(template), 4) if n else None,
+                "chunks_allocated": self.allocated.get(template, 0),
+                "retired": self.retired.get(template, ""),
+            })
+        return sorted(rows, key=lambda row: row["simulated"], reverse=True)
+
+    def write_report(self, path=ALLOCATION_REPORT):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.report())
+        return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-template simulation allocation report")
+    parser.add_argument("--policy", choices=["thompson", "ucb"], default="thompson")
+    parser.add_argument("--out", default=str(ALLOCATION_REPORT))
+    args = parser.parse_args()
+    bandit = TemplateBandit(args.policy, ResultStore())
+    bandit.refresh()
+    for row in bandit.report():
+        print(f"   📊 {row['template']}: simulated={row['simulated']}, passed={row['passed']}, "
+              f"failed={row['failed']}, mean reward={row['mean_reward']}, score={row['score']}")
+    print(f"✅ Allocation report written to {bandit.write_report(args.out)}")
@@ -0,0 +1,301 @@
+# ts_kernels.py
+"""
+ts_* 运算符的向量化滚动窗口内核，复杂度 O(T·N)（与窗口长度 d 无关）。
+
+- 求和 / 均值 / 方差 / 偏度 / 协方差 / 相关 / 线性衰减：累加和差分（先按列去均值，减小数值误差）
+- 最大 / 最小 / arg_max / arg_min：van Herk–Gil-Werman 分块前缀 / 后缀极值（strided reshape）
+- ts_rank：按列批量的树状数组（滑动窗口内计数），O(T·N·log T)
+
+NaN 约定与本地引擎一致：前 d-1 行输出 NaN；窗口内 NaN 被忽略；窗口内全部为 NaN 时输出 NaN。
+输入均为 (T, N) 的 float 面板，d 为正整数。
+"""
+import numpy as np
+
+
+def _panel(x):
+    x = np.asarray(x, dtype=float)
+    return x[:, None] if x.ndim == 1 else x
+
+
+def _cumsum0(x):
+    """在最前面补一行 0 的累加和，c[k] = 前 k 行之和"""
+    out = np.zeros((x.shape[0] + 1,) + x.shape[1:])
+    np.cumsum(x, axis=0, out=out[1:])
+    return out
+
+
+def _window_diff(c, d):
+    """由 _cumsum0 结果得到长度为 d 的窗口和，前 d-1 行为 NaN"""
+    T = c.shape[0] - 1
+    out = np.full((T,) + c.shape[1:], np.nan)
+    if d <= T:
+        out[d - 1:] = c[d:] - c[:T - d + 1]
+    return out
+
+
+def _center(x):
+    """按列去均值，返回 (去均值后的面板, 列均值)"""
+    with np.errstate(invalid="ignore"):
+        valid = ~np.isnan(x)
+        cnt = valid.sum(axis=0)
+        col_mean = np.where(cnt > 0, np.where(valid, x, 0).sum(axis=0) / np.maximum(cnt, 1), 0.0)
+    return x - col_mean, col_mean
+
+
+def _moments(x, d, order):
+    """返回 (窗口有效个数 n, [Σx, Σx², ...] 直到 order)，x 已去均值"""
+    valid = ~np.isnan(x)
+    v = np.where(valid, x, 0.0)
+    n = _window_diff(_cumsum0(valid.astype(float)), d)
+    sums = []
+    p = np.ones_like(v)
+    for _ in range(order):
+        p = p * v
+        sums.append(_window_diff(_cumsum0(p), d))
+    return n, sums
+
+
+def _clean_var(var, xc, power=1.0):
+    """
+    累加和差分会留下机器精度量级的残差：相对列整体方差（的 power 次方）可忽略的窗口矩视为 0，
+    避免常数窗口得到 1e-8 量级的标准差。
+    """
+    with np.errstate(invalid="ignore"):
+        scale = np.where(np.isnan(xc), 0.0, xc * xc).mean(axis=0) ** power
+    return np.where(np.isnan(var), np.nan, np.where(np.abs(var) > 1e-9 * scale, var, 0.0))
+
+
+def _safe_div(a, b):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = a / b
+    return np.where(np.isfinite(out), out, np.nan)
+
+
+# =========================
+# 累加和类
+# =========================
+def ts_count_nans(x, d):
+    x = _panel(x)
+    return _window_diff(_cumsum0(np.isnan(x).astype(float)), d)
+
+
+def ts_sum(x, d):
+    x = _panel(x)
+    xc, mu = _center(x)
+    n, (s1,) = _moments(xc, d, 1)
+    return np.where(n > 0, s1 + n * mu, np.nan)
+
+
+def ts_mean(x, d):
+    x = _panel(x)
+    xc, mu = _center(x)
+    n, (s1,) = _moments(xc, d, 1)
+    return _safe_div(s1, n) + mu
+
+
+def ts_std_dev(x, d):
+    x = _panel(x)
+    xc, _ = _center(x)
+    n, (s1, s2) = _moments(xc, d, 2)
+    m = _safe_div(s1, n)
+    return np.sqrt(_clean_var(_safe_div(s2, n) - m * m, xc))
+
+
+def ts_zscore(x, d):
+    return _safe_div(_panel(x) - ts_mean(x, d), ts_std_dev(x, d))
+
+
+def ts_av_diff(x, d):
+    return _panel(x) - ts_mean(x, d)
+
+
+def ts_skewness(x, d):
+    x = _panel(x)
+    xc, _ = _center(x)
+    n, (s1, s2, s3) = _moments(xc, d, 3)
+    m = _safe_div(s1, n)
+    var = _clean_var(_safe_div(s2, n) - m * m, xc)
+    m3 = _clean_var(_safe_div(s3, n) - 3 * m * _safe_div(s2, n) + 2 * m ** 3, xc, power=1.5)
+    return _safe_div(m3, var ** 1.5)
+
+
+def ts_product(x, d):
+    """Π = (-1)^{负数个数} · exp(Σ log|x|)，窗口内有 0 时为 0"""
+    x = _panel(x)
+    valid = ~np.isnan(x)
+    zero = valid & (x == 0)
+    neg = valid & (x < 0)
+    with np.errstate(divide="ignore"):
+        logabs = np.where(valid & ~zero, np.log(np.abs(np.where(valid & ~zero, x, 1.0))), 0.0)
+    n = _window_diff(_cumsum0(valid.astype(float)), d)
+    zeros = _window_diff(_cumsum0(zero.astype(float)), d)
+    negs = _window_diff(_cumsum0(neg.astype(float)), d)
+    with np.errstate(over="ignore"):
+        mag = np.exp(_window_diff(_cumsum0(logabs), d))
+    sign = np.where(np.mod(np.nan_to_num(negs), 2) == 1, -1.0, 1.0)
+    out = np.where(zeros > 0, 0.0, sign * mag)
+    return np.where(n > 0, out, np.nan)
+
+
+def ts_decay_linear(x, d):
+    """权重 d, d-1, ..., 1（今天权重最大），NaN 不计入权重"""
+    x = _panel(x)
+    T = x.shape[0]
+    xc, mu = _center(x)
+    valid = ~np.isnan(xc)
+    v = np.where(valid, xc, 0.0)
+    vf = valid.astype(float)
+    idx = np.arange(T, dtype=float)[:, None]
+    s0 = _window_diff(_cumsum0(v), d)
+    s1 = _window_diff(_cumsum0(idx * v), d)
+    w0 = _window_diff(_cumsum0(vf), d)
+    w1 = _window_diff(_cumsum0(idx * vf), d)
+    base = idx - d  # 窗口内第 i 行的权重为 i - (t - d)
+    num = s1 - base * s0
+    den = w1 - base * w0
+    return np.where(den > 0, _safe_div(num, den) + mu, np.nan)
+
+
+def _pair_moments(x, y, d):
+    x, y = np.broadcast_arrays(_panel(x), _panel(y))
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    xc, _ = _center(np.where(valid, x, np.nan))
+    yc, _ = _center(np.where(valid, y, np.nan))
+    xv, yv = np.where(valid, xc, 0.0), np.where(valid, yc, 0.0)
+    n = _window_diff(_cumsum0(valid.astype(float)), d)
+    sx = _window_diff(_cumsum0(xv), d)
+    sy = _window_diff(_cumsum0(yv), d)
+    sxy = _window_diff(_cumsum0(xv * yv), d)
+    sxx = _window_diff(_cumsum0(xv * xv), d)
+    syy = _window_diff(_cumsum0(yv * yv), d)
+    mx, my = _safe_div(sx, n), _safe_div(sy, n)
+    cov = _safe_div(sxy, n) - mx * my
+    varx = _clean_var(_safe_div(sxx, n) - mx * mx, xc)
+    vary = _clean_var(_safe_div(syy, n) - my * my, yc)
+    return cov, varx, vary
+
+
+def ts_covariance(y, x, d):
+    cov, _, _ = _pair_moments(x, y, d)
+    return cov
+
+
+def ts_corr(x, y, d):
+    cov, varx, vary = _pair_moments(x, y, d)
+    return _safe_div(cov, np.sqrt(varx * vary))
+
+
+# =========================
+# 极值类（van Herk–Gil-Werman）
+# =========================
+def _rolling_extreme(x, d, fill, fn):
+    """
+    x 按 d 分块，块内前缀极值 g 与后缀极值 h；
+    窗口 [t-d+1, t] 的极值 = fn(h[t-d+1], g[t])，每个元素只做常数次比较。
+    """
+    T = x.shape[0]
+    out = np.full(x.shape, fill, dtype=x.dtype)
+    if d > T:
+        return out, False
+    n_blocks = -(-T // d)
+    padded = np.full((n_blocks * d,) + x.shape[1:], fill, dtype=x.dtype)
+    padded[:T] = x
+    blocks = padded.reshape((n_blocks, d) + x.shape[1:])
+    g = fn.accumulate(blocks, axis=1).reshape(padded.shape)
+    h = fn.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    out[d - 1:] = fn(h[:T - d + 1], g[d - 1:T])
+    return out, True
+
+
+def _finish_extreme(x, d, out):
+    n = _window_diff(_cumsum0((~np.isnan(x)).astype(float)), d)
+    return np.where(n > 0, out, np.nan)
+
+
+def ts_max(x, d):
+    x = _panel(x)
+    out, _ = _rolling_extreme(np.where(np.isnan(x), -np.inf, x), d, -np.inf, np.maximum)
+    return _finish_extreme(x, d, out)
+
+
+def ts_min(x, d):
+    x = _panel(x)
+    out, _ = _rolling_extreme(np.where(np.isnan(x), np.inf, x), d, np.inf, np.minimum)
+    return _finish_extreme(x, d, out)
+
+
+def _dense_rank(x):
+    """按列的稠密排名（相同值排名相同，从 1 开始；NaN 排名为 0）"""
+    order = np.argsort(x, axis=0, kind="stable")  # NaN 排在最后
+    xs = np.take_along_axis(x, order, axis=0)
+    new = np.ones(x.shape, dtype=np.int64)
+    new[1:] = xs[1:] != xs[:-1]
+    dense = np.cumsum(new, axis=0)
+    ranks = np.empty_like(dense)
+    np.put_along_axis(ranks, order, dense, axis=0)
+    return np.where(np.isnan(x), 0, ranks)
+
+
+def ts_arg_max(x, d):
+    """窗口内最大值距今的天数（0 表示今天；并列时取最近一次）"""
+    x = _panel(x)
+    T = x.shape[0]
+    t = np.arange(T, dtype=np.int64)[:, None]
+    # 编码 (排名, 时间)：取最大键即同时得到最大值和最近的出现时间
+    keys = np.where(np.isnan(x), -1, _dense_rank(x) * T + t)
+    out, ok = _rolling_extreme(keys, d, np.int64(-1), np.maximum)
+    if not ok:
+        return np.full(x.shape, np.nan)
+    days = (t - out % T).astype(float)
+    days[:d - 1] = np.nan
+    return np.where(out < 0, np.nan, days)
+
+
+def ts_arg_min(x, d):
+    return ts_arg_max(-_panel(x), d)
+
+
+# =========================
+# ts_rank（滑动窗口树状数组）
+# =========================
+def ts_rank(x, d, constant=0):
+    """今天的值在过去 d 天（含今天）中的分位：严格小于今天的有效值个数 / (有效个数 - 1)"""
+    x = _panel(x)
+    T, N = x.shape
+    out = np.full(x.shape, np.nan)
+    if d > T:
+        return out
+    ranks = _dense_rank(x)
+    size = int(ranks.max())
+    steps = max(size.bit_length(), 1)
+    dummy = size + 1  # 越界 / NaN 的更新落到哑行，查询时 i 归零读取恒为 0 的第 0 行
+    tree = np.zeros((size + 2) * N, dtype=np.int64)
+    cols = np.arange(N)
+    n_valid = _window_diff(_cumsum0((~np.isnan(x)).astype(float)), d)
+
+    def update(r, delta):
+        i = np.where(r > 0, r, dummy)
+        for _ in range(steps):
+            tree[i * N + cols] += delta
+            i = i + (i & -i)
+            i = np.where(i > size, dummy, i)
+
+    def prefix(r):
+        i = r.copy()
+        total = np.zeros(N, dtype=np.int64)
+        for _ in range(steps):
+            total += tree[i * N + cols]
+            i = i - (i & -i)
+        return total
+
+    for t in range(T):
+        update(ranks[t], 1)
+        if t >= d:
+            update(ranks[t - d], -1)
+        if t >= d - 1:
+            r = ranks[t]
+            less = prefix(np.maximum(r - 1, 0))
+            n = n_valid[t]
+            val = np.where(n > 1, less / np.maximum(n - 1, 1), np.nan)
+            out[t] = np.where(r > 0, val, np.nan)
+    return out + float(constant)
@@ -0,0 +1,323 @@
+# work_queue.py
+"""
+基于租约（lease）的回测工作队列（SQLite），让多个评估进程 / 多台机器安全地分摊 alpha 文件。
+
+- 每个 alpha 文件按 chunk_size 切成若干 [start, stop) 段，每段是一个工作项；重复入队是幂等的；
+  JSONL 文件入队时记下每段第一条 alpha 的字节偏移，评估器 seek 到该位置读取，处理一段不必从文件开头读起；
+- 工作进程原子地领取一个空闲或租约已过期的工作项，领取时生成新的 token，
+  之后的续约 / 完成都必须带上 token，被别人接管的租约不会被旧持有者误标记完成；
+- 持有租约期间工作进程每 ttl/3 续约一次（backtest_with_wq_async._keep_lease）；进程崩溃后续约停止，租约过期即被其他进程回收；
+- 处理工作项出错时调用 release(lease, error) 交还租约并记录错误；同一工作项已被领取 max_attempts 次仍未完成
+  （出错交还、主动释放或租约过期）时标记为 FAILED，不再被领取，避免反复拖垮工作进程；
+  排除问题后用 --retry-failed 放回队列。
+- enqueue_files() 记下每个文件的 inode / 大小 / 修改时间：文件被重新生成（原子替换后 inode 改变、变短，
+  或旧格式 .json 被改写）时删除其全部工作项并按新文件重新切段，已回测的 alpha 由结果库跳过；
+  已不存在的文件的工作项一并删除。生成中的 JSONL 文件只会变长，不会被误判为重新生成。
+
+多台机器共享时把 work_queue_db（环境变量 WORK_QUEUE_DB）指向同一个文件即可。
+SQLite 依赖文件锁，共享目录需支持 POSIX 锁（NFS 上请确认锁可用）。
+
+    python -m evaluator.work_queue                 # 查看队列状态与失败的工作项
+    python -m evaluator.work_queue --retry-failed  # 失败的工作项重新入队
+"""
+import argparse
+import os
+import random
+import socket
+import sqlite3
+import time
+import uuid
+from collections import namedtuple
+from pathlib import Path
+from threading import Lock
+
+from utils.alpha_file import chunk_offsets, is_jsonl
+from utils.config_loader import ConfigLoader
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BACKTEST_DIR = Path(ConfigLoader.get("backtest_result_dir") or BASE_DIR / "data" / "alpha_db_v2" / "backtest_result")
+BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+WORK_QUEUE_DB = Path(ConfigLoader.get("work_queue_db") or BACKTEST_DIR / "work_queue.db")
+
+# 工作项状态
+PENDING = "PENDING"
+LEASED = "LEASED"
+DONE = "DONE"
+FAILED = "FAILED"
+
+CHUNK_SIZE = 50         # 每个工作项包含的 alpha 数（越小，模板分配器调整越及时）
+LEASE_TTL = 600         # 租约有效期（秒），持有期间每 ttl/3 续约
+MAX_ATTEMPTS = 5
+
+Lease = namedtuple("Lease", ["id", "file", "start", "stop", "token", "attempts", "byte_offset"], defaults=[None])
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(self, db_path=WORK_QUEUE_DB, ttl=LEASE_TTL, max_attempts=MAX_ATTEMPTS):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self._lock = Lock()
+        # isolation_level=None：自己用 BEGIN IMMEDIATE 控制事务，保证领取是原子的
+        self.conn = sqlite3.connect(str(db_path), timeout=60, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS work_items (
+                id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                file          TEXT NOT NULL,
+                start         INTEGER NOT NULL,
+                stop          INTEGER NOT NULL,
+                status        TEXT NOT NULL,
+                owner         TEXT,
+                token         TEXT,
+                lease_expires REAL,
+                attempts      INTEGER DEFAULT 0,
+                created_at    REAL,
+                finished_at   REAL,
+                error         TEXT,
+                byte_offset   INTEGER,
+                UNIQUE(file, start)
+            )
+        """)
+        # 旧版本队列没有 error 列（最近一次处理失败的原因）与 byte_offset 列（为空时评估器从文件开头逐行跳过）
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(work_items)")}
+        if "error" not in columns:
+            self.conn.execute("ALTER TABLE work_items ADD COLUMN error TEXT")
+        if "byte_offset" not in columns:
+            self.conn.execute("ALTER TABLE work_items ADD COLUMN byte_offset INTEGER")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_work_status ON work_items(status, lease_expires)")
+        # 入队时文件的状态，用于识别重新生成的文件
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS queued_files (
+                file     TEXT PRIMARY KEY,
+                inode    INTEGER,
+                size     INTEGER,
+                mtime_ns INTEGER
+            )
+        """)
+
+    # =========================
+    # 入队
+    # =========================
+    def enqueue(self, file, n_alphas, chunk_size=CHUNK_SIZE, offsets=None):
+        """
+        把一个 alpha 文件按 chunk_size 切段入队，返回新增的工作项数；
+        文件已入队时只追加已有工作项之后的新 alpha，已入队的段保持原状态。
+        offsets=(first, positions)：positions 为 chunk_offsets(file, chunk_size, first) 返回的各段字节偏移
+        """
+        now = time.time()
+        with self._lock:
+            before = self.conn.total_changes
+            self.conn.execute("BEGIN IMMEDIATE")
+            queued = self._queued(file)
+            first, positions = offsets if offsets is not None else (None, [])
+            if first != queued:
+                positions = []  # 其他进程同时入队了该文件，偏移不再对应，新段从文件开头逐行跳过
+            rows = []
+            for k, start in enumerate(range(queued, n_alphas, chunk_size)):
+                offset = positions[k] if k < len(positions) else None
+                rows.append((str(file), start, min(start + chunk_size, n_alphas), PENDING, now, offset))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO work_items (file, start, stop, status, created_at, byte_offset) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows)
+            self.conn.execute("COMMIT")
+            return self.conn.total_changes - before
+
+    def enqueue_files(self, files, chunk_size=CHUNK_SIZE):
+        """
+        读取每个 alpha 文件的条数与各段的字节偏移并入队（格式无法识别的文件跳过）；
+        仍在生成中的 JSONL 文件再次入队时只追加新写出的部分，重新生成的文件按新内容重新切段
+        """
+        self.remove_missing()
+        added = 0
+        for file in files:
+            removed = self._check_regenerated(file)
+            if removed:
+                print(f"♻️ {Path(file).name} 已重新生成，移除旧文件的 {removed} 个工作项并重新切段")
+            with self._lock:
+                queued = self._queued(file)
+            positions, n_alphas = chunk_offsets(file, chunk_size, queued)
+            if n_alphas:
+                offsets = (queued, positions) if positions is not None else None
+                added += self.enqueue(file, n_alphas, chunk_size, offsets)
+        return added
+
+    def _check_regenerated(self, file):
+        """
+        比较文件与上次入队时的状态，重新生成时删除其全部工作项，返回删除的条数；同时记下当前状态。
+        检查与删除在同一个事务中，多个进程同时入队时只有一个会删除
+        """
+        stat = os.stat(file)
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT inode, size, mtime_ns FROM queued_files WHERE file = ?",
+                                        (str(file),)).fetchone()
+                removed = 0
+                if row is not None:
+                    inode, size, mtime_ns = row
+                    # JSONL 只追加，旧格式 .json 整体改写
+                    rewritten = stat.st_mtime_ns != mtime_ns and not is_jsonl(file)
+                    if stat.st_ino != inode or stat.st_size < size or rewritten:
+                        removed = self._delete_file(file)
+                self.conn.execute("INSERT OR REPLACE INTO queued_files VALUES (?, ?, ?, ?)",
+                                  (str(file), stat.st_ino, stat.st_size, stat.st_mtime_ns))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return removed
+
+    def remove_missing(self):
+        """删除已不存在的文件（被删除，或旧格式 .json 已被 .jsonl 取代）的工作项，返回删除的条数"""
+        with self._lock:
+            files = [row[0] for row in self.conn.execute(
+                "SELECT file FROM work_items UNION SELECT file FROM queued_files")]
+        removed = 0
+        for file in files:
+            if not Path(file).exists():
+                removed += self.remove_file(file)
+        return removed
+
+    def remove_file(self, file):
+        """
+        删除一个 alpha 文件的全部工作项，返回删除的条数；之后 enqueue_files() 按当前文件重新切段。
+        已删除工作项的持有者续约与完成都会失败，不会误标记新的工作项
+        """
+        with self._lock:
+            return self._delete_file(file)
+
+    def _delete_file(self, file):
+        self.conn.execute("DELETE FROM queued_files WHERE file = ?", (str(file),))
+        return self.conn.execute("DELETE FROM work_items WHERE file = ?", (str(file),)).rowcount
+
+    def _queued(self, file):
+        """该文件已入队的 alpha 条数（最后一个工作项的 stop）"""
+        return self.conn.execute("SELECT COALESCE(MAX(stop), 0) FROM work_items WHERE file = ?",
+                                 (str(file),)).fetchone()[0]
+
+    # =========================
+    # 租约
+    # =========================
+    def lease(self, worker_id=None, ttl=None, chooser=None):
+        """
+        领取一个空闲或租约已过期的工作项，没有可领取的工作项时返回 None。
+        chooser(files) 从仍有可领取工作项的文件中选一个（见 template_bandit.py），领取该文件最靠前的段；
+        chooser 为 None 时随机领取
+        """
+        worker_id = worker_id or default_worker_id()
+        ttl = ttl or self.ttl
+        token = uuid.uuid4().hex
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                # 已领取 max_attempts 次仍未完成（出错交还或租约过期）的工作项直接标记失败
+                self.conn.execute(
+                    "UPDATE work_items SET status = ?, finished_at = ?, lease_expires = NULL "
+                    "WHERE (status = ? OR (status = ? AND lease_expires < ?)) AND attempts >= ?",
+                    (FAILED, now, PENDING, LEASED, now, self.max_attempts))
+                rows = self.conn.execute(
+                    "SELECT id, file, start, stop, attempts, byte_offset FROM work_items "
+                    "WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY file, start",
+                    (PENDING, LEASED, now)).fetchall()
+                row = None
+                if rows and chooser is not None:
+                    chosen = chooser(list(dict.fromkeys(r[1] for r in rows)))
+                    row = next((r for r in rows if r[1] == chosen), None)
+                if rows and row is None:
+                    row = random.choice(rows)
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE work_items SET status = ?, owner = ?, token = ?, lease_expires = ?, attempts = attempts + 1 "
+                    "WHERE id = ?",
+                    (LEASED, worker_id, token, now + ttl, row[0]))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return Lease(row[0], row[1], row[2], row[3], token, row[4] + 1, row[5])
+
+    def _update_leased(self, lease, sql, args):
+        """仅当租约仍由 lease.token 持有时执行更新，返回是否成功"""
+        with self._lock:
+            cur = self.conn.execute(f"{sql} WHERE id = ? AND token = ? AND status = ?",
+                                    (*args, lease.id, lease.token, LEASED))
+            return cur.rowcount == 1
+
+    def renew(self, lease, ttl=None):
+        """续约；返回 False 表示租约已过期并被其他进程接管"""
+        return self._update_leased(lease, "UPDATE work_items SET lease_expires = ?",
+                                   (time.time() + (ttl or self.ttl),))
+
+    def complete(self, lease):
+        return self._update_leased(lease, "UPDATE work_items SET status = ?, finished_at = ?, lease_expires = NULL",
+                                   (DONE, time.time()))
+
+    def release(self, lease, error=None):
+        """
+        交还租约，其他进程可立即领取；该工作项已被领取 max_attempts 次时不再放回队列，直接标记为 FAILED。
+        error 为处理出错的原因（记入 error 列）
+        """
+        exhausted = lease.attempts >= self.max_attempts
+        if exhausted:
+            print(f"❌ 工作项 {lease.id} 已领取 {lease.attempts} 次仍未完成，标记为 FAILED: {error}")
+        return self._update_leased(
+            lease, "UPDATE work_items SET status = ?, lease_expires = NULL, finished_at = ?, error = COALESCE(?, error)",
+            (FAILED if exhausted else PENDING, time.time() if exhausted else None,
+             None if error is None else str(error)))
+
+    def retry_failed(self):
+        """把 FAILED 工作项重新放回队列（次数清零），返回工作项数"""
+        with self._lock:
+            cur = self.conn.execute("UPDATE work_items SET status = ?, attempts = 0, finished_at = NULL "
+                                    "WHERE status = ?", (PENDING, FAILED))
+            return cur.rowcount
+
+    def next_expiry(self):
+        """其他进程仍持有的租约中最早的过期时间，没有时返回 None"""
+        with self._lock:
+            row = self.conn.execute("SELECT MIN(lease_expires) FROM work_items WHERE status = ?", (LEASED,)).fetchone()
+        return row[0]
+
+    # =========================
+    # 状态
+    # =========================
+    def failures(self):
+        """FAILED 工作项：[(file, start, stop, attempts, error), ...]"""
+        with self._lock:
+            return self.conn.execute("SELECT file, start, stop, attempts, error FROM work_items WHERE status = ? "
+                                     "ORDER BY finished_at", (FAILED,)).fetchall()
+
+    def status(self):
+        """各状态工作项数；过期未续约的 LEASED 单独计为 EXPIRED"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT CASE WHEN status = ? AND lease_expires < ? THEN 'EXPIRED' ELSE status END, COUNT(*) "
+                "FROM work_items GROUP BY 1", (LEASED, time.time())).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the evaluator work queue")
+    parser.add_argument("--db", default=str(WORK_QUEUE_DB))
+    parser.add_argument("--retry-failed", action="store_true", help="put FAILED work items back in the queue")
+    args = parser.parse_args()
+    queue = WorkQueue(args.db)
+    if args.retry_failed:
+        print(f"🔁 {queue.retry_failed()} failed work items re-queued")
+    print(f"📋 {args.db}: {queue.status() or 'empty'}")
+    for file, start, stop, attempts, error in queue.failures():
+        print(f"   ❌ {Path(file).name} [{start}, {stop}) after {attempts} attempts: {error}")
+    queue.close()
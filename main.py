@@ -3,12 +3,15 @@ from pathlib import Path
 
 from evaluator.backtest_with_wq import run_backtest_by_wq_api
 from evaluator.backtest_with_wq_mul import run_backtest_mul_by_wq_api
+from evaluator.backtest_with_wq_async import run_backtest_async_by_wq_api
+from evaluator.select_candidates import select_candidates, selected_or_original
 from researcher.construct_prompts import build_wq_knowledge_prompt, build_check_if_blog_helpful, \
     build_blog_to_hypothesis
 from researcher.generate_alpha import generate_alphas_from_template
 from researcher.generate_template import from_post_to_template
 from scraper.preprocess_texts import preprocess_all_html_posts
 from scraper.scrap_posts_from_wq import scrape_new_posts
+from utils.alpha_file import alpha_files
 from utils.template_field_gener import generate_template_fields_v2
 from utils.template_op_gener import generate_template_ops
 from utils.wq_info_loader import OpAndFeature
@@ -35,11 +38,14 @@ if __name__ == "__main__":
         if template_file is None:
             continue
         alphas_file = generate_alphas_from_template(template_file)
+        if alphas_file is not None:
+            # 只在配置了真实面板数据（local_panels_npz）时筛选，否则跳过
+            select_candidates(alphas_file)
 
 
     # alpha evaluator ----------------------------------
     ALPHA_DIR = Path("data/alpha_db_v2/all_alphas")
-    json_files = list(ALPHA_DIR.glob("*.json"))
+    json_files = alpha_files(ALPHA_DIR)
     random.shuffle(json_files)
     for json_file in json_files:
-        backtest_result = run_backtest_mul_by_wq_api(json_file)
+        backtest_result = run_backtest_async_by_wq_api(selected_or_original(json_file))
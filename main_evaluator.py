@@ -1,23 +1,43 @@
-import random
 from pathlib import Path
 
 from evaluator.backtest_with_wq import run_backtest_by_wq_api
 from evaluator.backtest_with_wq_mul import run_backtest_mul_by_wq_api
+from evaluator.backtest_with_wq_async import run_backtest_async_by_wq_api, run_backtest_worker
+from evaluator.select_candidates import selected_or_original
+from evaluator.template_bandit import TemplateBandit
+from evaluator.work_queue import WorkQueue
 from researcher.construct_prompts import build_wq_knowledge_prompt, build_check_if_blog_helpful, \
     build_blog_to_hypothesis
 from researcher.generate_alpha import generate_alphas_from_template
 from researcher.generate_template import from_post_to_template
 from scraper.preprocess_texts import preprocess_all_html_posts
 from scraper.scrap_posts_from_wq import scrape_new_posts
+from utils.alpha_file import alpha_files
 from utils.template_field_gener import generate_template_fields_v2
 from utils.template_op_gener import generate_template_ops
-from utils.wq_info_loader import OpAndFeature
+from utils.wq_info_loader import OPERATORS_CSV, OpAndFeature
 
 if __name__ == "__main__":
 
     # alpha evaluator ----------------------------------
+    # 多个进程 / 多台机器可同时运行：alpha 文件切段进入共享的租约队列，各进程领取互不重叠的段
     ALPHA_DIR = Path("data/alpha_db_v2/all_alphas")
-    json_files = list(ALPHA_DIR.glob("*.json"))
-    random.shuffle(json_files)
-    for json_file in json_files:
-        backtest_result = run_backtest_mul_by_wq_api(json_file)
+    # 本地表达式校验依赖运算符列表（data/wq_operators/operators.csv），单独运行评估器时先下载
+    if not OPERATORS_CSV.exists():
+        OpAndFeature().get_operators()
+    queue = WorkQueue()
+    added = queue.enqueue_files(selected_or_original(f) for f in alpha_files(ALPHA_DIR))
+    print(f"📋 新入队 {added} 个工作项，队列状态: {queue.status()}")
+    # 按各模板已回测结果的产出分配 simulation（template_bandit: thompson / ucb / off），
+    # 分配报告写入 backtest_result/template_allocation.csv
+    bandit = TemplateBandit.from_config()
+    chooser = bandit.choose if bandit else None
+    # 配额预算（wq_budget_per_hour / wq_budget_per_day / wq_quiet_hours）在评估器内部执行；
+    # 整个进程只登录一次，相邻工作项在同一个滑动窗口中衔接；出错的工作项交还队列，多次出错后标记为 FAILED；
+    # SIGINT / SIGTERM 时停止提交、等在途 simulation 结束，未完成工作项的租约随之释放
+    try:
+        run_backtest_worker(queue, chooser=chooser)
+    except KeyboardInterrupt:
+        print("🛑 Evaluator stopped")
+    finally:
+        queue.close()
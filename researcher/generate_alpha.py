@@ -5,6 +5,11 @@ import csv
 from itertools import product
 from pathlib import Path
 
+from evaluator.sim_settings import get_settings
+from utils.alpha_file import AlphaFileWriter
+from utils.fast_expr import canonical_hash
+from utils.negative_cache import NegativeCache
+
 BASE_DIR = Path(__file__).resolve().parents[1]
 OPERATORS_FILE = BASE_DIR / "data" / "wq_template_operators" / "template_operators.csv"
 FIELDS_FILE = BASE_DIR / "data" / "wq_template_fields" / "template_fields.json"
@@ -45,8 +50,29 @@ def extract_placeholders(expression):
     return re.findall(r"</(.*?)/>", expression)
 
 
-def generate_alphas_from_template(template_path):
-    """从alpha_template.json生成所有具体alpha"""
+def _open_output(template_name, template_expr):
+    """
+    逐行写出的 <模板>_alphas.jsonl。第一次生成时直接写出，评估器可以边生成边读取；
+    重新生成时先写临时文件，写完后原子替换，评估器不会读到截断的文件
+    （工作队列按 inode 变化识别重新生成的文件并重新切段，见 evaluator/work_queue.py）
+    """
+    path = ALPHA_DB / f"{template_name}_alphas.jsonl"
+    regenerate = path.exists() or path.with_suffix(".json").exists()
+    return AlphaFileWriter(path, {"Template": template_expr}, atomic=regenerate)
+
+
+def _remove_legacy(template_name):
+    """新的 .jsonl 写完后删除同一模板旧格式的 .json 输出（其工作项由工作队列在下次入队时删除）"""
+    legacy = ALPHA_DB / f"{template_name}_alphas.json"
+    if legacy.exists():
+        legacy.unlink()
+
+
+def generate_alphas_from_template(template_path, profile=None):
+    """
+    从alpha_template.json生成所有具体alpha，边展开边写入 JSONL，不在内存中保留全部 alpha；
+    profile 为评估时使用的 settings 配置档（默认 settings_profile），负缓存只按该 settings 下学到的模式过滤
+    """
     # === 加载模板 ===
     with open(template_path, "r", encoding="utf-8") as f:
         template_json = json.load(f)
@@ -62,16 +88,11 @@ def generate_alphas_from_template(template_path):
     placeholders = extract_placeholders(template_expr)
     if not placeholders:
         print("❌ 模板中未发现占位符，无法展开；直接使用 template 作为 alpha")
-        all_alphas = []
-        all_alphas.append({"alpha": template_expr, "fields_or_ops_used": []})
-        out_file = ALPHA_DB / f"{template_name}_alphas.json"
-        with open(out_file, "w", encoding="utf-8") as f:
-            json.dump({
-                "Template": template_expr,
-                "GeneratedAlphas": all_alphas
-            }, f, indent=2, ensure_ascii=False)
-        print(f"✅ Generated 1 alphas saved to {out_file}")
-        return out_file
+        with _open_output(template_name, template_expr) as writer:
+            writer.write({"alpha": template_expr, "fields_or_ops_used": []})
+        _remove_legacy(template_name)
+        print(f"✅ Generated 1 alphas saved to {writer.path}")
+        return writer.path
 
     # === 为每个占位符构建替代列表 ===
     replacements_list = []
@@ -85,8 +106,15 @@ def generate_alphas_from_template(template_path):
             print(f"❌ 未在字段或操作符映射中找到占位符类型: {ph}")
             return None
 
-    # === 笛卡尔积替换 ===
-    all_alphas = []
+    # === 笛卡尔积替换，逐条写出 ===
+    writer = _open_output(template_name, template_expr)
+    seen_hashes = set()  # 规范化哈希去重：add(a,b) 与 add(b,a) 只保留一个
+    duplicates = 0
+    # 评估器从 ERROR 中学到的无效字段 / 运算符组合，包含它们的展开式不再生成；
+    # 模式按 region / universe / delay 记录，只用评估时的 settings 匹配
+    negative_cache = NegativeCache()
+    settings = get_settings(profile)
+    blocked = 0
     count = 0
     total_combinations = 1
     for lst in replacements_list:
@@ -95,29 +123,36 @@ def generate_alphas_from_template(template_path):
         print(f"⚠️ Warning: Total possible alphas {total_combinations} exceeds MAX_ALPHAS={MAX_ALPHAS}. "
               f"Only generating the first {MAX_ALPHAS} combinations.")
 
-    for combo in product(*replacements_list):
-        expr = template_expr
-        # 依次替换占位符
-        for ph, val in zip(placeholders, combo):
-            expr = re.sub(rf"</{re.escape(ph)}/>+", val, expr, count=1)
-        all_alphas.append({
-            "alpha": expr,
-            "fields_or_ops_used": combo
-        })
-        count += 1
-        if count >= MAX_ALPHAS:  # 超过限制提前退出
-            break
-
-    # === 保存 ===
-    out_file = ALPHA_DB / f"{template_name}_alphas.json"
-    with open(out_file, "w", encoding="utf-8") as f:
-        json.dump({
-            "Template": template_expr,
-            "GeneratedAlphas": all_alphas
-        }, f, indent=2, ensure_ascii=False)
-
-    print(f"✅ Generated {len(all_alphas)} alphas saved to {out_file}")
-    return out_file
+    with writer:
+        for combo in product(*replacements_list):
+            expr = template_expr
+            # 依次替换占位符
+            for ph, val in zip(placeholders, combo):
+                expr = re.sub(rf"</{re.escape(ph)}/>+", val, expr, count=1)
+            h = canonical_hash(expr)
+            if h in seen_hashes:
+                duplicates += 1
+                continue
+            if negative_cache.match(expr, settings):
+                blocked += 1
+                continue
+            seen_hashes.add(h)
+            writer.write({
+                "alpha": expr,
+                "fields_or_ops_used": combo
+            })
+            count += 1
+            if count >= MAX_ALPHAS:  # 超过限制提前退出
+                break
+
+    _remove_legacy(template_name)
+    negative_cache.close()
+    if duplicates:
+        print(f"♻️ Skipped {duplicates} semantically equivalent alphas")
+    if blocked:
+        print(f"🚫 Skipped {blocked} alphas containing known invalid field/operator patterns")
+    print(f"✅ Generated {count} alphas saved to {writer.path}")
+    return writer.path
 
 
 if __name__ == "__main__":
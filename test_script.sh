@@ -1,22 +1,21 @@
 #!/bin/bash
 
-# 自动循环运行回测，每轮57分钟，暂停3分钟
+# 持续运行回测：配额预算（config.yaml 的 wq_budget_per_hour / wq_budget_per_day / wq_quiet_hours）
+# 由评估器在进程内执行，预算用完时自动暂停提交并在窗口边界恢复，无需定时杀进程。
+# 一轮工作队列处理完后等待 1 分钟再扫描新生成的 alpha。
+# 停止：发送 SIGTERM / Ctrl-C，评估器停止提交并等待在途 simulation 结束后退出。
+
+# Ctrl-C 会直接发给前台的 python 进程，这里只需等待它排空；SIGTERM 需要转发
+trap 'wait $PID; exit 0' INT
+trap 'kill -TERM $PID 2>/dev/null; wait $PID; exit 0' TERM
 
-# 无限循环
 while true
 do
-    echo "🚀 开始运行 main.py ..."
+    echo "🚀 开始运行 main_evaluator.py ..."
     python main_evaluator.py &
     PID=$!
+    wait $PID
 
-    # 运行57分钟（57*60秒）
-    sleep $((57 * 60))
-
-    echo "⏹ 停止 main.py (PID=$PID)..."
-    kill $PID
-
-    # 等待3分钟
-    echo "🕒 等待3分钟后重新开始..."
-    sleep $((3 * 60))
+    echo "🕒 队列已处理完，1 分钟后重新扫描..."
+    sleep 60
 done
-
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+# ConfigLoader 从当前目录读取 config.yaml；结果库、工作队列等写到临时目录，不碰 data/
+os.chdir(ROOT)
+os.environ.setdefault("BACKTEST_RESULT_DIR", tempfile.mkdtemp(prefix="alphaspire_test_"))
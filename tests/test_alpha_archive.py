@@ -0,0 +1,49 @@
+import evaluator.alpha_archive as alpha_archive
+from evaluator.alpha_archive import AlphaArchive, read_alpha_details
+
+ALPHA_DATA = {"id": "a1", "is": {"fitness": 1.1, "sharpe": 1.5}, "settings": {"region": "USA"}}
+
+
+def test_on_written_runs_after_rows_reach_disk(tmp_path):
+    archive = AlphaArchive(tmp_path, flush_rows=2, flush_seconds=3600)
+    written = []
+    archive.add("t", "rank(close)", ALPHA_DATA, on_written=lambda: written.append(1))
+    assert written == [] and read_alpha_details(root=tmp_path).empty
+    archive.add("t", "rank(open)", dict(ALPHA_DATA, id="a2"), on_written=lambda: written.append(2))
+    assert written == [1, 2]
+    assert sorted(read_alpha_details("t", tmp_path)["alpha_id"]) == ["a1", "a2"]
+
+
+def test_flush_due_writes_after_flush_seconds(tmp_path):
+    archive = AlphaArchive(tmp_path, flush_rows=200, flush_seconds=0)
+    written = []
+    archive.add("t", "rank(close)", ALPHA_DATA, on_written=lambda: written.append(1))
+    assert written == [1]
+    archive.flush_due()
+    assert archive.written == 1
+
+
+def test_failed_partition_stays_buffered_without_duplicating_written_ones(tmp_path, monkeypatch):
+    archive = AlphaArchive(tmp_path, flush_rows=200, flush_seconds=3600)
+    archive.parquet = False
+    written = []
+    archive.add("a", "rank(close)", ALPHA_DATA, on_written=lambda: written.append("a"))
+    archive.add("b", "rank(open)", dict(ALPHA_DATA, id="a2"), on_written=lambda: written.append("b"))
+
+    real_open = alpha_archive.gzip.open
+
+    def failing_open(path, *args, **kwargs):
+        if "template=b" in str(path):
+            raise OSError("disk full")
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(alpha_archive.gzip, "open", failing_open)
+    archive.flush()
+    assert written == ["a"]
+    assert list(read_alpha_details(root=tmp_path)["alpha_id"]) == ["a1"]
+
+    monkeypatch.setattr(alpha_archive.gzip, "open", real_open)
+    archive.flush()
+    assert written == ["a", "b"]
+    assert sorted(read_alpha_details(root=tmp_path)["alpha_id"]) == ["a1", "a2"]
+    assert archive.written == 2
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+from evaluator.backtest_with_wq_async import POLL_ERROR_LIMIT, UNREACHABLE, ProgressPoller
+from evaluator.bench_evaluator import run_benchmark
+from utils.rate_limiter import RateLimiter
+
+SIM_URL = "https://wq.test/simulations/1"
+
+
+def poll_with(responses):
+    """按顺序返回 responses 中的响应（最后一个重复），返回 (status_json, 请求次数)"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return responses[min(len(calls), len(responses)) - 1]
+
+    async def run():
+        limiter = RateLimiter(rate=1000, burst=1000, backoff_base=0.001, backoff_cap=0.01)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            poller = ProgressPoller(min_interval=0.001, max_interval=0.01)
+            session = SimpleNamespace(limiter=limiter, client=client)
+            try:
+                return await asyncio.wait_for(poller.wait(session, SIM_URL, "t", 0), 5)
+            finally:
+                await poller.close()
+
+    return asyncio.run(run()), len(calls)
+
+
+def test_error_responses_resolve_the_job_instead_of_hanging():
+    for response in (httpx.Response(403, text="Forbidden"),
+                     httpx.Response(200, text="<html>gateway</html>"),
+                     httpx.Response(200, json=["not", "a", "status"])):
+        status_json, calls = poll_with([response])
+        assert status_json["status"] == UNREACHABLE
+        assert calls == POLL_ERROR_LIMIT
+
+
+def test_transient_decode_error_is_retried():
+    status_json, calls = poll_with([httpx.Response(200, text='{"status": "COMPL'),
+                                    httpx.Response(200, json={"status": "COMPLETE", "alpha": "a1"})])
+    assert status_json == {"status": "COMPLETE", "alpha": "a1"}
+    assert calls == 2
+
+
+def test_missing_simulation_is_lost():
+    status_json, _ = poll_with([httpx.Response(404)])
+    assert status_json["status"] == "LOST"
+
+
+def test_scheduler_against_mock_server_survives_poll_errors():
+    report = run_benchmark(8, "async", concurrency=3, timeout=120, latency_mean=0.3, latency_jitter=0.1,
+                           progress_retry_after=0.05, error_rate=0.2, poll_error_rate=0.2, seed=1)
+    assert report["returncode"] == 0
+    assert report["simulations"] == report["results"] == 8
+    # 滑动窗口不超过账号的并发上限，不会收到 SIMULATION_LIMIT_EXCEEDED
+    assert "POST /simulations 429" not in report["by_endpoint"]
+
+
+def test_scheduler_gives_up_on_simulations_it_can_never_poll():
+    report = run_benchmark(3, "async", concurrency=3, timeout=120, latency_mean=0.2, latency_jitter=0.0,
+                           progress_retry_after=0.05, poll_error_rate=1.0)
+    assert report["returncode"] == 0 and report["results"] == 0
+    assert report["by_endpoint"]["GET /simulations/{id} 403"] == 3 * POLL_ERROR_LIMIT
@@ -0,0 +1,36 @@
+import pytest
+
+from utils.fast_expr import FastExprSyntaxError, canonical_hash, canonicalize, parse
+
+
+@pytest.mark.parametrize("a, b", [
+    ("add(close, open)", "open + close"),
+    ("add(add(a, b), c)", "a + (b + c)"),
+    ("max(a, b, c)", "max(c, max(b, a))"),
+    ("rank(rank(close))", "rank(close)"),
+    ("-(-close)", "close"),
+    ("greater(a, b)", "b < a"),
+    ("ts_mean(close, 20)", "ts_mean(close,20.0)"),
+    ("ts_rank(x, 20, constant=0)", "ts_rank( x , 20 , constant = 0 )"),
+    ("a = rank(close); a + open", "a=rank(close);open+a"),
+])
+def test_equivalent_expressions_share_a_hash(a, b):
+    assert canonical_hash(a) == canonical_hash(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("subtract(close, open)", "open - close"),
+    ("divide(a, b)", "b / a"),
+    ("ts_mean(close, 20)", "ts_mean(close, 21)"),
+    ("rank(ts_rank(close, 5))", "ts_rank(rank(close), 5)"),
+    ("rank(close, rate=0)", "rank(rank(close, rate=0), rate=0) * 1"),
+])
+def test_different_expressions_have_different_hashes(a, b):
+    assert canonical_hash(a) != canonical_hash(b)
+
+
+def test_unparseable_expression_falls_back_to_whitespace_normalised_text():
+    with pytest.raises(FastExprSyntaxError):
+        parse("rank(close")
+    assert canonicalize("rank( close") == "rank(close"
+    assert canonical_hash("rank( close") == canonical_hash("rank(close")
@@ -0,0 +1,80 @@
+import pytest
+
+import utils.fast_expr_validator as fast_expr_validator
+from utils.fast_expr_validator import FastExprValidator, load_validator
+
+OPERATORS = """name,category,definition
+add,Arithmetic,"add(x, y, filter = false)"
+rank,Cross Sectional,"rank(x, rate=2)"
+ts_mean,Time Series,"ts_mean(x, d)"
+vec_avg,Vector,vec_avg(x)
+"""
+
+
+@pytest.fixture
+def operators_csv(tmp_path):
+    path = tmp_path / "operators.csv"
+    path.write_text(OPERATORS, encoding="utf-8")
+    return path
+
+
+def make_validator(tmp_path, operators_csv, fields=None, datasets=()):
+    """fields: {数据集名: [(字段 id, 类型), ...]}"""
+    fields_dir = tmp_path / "wq_fields"
+    fields_dir.mkdir(exist_ok=True)
+    for dataset, rows in (fields or {}).items():
+        lines = ["id,type"] + [f"{fid},{ftype}" for fid, ftype in rows]
+        (fields_dir / f"{dataset}.csv").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return FastExprValidator(operators_csv, fields_dir, datasets=list(datasets))
+
+
+def test_nary_operator_accepts_any_number_of_arguments(tmp_path, operators_csv):
+    validator = make_validator(tmp_path, operators_csv, {"pv1": [("close", "MATRIX"), ("open", "MATRIX")]})
+    assert validator.validate("add(close, open, close, open)").ok
+    assert not validator.validate("add(close)").ok
+
+
+def test_fixed_arity_operator_is_checked(tmp_path, operators_csv):
+    validator = make_validator(tmp_path, operators_csv, {"pv1": [("close", "MATRIX")]})
+    result = validator.validate("ts_mean(close, 20, 3)")
+    assert not result.ok
+    assert "ts_mean() expects 2 arguments, got 3" in result.errors
+
+
+def test_unknown_field_rejected_when_field_data_is_loaded(tmp_path, operators_csv):
+    validator = make_validator(tmp_path, operators_csv, {"pv1": [("close", "MATRIX")]}, datasets=["pv1"])
+    result = validator.validate("rank(ts_mean(volume, 20))")
+    assert not result.ok
+    assert "unknown symbol 'volume'" in result.errors
+
+
+def test_unknown_field_allowed_without_field_data(tmp_path, operators_csv):
+    validator = make_validator(tmp_path, operators_csv)
+    assert not validator.check_fields
+    assert validator.validate("rank(ts_mean(close, 20))").ok
+    # 运算符仍然检查
+    assert not validator.validate("ts_foo(close, 20)").ok
+
+
+def test_unknown_field_allowed_when_enabled_dataset_is_missing(tmp_path, operators_csv):
+    validator = make_validator(tmp_path, operators_csv, {"pv1": [("close", "MATRIX")]},
+                               datasets=["pv1", "fundamental6"])
+    assert validator.missing_datasets == ["fundamental6"]
+    assert validator.validate("rank(ts_mean(assets, 20))").ok
+
+
+def test_repairs_fractional_window_and_bare_vector_field(tmp_path, operators_csv):
+    validator = make_validator(tmp_path, operators_csv, {"pv1": [("close", "MATRIX"), ("sentiment", "VECTOR")]})
+    result = validator.validate("add(ts_mean(close, 20.4), sentiment)")
+    assert result.ok
+    assert result.fixed_expr == "add(ts_mean(close,20),vec_avg(sentiment))"
+
+
+def test_missing_operators_csv_is_reported_once(monkeypatch, capsys):
+    def missing(*args, **kwargs):
+        raise FileNotFoundError("operators.csv not found.")
+
+    monkeypatch.setattr(fast_expr_validator, "FastExprValidator", missing)
+    monkeypatch.setattr(fast_expr_validator, "_warned_missing", False)
+    assert load_validator() is None and load_validator() is None
+    assert capsys.readouterr().out.count("本地表达式校验已关闭") == 1
@@ -0,0 +1,36 @@
+import numpy as np
+
+from evaluator.local_batch import BatchEvaluator
+from evaluator.local_data import SyntheticDataSource
+from evaluator.local_engine import LocalEngine
+
+TEMPLATE = "group_neutralize(rank(ts_decay_linear(ts_corr({a}, volume, 10), 5)) * rank(-ts_delta(close, {d})), {g})"
+
+
+def expansions():
+    exprs = [TEMPLATE.format(a=a, d=d, g=g) for a in ("close", "vwap", "returns")
+             for d in (3, 5) for g in ("sector", "industry")]
+    exprs += ["x = ts_mean(close, 5); rank(x - ts_mean(close, 20))", "rank(close", "no_such_op(close)"]
+    return exprs
+
+
+def test_batch_output_equals_per_expression_output():
+    source = SyntheticDataSource(n_dates=60, n_instruments=30)
+    exprs = expansions()
+    reference = [LocalEngine(source).try_evaluate(expr) for expr in exprs]
+    # 极小的缓存与块：覆盖 LRU 淘汰与跨块复用
+    for evaluator in (BatchEvaluator(source), BatchEvaluator(source, max_cache_mb=0.02, chunk_size=4)):
+        results = list(evaluator.evaluate_batch(iter(exprs)))
+        assert [expr for expr, _, _ in results] == exprs
+        for (expr, panel, err), (ref_panel, ref_err) in zip(results, reference):
+            assert err == ref_err, expr
+            if ref_panel is not None:
+                np.testing.assert_array_equal(panel, ref_panel, err_msg=expr)
+
+
+def test_shared_subtrees_are_computed_once():
+    evaluator = BatchEvaluator(SyntheticDataSource(n_dates=60, n_instruments=30))
+    list(evaluator.evaluate_batch(expansions()[:12]))
+    stats = evaluator.stats
+    assert stats["hits"] > 0 and stats["computed"] < stats["nodes"]
+    assert not evaluator.remaining
@@ -0,0 +1,45 @@
+import numpy as np
+
+from evaluator.local_data import PanelDataSource
+from evaluator.local_engine import LocalEngine
+
+CLOSE = np.array([[10.0, 20.0, 30.0, np.nan],
+                  [11.0, 19.0, 33.0, 40.0],
+                  [12.0, 21.0, 30.0, 44.0]])
+SECTOR = np.array([[0, 0, 1, 1]] * 3)
+
+
+def engine():
+    return LocalEngine(PanelDataSource({"close": CLOSE, "sector": SECTOR}))
+
+
+def test_rank_is_cross_sectional_and_skips_nan():
+    out = engine().evaluate("rank(close)")
+    np.testing.assert_allclose(out[0], [0.0, 0.5, 1.0, np.nan])
+    np.testing.assert_allclose(out[1], [0.0, 1 / 3, 2 / 3, 1.0])
+
+
+def test_ts_delta_and_arithmetic():
+    out = engine().evaluate("ts_delta(close, 1) / close")
+    assert np.isnan(out[0]).all()
+    np.testing.assert_allclose(out[2], [1 / 12, 2 / 21, -3 / 30, 4 / 44])
+
+
+def test_group_neutralize_removes_group_means():
+    out = engine().evaluate("group_neutralize(close, sector)")
+    np.testing.assert_allclose(out[1], [-4.0, 4.0, -3.5, 3.5])
+    np.testing.assert_allclose(out[0, 2], 0.0)
+
+
+def test_assignments_and_scalars():
+    e = engine()
+    np.testing.assert_allclose(e.evaluate("a = close * 2; a - close"), CLOSE)
+    assert e.evaluate("1 + 2").shape == CLOSE.shape
+
+
+def test_try_evaluate_reports_errors_instead_of_raising():
+    e = engine()
+    for expr, error in [("rank(close", "FastExprSyntaxError"), ("no_such_op(close)", "NotImplementedError"),
+                        ("rank(unknown_field)", "KeyError")]:
+        panel, err = e.try_evaluate(expr)
+        assert panel is None and err.startswith(error)
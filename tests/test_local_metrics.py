@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from evaluator.local_data import PanelDataSource, SyntheticDataSource
+from evaluator.local_metrics import TRADING_DAYS, LocalMetrics, alpha_to_weights, weights_to_metrics
+from utils.config_loader import ConfigLoader
+
+PLAIN = {"decay": 0, "neutralization": "NONE", "truncation": 0, "delay": 1}
+
+
+def long_short_returns(T=20):
+    """第 0 只股票比第 1 只每天多赚 1% / 3% 交替"""
+    spread = np.where(np.arange(T) % 2 == 0, 0.01, 0.03)
+    return np.stack([spread / 2, -spread / 2], axis=1)
+
+
+def test_constant_long_short_metrics_match_hand_computation():
+    T = 20
+    returns = long_short_returns(T)
+    weights = alpha_to_weights(np.tile([1.0, -1.0], (T, 1)), PLAIN)
+    np.testing.assert_allclose(weights[0], np.tile([0.5, -0.5], (T, 1)))
+
+    (row,) = weights_to_metrics(weights, returns, delay=1)
+    pnl = (returns[:, 0] - returns[:, 1])[2:]  # delay 1：第 t 行的权重赚取 t+2 行的收益
+    assert row["sharpe"] == pytest.approx(pnl.mean() / pnl.std() * np.sqrt(TRADING_DAYS))
+    assert row["returns"] == pytest.approx(pnl.mean() * TRADING_DAYS)
+    assert row["turnover"] == 0.0 and row["margin"] == 0.0 and row["drawdown"] == 0.0
+    assert row["fitness"] == pytest.approx(row["sharpe"] * np.sqrt(row["returns"] / 0.125))
+
+
+def test_daily_flip_turns_over_the_whole_book_twice():
+    T = 20
+    signal = np.tile([1.0, -1.0], (T, 1)) * np.where(np.arange(T) % 2 == 0, 1.0, -1.0)[:, None]
+    (row,) = weights_to_metrics(alpha_to_weights(signal, PLAIN), long_short_returns(T))
+    assert row["turnover"] == pytest.approx(2.0)
+
+
+def test_neutralization_and_truncation():
+    rng = np.random.default_rng(0)
+    signal = rng.normal(size=(5, 40))
+    groups = np.tile(np.arange(40) % 4, (5, 1))
+    weights = alpha_to_weights(signal, {"neutralization": "SECTOR", "truncation": 0.05}, groups)[0]
+    assert np.abs(weights).max() == pytest.approx(0.05, rel=1e-4)  # 截断是迭代收敛的
+    np.testing.assert_allclose(np.abs(weights).sum(axis=1), 1.0)
+    neutral = alpha_to_weights(signal, {"neutralization": "SECTOR"}, groups)[0]
+    for g in range(4):
+        np.testing.assert_allclose(neutral[:, groups[0] == g].sum(axis=1), 0.0, atol=1e-12)
+
+
+def test_local_metrics_requires_real_panels_unless_given_a_source(monkeypatch):
+    monkeypatch.setitem(ConfigLoader()._config, "local_panels_npz", None)
+    with pytest.raises(ValueError):
+        LocalMetrics()
+    source = PanelDataSource({"returns": long_short_returns(), "close": np.tile([1.0, -1.0], (20, 1))})
+    assert LocalMetrics(source, settings=PLAIN).returns is source.panels["returns"]
+
+
+def test_score_alphas_keeps_input_order_and_reports_errors():
+    metrics = LocalMetrics(SyntheticDataSource(n_dates=60, n_instruments=20), settings=PLAIN)
+    exprs = ["rank(-ts_delta(close, 5))", "no_such_op(close)", "rank(volume)"]
+    rows = list(metrics.score_alphas(exprs, batch_size=2))
+    assert [row["alpha"] for row in rows] == exprs
+    assert rows[1]["error"].startswith("NotImplementedError") and rows[1]["sharpe"] is None
+    assert rows[0]["error"] is None and np.isfinite(rows[0]["sharpe"])
@@ -0,0 +1,50 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from evaluator.quota_budget import QuotaBudget
+
+
+def test_processes_sharing_the_db_cannot_overspend(tmp_path):
+    # 两个实例各自持有连接与锁，相当于两个进程
+    budgets = [QuotaBudget(per_hour=5, db_path=tmp_path / "quota.db") for _ in range(2)]
+    granted = []
+    barrier = threading.Barrier(8)
+
+    def consume(budget):
+        barrier.wait()
+        for _ in range(5):
+            wait, charge = budget.try_consume("a")
+            if wait <= 0:
+                granted.append(charge)
+
+    threads = [threading.Thread(target=consume, args=(budgets[i % 2],)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(granted) == 5
+    assert budgets[0].usage("a")["hour"] == 5
+
+
+def test_refund_credits_the_window_that_was_charged(tmp_path):
+    budget = QuotaBudget(per_hour=10, db_path=tmp_path / "quota.db")
+    _, charge = budget.try_consume("a", 3)
+    # 预扣发生在上一个小时，退回时已经跨过整点
+    last_hour = datetime.now() - timedelta(hours=1)
+    budget.conn.execute("UPDATE submissions SET ts = ? WHERE rowid = ?", (last_hour.timestamp(), charge))
+    budget.try_consume("a", 2)
+    budget.refund(charge)
+    # 退回记在上一个小时；若按退回时刻记 -3，本小时会变成 -1
+    assert budget.usage("a")["hour"] == 2
+    assert budget.conn.execute("SELECT COUNT(*) FROM submissions").fetchone()[0] == 1
+
+
+def test_cost_above_the_budget_is_rejected(tmp_path):
+    budget = QuotaBudget(per_hour=4, per_day=100, db_path=tmp_path / "quota.db")
+    assert budget.max_cost == 4
+    with pytest.raises(ValueError):
+        budget.try_consume("a", 5)
+    assert budget.try_consume("a", 4)[0] == 0
+    assert budget.try_consume("a", 1)[0] > 0
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from utils.rate_limiter import RateLimiter, retry_after_seconds
+
+
+def limiter(**kwargs):
+    return RateLimiter(**{"rate": 10, "burst": 2, "min_rate": 1, "increase": 1, "decrease": 0.5,
+                          "backoff_base": 0.01, "backoff_cap": 0.05, **kwargs})
+
+
+def test_429_cuts_rate_and_success_recovers_it_additively():
+    rl = limiter()
+    rl.on_response(429)
+    assert rl.rate == 5 and rl.stats["throttled"] == 1
+    rl.on_response(429)
+    rl.on_response(429)
+    rl.on_response(429)
+    assert rl.rate == 1                    # 不低于 min_rate
+    for expected in (2, 3, 4):
+        assert rl.on_response(200) == 0.0 and rl.rate == expected
+    for _ in range(20):
+        rl.on_response(200)
+    assert rl.rate == 10                   # 不超过配置的上限
+    assert rl.failures == 0
+
+
+def test_retry_after_is_honoured_and_blocks_the_whole_bucket():
+    rl = limiter()
+    delay = rl.on_response(429, {"Retry-After": "2"})
+    assert delay == pytest.approx(2.0, abs=0.06)
+    assert rl._try_acquire() == pytest.approx(delay, abs=0.05)
+    assert retry_after_seconds({"Retry-After": "not a date"}, 7) == 7
+
+
+def test_backoff_grows_with_consecutive_failures_and_resets_on_success():
+    rl = limiter(backoff_base=1, backoff_cap=1000)
+    delays = [rl.on_response(503) for _ in range(6)]
+    assert rl.failures == 6 and max(delays) <= 2 ** 5
+    assert rl.rate == 10                   # 服务端错误只退避，不降速
+    rl.on_response(200)
+    assert rl.failures == 0
+
+
+def test_concurrency_limit_only_delays_the_caller():
+    rl = limiter()
+    delay = rl.on_response(429, {"Retry-After": "1"}, '{"detail": "SIMULATION_LIMIT_EXCEEDED"}')
+    assert delay == 1.0 and rl.rate == 10 and rl.blocked_until == 0.0
+    assert rl._try_acquire() == 0.0
+
+
+def test_token_bucket_spaces_requests_after_the_burst():
+    rl = limiter(rate=50, burst=2)
+    start = time.monotonic()
+    for _ in range(7):
+        rl.wait()
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+    assert rl.stats["requests"] == 7
@@ -0,0 +1,35 @@
+from evaluator.result_store import INVALID, ResultStore
+
+SETTINGS = {"region": "USA", "decay": 0}
+
+
+def test_equivalent_expressions_share_a_result(tmp_path):
+    store = ResultStore(tmp_path / "results.db")
+    store.put("t", SETTINGS, {"alpha": "add(close, open)", "fitness": 1.2})
+    assert store.is_finished("open + close", SETTINGS)
+    assert not store.is_finished("open + close", dict(SETTINGS, decay=4))
+    store.close()
+
+
+def test_invalid_result_is_not_finished(tmp_path):
+    store = ResultStore(tmp_path / "results.db")
+    store.put("t", SETTINGS, {"alpha": "rank(close)", "margin": INVALID})
+    assert not store.is_finished("rank(close)", SETTINGS)
+    assert store.get("rank(close)", SETTINGS)["status"] == INVALID
+    # 之后的真实回测结果覆盖校验失败的记录
+    store.put("t", SETTINGS, {"alpha": "rank(close)", "fitness": 0.8})
+    assert store.is_finished("rank(close)", SETTINGS)
+    store.close()
+
+
+def test_legacy_csv_is_imported_once(tmp_path):
+    csv_path = tmp_path / "t_backtest.csv"
+    csv_path.write_text("alpha,sharpe,turnover,fitness,returns,drawdown,margin\n"
+                        "rank(close),1.2,0.3,0.9,0.1,0.05,0.0004\n"
+                        "rank(open),,,,,,FAILED:ERROR\n", encoding="utf-8")
+    store = ResultStore(tmp_path / "results.db")
+    assert store.import_csv(csv_path, "t", SETTINGS) == 2
+    assert store.import_csv(csv_path, "t", SETTINGS) == 0
+    assert store.get("rank(close)", SETTINGS)["fitness"] == 0.9
+    assert store.get("rank(open)", SETTINGS)["status"] == "FAILED:ERROR"
+    store.close()
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from evaluator import select_candidates as sc
+from evaluator.local_data import SyntheticDataSource
+from evaluator.local_metrics import LocalMetrics
+from utils.config_loader import ConfigLoader
+
+
+@pytest.fixture
+def panels_npz(tmp_path, monkeypatch):
+    """把 local_panels_npz 指向一个小的面板文件；返回设置函数，参数为 None 时取消配置"""
+    path = SyntheticDataSource(n_dates=60, n_instruments=20).save_npz(tmp_path / "panels.npz")
+
+    def configure(value=path):
+        monkeypatch.setitem(ConfigLoader()._config, "local_panels_npz", None if value is None else str(value))
+    return configure
+
+
+def test_local_metrics_requires_configured_panels(panels_npz):
+    panels_npz(None)
+    with pytest.raises(ValueError):
+        LocalMetrics()
+    panels_npz()
+    assert LocalMetrics().returns.shape == (60, 20)
+
+
+def test_selection_is_skipped_without_real_panels(panels_npz, tmp_path):
+    panels_npz(None)
+    assert sc.select_candidates(tmp_path / "t_alphas.jsonl") is None
+
+
+def test_stale_or_unconfigured_selection_is_ignored(panels_npz, tmp_path, monkeypatch):
+    monkeypatch.setattr(sc, "SELECTED_DIR", tmp_path / "selected")
+    original = tmp_path / "t_alphas.jsonl"
+    original.write_text('{"Template": "x"}\n', encoding="utf-8")
+    selected = sc.SELECTED_DIR / original.name
+    selected.parent.mkdir()
+    selected.write_text('{"Template": "x"}\n', encoding="utf-8")
+
+    panels_npz()
+    assert sc.selected_or_original(original) == selected
+    # 原文件重新生成后，旧的筛选结果不再使用
+    os.utime(selected, (0, 0))
+    assert sc.selected_or_original(original) == original
+    os.utime(selected, None)
+    panels_npz(None)
+    assert sc.selected_or_original(original) == original
@@ -0,0 +1,69 @@
+import asyncio
+
+from evaluator.quota_budget import QuotaBudget
+from evaluator.session_pool import SessionPool
+
+
+def make_pool(tmp_path, per_hour=None, concurrency=2):
+    budget = QuotaBudget(per_hour=per_hour, db_path=tmp_path / "quota.db")
+    pool = SessionPool([{"account": "a", "password": "x"}, {"account": "b", "password": "x"}], concurrency, budget)
+    for session in pool.sessions:
+        session.active = True  # 不登录，直接视为已登录
+    return pool, budget
+
+
+def test_multi_simulation_takes_one_slot_and_charges_each_alpha(tmp_path):
+    pool, budget = make_pool(tmp_path, per_hour=100)
+
+    async def run():
+        session = await pool.acquire(cost=5)
+        assert session.in_flight == 1 and pool.capacity == 4
+        assert budget.usage(session.name)["hour"] == 5
+        await pool.release(session)
+        assert session.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_acquire_spreads_over_free_slots_and_waits_when_full(tmp_path):
+    pool, _ = make_pool(tmp_path)
+
+    async def run():
+        sessions = [await pool.acquire(cost=1) for _ in range(4)]
+        assert sorted(s.name for s in sessions) == ["a", "a", "b", "b"]
+        waiter = asyncio.create_task(pool.acquire(cost=1))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        await pool.release(sessions[0])
+        assert await asyncio.wait_for(waiter, 1) is sessions[0]
+
+    asyncio.run(run())
+
+
+def test_drain_stops_new_submissions_but_not_resumed_polls(tmp_path):
+    pool, _ = make_pool(tmp_path)
+
+    async def run():
+        await pool.drain()
+        assert await pool.acquire(cost=1) is None
+        # 恢复的在途 simulation（cost=0）仍可取到提交它的账号
+        assert (await pool.acquire(pool.get("b"), 0)).name == "b"
+
+    asyncio.run(run())
+
+
+def test_failed_submission_refunds_its_own_charge(tmp_path):
+    pool, budget = make_pool(tmp_path, per_hour=100)
+
+    async def submit(fail):
+        session = await pool.acquire(pool.get("a"), 4 if fail else 1)
+        await asyncio.sleep(0)
+        if fail:
+            pool.refund(session)
+        await pool.release(session)
+
+    async def run():
+        await asyncio.gather(submit(True), submit(False), submit(False))
+
+    asyncio.run(run())
+    assert budget.usage("a")["hour"] == 2
@@ -0,0 +1,123 @@
+import time
+
+import pytest
+
+from evaluator.work_queue import DONE, FAILED, PENDING, WorkQueue
+from utils.alpha_file import AlphaFileWriter, iter_alphas
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = WorkQueue(tmp_path / "work_queue.db", ttl=60, max_attempts=3)
+    yield q
+    q.close()
+
+
+def item_row(queue, lease):
+    return queue.conn.execute("SELECT status, attempts, error FROM work_items WHERE id = ?", (lease.id,)).fetchone()
+
+
+def test_enqueue_splits_file_into_chunks_and_appends_new_alphas(queue):
+    assert queue.enqueue("a.jsonl", 120, chunk_size=50) == 3
+    assert queue.enqueue("a.jsonl", 120, chunk_size=50) == 0
+    # 文件变长后只追加新的段
+    assert queue.enqueue("a.jsonl", 180, chunk_size=50) == 2
+    ranges = queue.conn.execute("SELECT start, stop FROM work_items ORDER BY start").fetchall()
+    assert ranges == [(0, 50), (50, 100), (100, 120), (120, 170), (170, 180)]
+
+
+def write_alphas(path, exprs):
+    with AlphaFileWriter(path, {"Template": "rank(<field/>)"}) as writer:
+        for expr in exprs:
+            writer.write({"alpha": expr})
+
+
+def test_leased_chunk_is_read_from_its_byte_offset(queue, tmp_path):
+    path = tmp_path / "t_alphas.jsonl"
+    exprs = [f"rank(ts_mean(close, {i + 1}))" for i in range(25)]
+    write_alphas(path, exprs[:12])
+    assert queue.enqueue_files([path], chunk_size=5) == 3
+    # 生成中入队的文件：已入队部分停在段中间（[10, 12)），追加部分从第 12 条起切段
+    write_alphas(path, exprs)
+    assert queue.enqueue_files([path], chunk_size=5) == 3
+    chunks = []
+    while (lease := queue.lease("w1")) is not None:
+        assert lease.byte_offset is not None
+        chunks.append(list(iter_alphas(path, lease.start, lease.stop, lease.byte_offset)))
+        assert chunks[-1] == exprs[lease.start:lease.stop]
+        queue.complete(lease)
+    assert sorted(sum(chunks, [])) == sorted(exprs)
+
+
+def test_completed_lease_is_not_leased_again(queue):
+    queue.enqueue("a.jsonl", 10)
+    lease = queue.lease("w1")
+    assert queue.lease("w2") is None
+    assert queue.complete(lease)
+    assert item_row(queue, lease)[0] == DONE
+    assert queue.lease("w2") is None
+
+
+def test_stale_token_cannot_complete_a_taken_over_lease(queue):
+    queue.enqueue("a.jsonl", 10)
+    old = queue.lease("w1", ttl=0.01)
+    time.sleep(0.02)
+    new = queue.lease("w2")
+    assert new.id == old.id and new.attempts == 2
+    assert not queue.complete(old)
+    assert queue.complete(new)
+
+
+def test_failing_item_is_marked_failed_after_max_attempts(queue):
+    queue.enqueue("missing.jsonl", 10)
+    for attempt in range(1, 4):
+        lease = queue.lease("w1")
+        assert lease is not None and lease.attempts == attempt
+        queue.release(lease, "FileNotFoundError('missing.jsonl')")
+        assert item_row(queue, lease)[0] == (FAILED if attempt == 3 else PENDING)
+    assert queue.lease("w1") is None
+    assert queue.failures() == [("missing.jsonl", 0, 10, 3, "FileNotFoundError('missing.jsonl')")]
+    assert queue.retry_failed() == 1
+    assert queue.lease("w1").attempts == 1
+
+
+def test_expired_lease_counts_as_an_attempt(queue):
+    queue.enqueue("a.jsonl", 10)
+    for _ in range(3):
+        queue.lease("w1", ttl=0.01)
+        time.sleep(0.02)
+    assert queue.lease("w1") is None
+    assert queue.status() == {FAILED: 1}
+
+
+def test_regenerated_file_is_swapped_atomically_and_requeued(queue, tmp_path):
+    path = tmp_path / "t_alphas.jsonl"
+    write_alphas(path, [f"rank(ts_mean(close, {i + 1}))" for i in range(10)])
+    queue.enqueue_files([path], chunk_size=5)
+    stale = queue.lease("w1")
+    stale = stale if stale.start == 5 else queue.lease("w1")
+
+    new_exprs = [f"rank(ts_delta(volume, {i + 1}))" for i in range(12)]
+    with AlphaFileWriter(path, {"Template": "rank(<field/>)"}, atomic=True) as writer:
+        for expr in new_exprs:
+            writer.write({"alpha": expr})
+        # 写完之前，读取方看到的仍是完整的旧文件
+        assert next(iter_alphas(path)) == "rank(ts_mean(close, 1))"
+    # 旧段的偏移落在新文件的行中间：报错交还，而不是读到错位的内容
+    with pytest.raises(ValueError):
+        list(iter_alphas(path, stale.start, stale.stop, stale.byte_offset))
+
+    # 再次入队时识别出文件已被替换：旧工作项删除，按新文件重新切段
+    assert queue.enqueue_files([path], chunk_size=5) == 3
+    assert not queue.complete(stale)
+    lease = queue.lease("w2")
+    assert list(iter_alphas(path, lease.start, lease.stop, lease.byte_offset)) == new_exprs[lease.start:lease.stop]
+
+
+def test_items_of_deleted_files_are_removed(queue, tmp_path):
+    legacy = tmp_path / "t_alphas.json"
+    legacy.write_text('{"Template": "x", "GeneratedAlphas": [{"alpha": "rank(close)"}]}', encoding="utf-8")
+    assert queue.enqueue_files([legacy]) == 1
+    legacy.unlink()
+    queue.enqueue_files([])
+    assert queue.lease("w1") is None
@@ -0,0 +1,193 @@
+# alpha_file.py
+"""
+alpha 文件的流式读写。
+
+generate_alpha 把展开结果逐行写入 <模板>_alphas.jsonl：第一行是模板信息 {"Template": ...}，
+之后每行一条 {"alpha": ..., "fields_or_ops_used": [...]}。生成过程不在内存中保留全部 alpha，
+评估器用 iter_alphas() 逐行惰性读取，读到第一条即可开始提交，内存占用与文件大小无关。
+
+工作队列入队时用 chunk_offsets() 记下每段第一条 alpha 的字节偏移，评估器读取一段时 seek 到该位置，
+不必从文件开头逐行跳过前面的段。
+
+旧的 {"Template": ..., "GeneratedAlphas": [...]} 与 [...] 结构的 .json 文件仍然可以读取（需要整体载入，
+同一文件未修改时复用最近载入的内容）。正在生成中的 .jsonl 文件也可以读取：只读到已写出的完整行为止。
+"""
+import itertools
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+
+ALPHA_SUFFIXES = (".jsonl", ".json")
+FLUSH_EVERY = 100
+
+
+def alpha_files(directory):
+    """目录下的全部 alpha 文件（.jsonl 与旧的 .json）"""
+    directory = Path(directory)
+    if not directory.exists():
+        return []
+    return sorted(p for p in directory.iterdir() if p.suffix in ALPHA_SUFFIXES)
+
+
+def is_jsonl(path):
+    return Path(path).suffix == ".jsonl"
+
+
+class AlphaFileWriter:
+    """
+    逐条写出 alpha（JSONL），每 flush_every 条刷新一次，评估器可以边生成边读取。
+    atomic=True 时先写同目录下的 <文件名>.tmp，close() 时原子替换 path：
+    覆盖已有文件时，正在读取旧文件的评估器不会读到被截断或写了一半的内容
+    """
+
+    def __init__(self, path, header=None, flush_every=FLUSH_EVERY, atomic=False):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self.count = 0
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp") if atomic else None
+        self._file = open(self._tmp_path or self.path, "w", encoding="utf-8")
+        if header:
+            self._file.write(json.dumps(header, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def write(self, item):
+        self._file.write(json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self, discard=False):
+        """discard=True（atomic 模式下写出中途出错）时丢弃临时文件，保留原文件"""
+        if self._file.closed:
+            return
+        self._file.close()
+        if self._tmp_path is None:
+            return
+        if discard:
+            self._tmp_path.unlink(missing_ok=True)
+        else:
+            os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(discard=exc_type is not None)
+
+
+def _load_json(path):
+    """旧格式：返回 (header, items)，无法识别时返回 (None, None)；结果按 (路径, 修改时间, 大小) 缓存，调用方不要修改"""
+    stat = os.stat(path)
+    return _load_json_cached(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=4)
+def _load_json_cached(path, mtime_ns, size):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "GeneratedAlphas" in data:
+        return {k: v for k, v in data.items() if k != "GeneratedAlphas"}, data["GeneratedAlphas"]
+    if isinstance(data, list):
+        return {}, data
+    return None, None
+
+
+def _jsonl_lines(f):
+    """跳过首行的模板信息，返回 alpha 行的迭代器"""
+    first = f.readline()
+    try:
+        header = json.loads(first)
+    except json.JSONDecodeError:
+        return iter(())  # 空文件，或首行尚未写完整
+    return itertools.chain([first], f) if "alpha" in header else f
+
+
+def read_header(path):
+    """模板信息（dict），文件格式无法识别时返回 None"""
+    if not is_jsonl(path):
+        return _load_json(path)[0]
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.readline()
+    try:
+        header = json.loads(first)
+    except json.JSONDecodeError:
+        return {}
+    return {} if "alpha" in header else header
+
+
+def iter_items(path, start=0, stop=None, byte_offset=None):
+    """
+    逐条读取 [start, stop) 段的 alpha 记录（dict）；
+    byte_offset 为第 start 条所在行的字节偏移（chunk_offsets() 的结果）时直接 seek，不逐行跳过前面的 alpha
+    """
+    if not is_jsonl(path):
+        _, items = _load_json(path)
+        if items is None:
+            raise ValueError(f"Unrecognized alpha file format: {path}")
+        yield from items[start:stop]
+        return
+    if byte_offset is not None:
+        with open(path, "rb") as f:
+            if byte_offset > 0:
+                f.seek(byte_offset - 1)
+                if f.read(1) != b"\n":
+                    # 偏移不在行首：文件在入队之后被重新生成
+                    raise ValueError(f"{path} changed since it was queued (offset {byte_offset} is not a line start)")
+            f.seek(byte_offset)
+            lines = (line.decode("utf-8") for line in f if line.strip())
+            for line in itertools.islice(lines, None if stop is None else stop - start):
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    return
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        lines = (line for line in _jsonl_lines(f) if line.strip())
+        for line in itertools.islice(lines, start, stop):
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                return  # 生成中的文件：最后一行尚未写完整
+
+
+def iter_alphas(path, start=0, stop=None, byte_offset=None):
+    """逐条读取 [start, stop) 段的 alpha 表达式"""
+    for item in iter_items(path, start, stop, byte_offset):
+        yield item["alpha"]
+
+
+def count_alphas(path):
+    """alpha 条数（JSONL 只数行，不解析），格式无法识别时返回 None"""
+    if not is_jsonl(path):
+        items = _load_json(path)[1]
+        return None if items is None else len(items)
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(1 for line in _jsonl_lines(f) if line.strip() and line.endswith("\n"))
+
+
+def chunk_offsets(path, chunk_size, start=0):
+    """
+    JSONL 文件从第 start 条起按 chunk_size 切段时每段第一条 alpha 所在行的字节偏移，
+    返回 (offsets, 完整 alpha 行的条数)；只扫描一遍文件、不解析 alpha 行。
+    旧的 .json 文件返回 (None, 条数)，格式无法识别时条数为 None
+    """
+    if not is_jsonl(path):
+        return None, count_alphas(path)
+    offsets, n, pos = [], 0, 0
+    with open(path, "rb") as f:
+        for i, line in enumerate(f):
+            line_start, pos = pos, pos + len(line)
+            if i == 0:
+                try:
+                    header = json.loads(line)
+                except json.JSONDecodeError:
+                    return [], 0  # 空文件，或首行尚未写完整
+                if "alpha" not in header:
+                    continue
+            if not line.strip() or not line.endswith(b"\n"):
+                continue
+            if n >= start and (n - start) % chunk_size == 0:
+                offsets.append(line_start)
+            n += 1
+    return offsets, n
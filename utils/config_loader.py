@@ -4,6 +4,16 @@ from pathlib import Path
 from threading import Lock
 
 
+def _optional_int(value):
+    """空值 / 空字符串表示不限制"""
+    return int(value) if value not in (None, "") else None
+
+
+def _bool(value):
+    """环境变量中的 1 / true / yes 视为 True"""
+    return value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
 class ConfigLoader:
     """
     A singleton configuration loader for the entire project.
@@ -42,13 +52,77 @@ class ConfigLoader:
             "worldquant_consultant_posts_url": os.getenv("WORLDQUANT_CONSULTANT_POSTS_URL",
                                                          yaml_config.get("worldquant_consultant_posts_url")),
 
+            # API 根地址与回测结果目录可以指向本地 mock 服务 / 临时目录，用于离线压测
+            "worldquant_api_base": os.getenv("WORLDQUANT_API_BASE", yaml_config.get("worldquant_api_base",
+                                                                                  "https://api.worldquantbrain.com")),
+            "backtest_result_dir": os.getenv("BACKTEST_RESULT_DIR", yaml_config.get("backtest_result_dir")),
+            # 多进程 / 多机共享的回测工作队列（SQLite 文件），见 evaluator/work_queue.py
+            "work_queue_db": os.getenv("WORK_QUEUE_DB", yaml_config.get("work_queue_db")),
+            # WQ API 请求速率上限（令牌桶），见 utils/rate_limiter.py
+            "wq_requests_per_second": float(os.getenv("WQ_REQUESTS_PER_SECOND",
+                                                      yaml_config.get("wq_requests_per_second", 5))),
+            "wq_burst": int(os.getenv("WQ_BURST", yaml_config.get("wq_burst", 10))),
+            # 每个账号每小时 / 每天的 simulation 预算与静默时段，见 evaluator/quota_budget.py
+            "wq_budget_per_hour": _optional_int(os.getenv("WQ_BUDGET_PER_HOUR", yaml_config.get("wq_budget_per_hour"))),
+            "wq_budget_per_day": _optional_int(os.getenv("WQ_BUDGET_PER_DAY", yaml_config.get("wq_budget_per_day"))),
+            "wq_quiet_hours": os.getenv("WQ_QUIET_HOURS", yaml_config.get("wq_quiet_hours")),
+            # multi-simulation 每次打包的 alpha 数（0 / 1 表示逐个提交），见 backtest_with_wq_async.py
+            "wq_multi_simulation_size": int(os.getenv("WQ_MULTI_SIMULATION_SIZE",
+                                                      yaml_config.get("wq_multi_simulation_size", 0))),
+            # 模板间的 simulation 分配策略：thompson / ucb / off，见 evaluator/template_bandit.py
+            "template_bandit": os.getenv("TEMPLATE_BANDIT", yaml_config.get("template_bandit", "thompson")),
+            # 模板提前终止规则（min_results 为 0 表示关闭），见 evaluator/early_stop.py
+            "early_stop_min_results": int(os.getenv("EARLY_STOP_MIN_RESULTS",
+                                                    yaml_config.get("early_stop_min_results", 50))),
+            "early_stop_max_error_rate": float(os.getenv("EARLY_STOP_MAX_ERROR_RATE",
+                                                         yaml_config.get("early_stop_max_error_rate", 0.9))),
+            "early_stop_fitness_floor": float(os.getenv("EARLY_STOP_FITNESS_FLOOR",
+                                                        yaml_config.get("early_stop_fitness_floor", -0.5))),
+            "early_stop_halving": _bool(os.getenv("EARLY_STOP_HALVING", yaml_config.get("early_stop_halving", False))),
+            # 后台 LLM 表达式修复的线程数（0 表示不修复）与每个批量 prompt 的表达式数，见 evaluator/expr_repair.py
+            "llm_repair_workers": int(os.getenv("LLM_REPAIR_WORKERS", yaml_config.get("llm_repair_workers", 0))),
+            "llm_repair_batch_size": int(os.getenv("LLM_REPAIR_BATCH_SIZE",
+                                                   yaml_config.get("llm_repair_batch_size", 8))),
+            # simulation settings 配置档与扫描网格，见 evaluator/sim_settings.py / evaluator/settings_sweep.py
+            "settings_profile": os.getenv("SETTINGS_PROFILE", yaml_config.get("settings_profile", "default")),
+            "settings_profiles": yaml_config.get("settings_profiles") or {},
+            "settings_sweep": yaml_config.get("settings_sweep") or {},
+            # alpha 详情的并发读取数与额外读取的 recordsets，见 evaluator/alpha_archive.py
+            "alpha_fetch_workers": int(os.getenv("ALPHA_FETCH_WORKERS", yaml_config.get("alpha_fetch_workers", 8))),
+            "alpha_detail_recordsets": yaml_config.get("alpha_detail_recordsets", []),
+            # 本地预筛选使用的真实面板数据（npz），未配置时不做本地筛选，见 evaluator/local_data.py
+            "local_panels_npz": os.getenv("LOCAL_PANELS_NPZ", yaml_config.get("local_panels_npz")),
+
             "enabled_field_datasets": yaml_config.get("enabled_field_datasets", [])
         }
 
+        # 多账号：WORLDQUANT_ACCOUNTS="a@x.com:pwd1,b@y.com:pwd2" 或 config.yaml 的 worldquant_accounts 列表，
+        # 未配置时退化为 worldquant_account / worldquant_password 单账号
+        self._config["worldquant_accounts"] = self._parse_accounts(
+            os.getenv("WORLDQUANT_ACCOUNTS"), yaml_config.get("worldquant_accounts"))
+        if not self._config["worldquant_accounts"] and self._config["worldquant_account"]:
+            self._config["worldquant_accounts"] = [{"account": self._config["worldquant_account"],
+                                                   "password": self._config["worldquant_password"]}]
+        if not self._config["worldquant_account"] and self._config["worldquant_accounts"]:
+            self._config["worldquant_account"] = self._config["worldquant_accounts"][0]["account"]
+            self._config["worldquant_password"] = self._config["worldquant_accounts"][0]["password"]
+
         # 确保是列表格式
         if not isinstance(self._config["enabled_field_datasets"], list):
             self._config["enabled_field_datasets"] = [self._config["enabled_field_datasets"]]
 
+    @staticmethod
+    def _parse_accounts(env_value, yaml_value):
+        """返回 [{"account", "password", "concurrency"(可选)}, ...]"""
+        if env_value:
+            accounts = []
+            for item in env_value.split(","):
+                account, sep, password = item.strip().partition(":")
+                if account and sep:
+                    accounts.append({"account": account, "password": password})
+            return accounts
+        return [dict(item) for item in (yaml_value or []) if isinstance(item, dict) and item.get("account")]
+
     @classmethod
     def get(cls, key: str, default=None):
         """
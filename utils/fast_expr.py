@@ -0,0 +1,332 @@
+"""
+fast_expr.py — WorldQuant Brain Fast Expression 解析与规范化。
+
+parse() 把表达式解析为 AST（Node），canonicalize() / canonical_hash() 在 AST 上做语义规范化：
+中缀运算转为函数形式、可交换运算符参数排序、数字字面量统一、幂等 / 对合运算化简，
+从而让 add(a,b) 与 add(b, a)、rank(rank(x)) 与 rank(x) 得到同一个哈希。
+"""
+
+import hashlib
+import re
+from dataclasses import dataclass
+
+
+class FastExprSyntaxError(ValueError):
+    """表达式无法解析"""
+
+
+@dataclass(frozen=True)
+class Node:
+    """
+    AST 节点。
+    kind: num | str | ident | call | binop | unary | ternary | assign | seq
+    value: 数值 / 字符串 / 名称 / 运算符
+    args: 子节点
+    kwargs: ((key, Node), ...) 关键字参数，如 ts_rank(x, 20, constant=0)
+    """
+    kind: str
+    value: object = None
+    args: tuple = ()
+    kwargs: tuple = ()
+
+
+# =========================
+# 词法分析
+# =========================
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<str>"[^"]*"|'[^']*')
+  | (?P<name>[A-Za-z_][A-Za-z0-9_.]*)
+  | (?P<op><=|>=|==|!=|&&|\|\||[-+*/^<>!?:(),;=])
+""", re.VERBOSE)
+
+
+def tokenize(expr: str):
+    """返回 [(kind, text), ...]，kind 为 num / str / name / op"""
+    tokens = []
+    pos = 0
+    while pos < len(expr):
+        m = _TOKEN_RE.match(expr, pos)
+        if not m:
+            raise FastExprSyntaxError(f"Unexpected character {expr[pos]!r} at {pos} in: {expr}")
+        pos = m.end()
+        if m.lastgroup != "ws":
+            tokens.append((m.lastgroup, m.group()))
+    tokens.append(("end", ""))
+    return tokens
+
+
+# =========================
+# 语法分析（递归下降）
+# =========================
+_COMPARE_OPS = {"<", ">", "<=", ">=", "==", "!="}
+
+
+class _Parser:
+    def __init__(self, expr: str):
+        self.expr = expr
+        self.tokens = tokenize(expr)
+        self.pos = 0
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def next(self):
+        tok = self.tokens[self.pos]
+        self.pos += 1
+        return tok
+
+    def expect(self, text):
+        kind, tok = self.next()
+        if tok != text:
+            raise FastExprSyntaxError(f"Expected {text!r} but got {tok or 'end of input'!r} in: {self.expr}")
+
+    def parse_program(self):
+        statements = []
+        while True:
+            if self.peek()[0] == "end":
+                break
+            statements.append(self.parse_statement())
+            if self.peek()[1] == ";":
+                self.next()
+                continue
+            break
+        if self.peek()[0] != "end":
+            raise FastExprSyntaxError(f"Unexpected token {self.peek()[1]!r} in: {self.expr}")
+        if not statements:
+            raise FastExprSyntaxError("Empty expression")
+        if len(statements) == 1:
+            return statements[0]
+        return Node("seq", args=tuple(statements))
+
+    def parse_statement(self):
+        if self.peek()[0] == "name" and self.peek(1)[1] == "=":
+            name = self.next()[1]
+            self.next()
+            return Node("assign", name, (self.parse_expr(),))
+        return self.parse_expr()
+
+    def parse_expr(self):
+        cond = self.parse_or()
+        if self.peek()[1] == "?":
+            self.next()
+            a = self.parse_expr()
+            self.expect(":")
+            b = self.parse_expr()
+            return Node("ternary", args=(cond, a, b))
+        return cond
+
+    def _binary_level(self, ops, sub):
+        left = sub()
+        while self.peek()[0] == "op" and self.peek()[1] in ops:
+            op = self.next()[1]
+            left = Node("binop", op, (left, sub()))
+        return left
+
+    def parse_or(self):
+        return self._binary_level({"||"}, self.parse_and)
+
+    def parse_and(self):
+        return self._binary_level({"&&"}, self.parse_compare)
+
+    def parse_compare(self):
+        return self._binary_level(_COMPARE_OPS, self.parse_additive)
+
+    def parse_additive(self):
+        return self._binary_level({"+", "-"}, self.parse_multiplicative)
+
+    def parse_multiplicative(self):
+        return self._binary_level({"*", "/"}, self.parse_unary)
+
+    def parse_unary(self):
+        if self.peek()[0] == "op" and self.peek()[1] in ("-", "+", "!"):
+            op = self.next()[1]
+            return Node("unary", op, (self.parse_unary(),))
+        return self.parse_power()
+
+    def parse_power(self):
+        base = self.parse_primary()
+        if self.peek()[1] == "^":
+            self.next()
+            return Node("binop", "^", (base, self.parse_unary()))
+        return base
+
+    def parse_primary(self):
+        kind, tok = self.next()
+        if kind == "num":
+            return Node("num", float(tok))
+        if kind == "str":
+            return Node("str", tok[1:-1])
+        if kind == "name":
+            if self.peek()[1] == "(":
+                return self.parse_call(tok)
+            return Node("ident", tok)
+        if tok == "(":
+            inner = self.parse_expr()
+            self.expect(")")
+            return inner
+        raise FastExprSyntaxError(f"Unexpected token {tok or 'end of input'!r} in: {self.expr}")
+
+    def parse_call(self, name):
+        self.expect("(")
+        args, kwargs = [], []
+        if self.peek()[1] != ")":
+            while True:
+                if self.peek()[0] == "name" and self.peek(1)[1] == "=":
+                    key = self.next()[1]
+                    self.next()
+                    kwargs.append((key, self.parse_expr()))
+                else:
+                    if kwargs:
+                        raise FastExprSyntaxError(f"Positional argument after keyword in {name}(): {self.expr}")
+                    args.append(self.parse_expr())
+                if self.peek()[1] == ",":
+                    self.next()
+                    continue
+                break
+        self.expect(")")
+        return Node("call", name, tuple(args), tuple(kwargs))
+
+
+def parse(expr: str) -> Node:
+    """解析 Fast Expression，返回 AST；语法错误时抛出 FastExprSyntaxError"""
+    return _Parser(expr).parse_program()
+
+
+# =========================
+# AST -> 表达式字符串
+# =========================
+def format_number(value) -> str:
+    """统一数字字面量：1.0 -> 1, 0.50 -> 0.5, 1e3 -> 1000"""
+    f = float(value)
+    if f.is_integer() and abs(f) < 1e15:
+        return str(int(f))
+    return repr(f)
+
+
+def to_expr(node: Node) -> str:
+    """把 AST 输出为紧凑的表达式字符串（不含空白）"""
+    kind = node.kind
+    if kind == "num":
+        return format_number(node.value)
+    if kind == "str":
+        return f'"{node.value}"'
+    if kind == "ident":
+        return node.value
+    if kind == "call":
+        parts = [to_expr(a) for a in node.args]
+        parts += [f"{k}={to_expr(v)}" for k, v in node.kwargs]
+        return f"{node.value}({','.join(parts)})"
+    if kind == "binop":
+        return f"({to_expr(node.args[0])}{node.value}{to_expr(node.args[1])})"
+    if kind == "unary":
+        return f"{node.value}{to_expr(node.args[0])}"
+    if kind == "ternary":
+        cond, a, b = (to_expr(x) for x in node.args)
+        return f"({cond}?{a}:{b})"
+    if kind == "assign":
+        return f"{node.value}={to_expr(node.args[0])}"
+    if kind == "seq":
+        return ";".join(to_expr(s) for s in node.args)
+    raise ValueError(f"Unknown node kind: {kind}")
+
+
+# =========================
+# 规范化
+# =========================
+# 中缀运算 -> 等价的函数形式
+INFIX_TO_CALL = {
+    "+": "add", "-": "subtract", "*": "multiply", "/": "divide", "^": "power",
+    "<": "less", ">": "greater", "<=": "less_equal", ">=": "greater_equal",
+    "==": "equal", "!=": "not_equal", "&&": "and", "||": "or",
+}
+# 参数顺序无关的运算符
+COMMUTATIVE_OPS = {"add", "multiply", "max", "min", "and", "or", "equal", "not_equal"}
+# 可结合的 NAry 运算符：嵌套调用可以展平 add(add(a,b),c) -> add(a,b,c)
+ASSOCIATIVE_OPS = {"add", "multiply", "max", "min", "and", "or"}
+# 交换参数后等价的比较：greater(a,b) -> less(b,a)
+MIRRORED_OPS = {"greater": "less", "greater_equal": "less_equal"}
+# 幂等运算 f(f(x)) == f(x)（仅在无额外参数时化简）
+IDEMPOTENT_OPS = {"rank", "abs", "sign", "zscore", "scale", "normalize"}
+# 对合运算 f(f(x)) == x
+INVOLUTION_OPS = {"reverse"}
+
+
+def _is_plain_unary_call(node: Node, names) -> bool:
+    return node.kind == "call" and node.value in names and len(node.args) == 1 and not node.kwargs
+
+
+def _canon(node: Node) -> Node:
+    kind = node.kind
+    if kind in ("num", "str", "ident"):
+        return node
+
+    if kind == "binop":
+        node = Node("call", INFIX_TO_CALL[node.value], node.args)
+    elif kind == "unary":
+        operand = _canon(node.args[0])
+        if node.value == "+":
+            return operand
+        if node.value == "-":
+            if operand.kind == "num":
+                return Node("num", -operand.value)
+            node = Node("call", "reverse", (operand,))
+        else:
+            node = Node("call", "not", (operand,))
+
+    if kind == "assign":
+        return Node("assign", node.value, (_canon(node.args[0]),))
+    if kind == "seq":
+        return Node("seq", args=tuple(_canon(s) for s in node.args))
+    if kind == "ternary":
+        node = Node("call", "if_else", node.args)
+
+    name = node.value
+    args = tuple(_canon(a) for a in node.args)
+    kwargs = tuple(sorted((k, _canon(v)) for k, v in node.kwargs))
+
+    if name in MIRRORED_OPS and len(args) == 2 and not kwargs:
+        name, args = MIRRORED_OPS[name], (args[1], args[0])
+
+    if name in ASSOCIATIVE_OPS and not kwargs:
+        flat = []
+        for a in args:
+            if a.kind == "call" and a.value == name and not a.kwargs:
+                flat.extend(a.args)
+            else:
+                flat.append(a)
+        args = tuple(flat)
+
+    if name in COMMUTATIVE_OPS:
+        args = tuple(sorted(args, key=to_expr))
+
+    node = Node("call", name, args, kwargs)
+
+    if not kwargs and len(args) == 1:
+        if name in IDEMPOTENT_OPS and _is_plain_unary_call(args[0], {name}):
+            return args[0]
+        if name in INVOLUTION_OPS and _is_plain_unary_call(args[0], {name}):
+            return args[0].args[0]
+    return node
+
+
+def canonicalize_ast(node: Node) -> Node:
+    """返回语义等价的规范化 AST"""
+    return _canon(node)
+
+
+def canonicalize(expr: str) -> str:
+    """
+    返回表达式的规范形式字符串；无法解析时退化为去掉空白的原表达式，
+    保证调用方（去重逻辑）永远不会因为语法问题中断。
+    """
+    try:
+        return to_expr(canonicalize_ast(parse(expr)))
+    except FastExprSyntaxError:
+        return re.sub(r"\s+", "", expr)
+
+
+def canonical_hash(expr: str) -> str:
+    """规范形式的 sha1，语义等价的表达式得到相同的哈希"""
+    return hashlib.sha1(canonicalize(expr).encode("utf-8")).hexdigest()
@@ -0,0 +1,274 @@
+"""
+fast_expr_validator.py — 提交前对 Fast Expression 做本地静态检查。
+
+基于 data/wq_operators/operators.csv 与启用的 data/wq_fields/*.csv 检查：
+未知符号、参数个数、时间窗口参数必须为正整数、VECTOR 字段必须经过 vec_* 运算符。
+能自动修复的问题（小数窗口、裸用 VECTOR 字段）直接修复，其余问题拒绝提交，
+从而省下 simulation slot 和 LLM 修复的时间。
+没有字段数据（data/wq_fields 为空，或某个启用的数据集尚未下载）时不检查未知字段，只检查运算符。
+"""
+
+import csv
+import logging
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from utils.config_loader import ConfigLoader
+from utils.fast_expr import FastExprSyntaxError, Node, parse, to_expr
+from utils.template_op_gener import TYPE_MAP
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+OPERATORS_CSV = BASE_DIR / "data" / "wq_operators" / "operators.csv"
+FIELDS_DIR = BASE_DIR / "data" / "wq_fields"
+
+# 平台内置、不在字段 CSV 中出现的标识符
+BUILTIN_IDENTS = {"true", "false", "nan", "NaN", "inf",
+                  "market", "sector", "industry", "subindustry", "country", "exchange"}
+
+# 时间窗口参数 d 所在的位置（0-based）
+WINDOW_ARG_INDEX = {}
+for _type, _ops in TYPE_MAP.items():
+    if _type in ("TS:Aggregation", "TS:WindowIndex", "TS:Transform"):
+        for _op in _ops:
+            WINDOW_ARG_INDEX[_op] = 1
+    elif _type == "TS:CorrelationRegression":
+        for _op in _ops:
+            WINDOW_ARG_INDEX[_op] = 2
+# 以下运算符第二个参数不是时间窗口
+for _op in ("days_from_last_change", "ts_step", "hump", "ts_target_tvr_decay"):
+    WINDOW_ARG_INDEX.pop(_op, None)
+
+# 参数个数不限的运算符（operators.csv 中的 definition 只写出了两个参数）
+NARY_OPS = set(TYPE_MAP.get("Arithmetic:NAry", ()))
+
+# 默认用于把 VECTOR 字段降为 MATRIX 的运算符
+DEFAULT_VECTOR_REDUCER = "vec_avg"
+
+
+@dataclass
+class OperatorSignature:
+    min_args: int = 0
+    max_args: int = None  # None 表示不限（NAry）
+    keywords: set = field(default_factory=set)
+
+
+@dataclass
+class ValidationResult:
+    expr: str                # 原表达式
+    ok: bool                 # 是否可以提交（可能经过自动修复）
+    fixed_expr: str = None   # 可提交的表达式；无需修复时等于 expr
+    errors: list = field(default_factory=list)    # 无法修复的问题
+    repairs: list = field(default_factory=list)   # 已自动修复的问题
+
+
+def _split_top_level(text: str):
+    """按顶层逗号切分（忽略括号和引号内的逗号）"""
+    parts, depth, quote, buf = [], 0, None, ""
+    for ch in text:
+        if quote:
+            buf += ch
+            if ch == quote:
+                quote = None
+            continue
+        if ch in "\"'":
+            quote = ch
+        elif ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(buf.strip())
+            buf = ""
+            continue
+        buf += ch
+    if buf.strip():
+        parts.append(buf.strip())
+    return parts
+
+
+def parse_signature(name: str, definition: str):
+    """从 operators.csv 的 definition 列（如 "ts_mean(x, d)"）解析参数签名；无法解析时返回 None"""
+    m = re.search(rf"\b{re.escape(name)}\s*\(", definition or "")
+    if not m:
+        return None
+    depth, start = 0, m.end() - 1
+    for i in range(start, len(definition)):
+        if definition[i] == "(":
+            depth += 1
+        elif definition[i] == ")":
+            depth -= 1
+            if depth == 0:
+                params = _split_top_level(definition[start + 1:i])
+                break
+    else:
+        return None
+
+    sig = OperatorSignature()
+    positional, variadic = 0, False
+    for p in params:
+        if ".." in p:
+            variadic = True
+        elif "=" in p:
+            sig.keywords.add(p.split("=", 1)[0].strip())
+        elif p.startswith("["):
+            variadic = True
+        else:
+            positional += 1
+    sig.min_args = positional
+    # 关键字参数也允许按位置传入
+    sig.max_args = None if variadic else positional + len(sig.keywords)
+    return sig
+
+
+class FastExprValidator:
+
+    def __init__(self, operators_csv=OPERATORS_CSV, fields_dir=FIELDS_DIR, datasets=None):
+        if not Path(operators_csv).exists():
+            raise FileNotFoundError(f"{operators_csv} not found.")
+        self.operators = {}
+        with open(operators_csv, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                name = (row.get("name") or "").strip()
+                if name:
+                    sig = parse_signature(name, row.get("definition", ""))
+                    if sig is not None and name in NARY_OPS:
+                        sig.max_args = None
+                    self.operators[name] = sig
+
+        if datasets is None:
+            datasets = ConfigLoader.get("enabled_field_datasets", [])
+        self.field_types = {}
+        loaded = set()
+        for file in Path(fields_dir).glob("*.csv"):
+            if datasets and file.stem not in datasets:
+                continue
+            if file.stat().st_size == 0:
+                continue
+            with open(file, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    if row.get("id"):
+                        self.field_types[row["id"]] = (row.get("type") or "").upper()
+                        loaded.add(file.stem)
+        # 缺少字段文件的数据集：其中的字段无从得知，不能判为未知符号
+        self.missing_datasets = sorted(set(datasets or ()) - loaded)
+        self.check_fields = bool(self.field_types) and not self.missing_datasets
+
+    # =========================
+    # 检查 & 修复
+    # =========================
+    def _check(self, node: Node, local_vars, errors, repairs, parent=None):
+        kind = node.kind
+        if kind in ("num", "str"):
+            return node
+
+        if kind == "ident":
+            name = node.value
+            if name in local_vars or name in BUILTIN_IDENTS:
+                return node
+            ftype = self.field_types.get(name)
+            if ftype is None:
+                if self.check_fields:
+                    errors.append(f"unknown symbol '{name}'")
+                return node
+            if ftype == "VECTOR" and not (parent or "").startswith("vec_"):
+                if DEFAULT_VECTOR_REDUCER in self.operators:
+                    repairs.append(f"VECTOR field '{name}' wrapped in {DEFAULT_VECTOR_REDUCER}()")
+                    return Node("call", DEFAULT_VECTOR_REDUCER, (node,))
+                errors.append(f"VECTOR field '{name}' used outside a vec_* operator")
+            return node
+
+        if kind == "seq":
+            statements = []
+            for s in node.args:
+                statements.append(self._check(s, local_vars, errors, repairs))
+                if s.kind == "assign":
+                    local_vars.add(s.value)
+            return Node("seq", args=tuple(statements))
+
+        if kind == "assign":
+            return Node("assign", node.value, (self._check(node.args[0], local_vars, errors, repairs),))
+
+        if kind != "call":
+            # 中缀 / 一元 / 三元运算：只检查子节点
+            args = tuple(self._check(a, local_vars, errors, repairs) for a in node.args)
+            return Node(kind, node.value, args, node.kwargs)
+
+        name = node.value
+        if name not in self.operators:
+            errors.append(f"unknown operator '{name}'")
+        else:
+            sig = self.operators[name]
+            n = len(node.args)
+            if sig is not None:
+                if n < sig.min_args or (sig.max_args is not None and n > sig.max_args):
+                    expected = f"{sig.min_args}+" if sig.max_args is None else \
+                        (f"{sig.min_args}" if sig.min_args == sig.max_args else f"{sig.min_args}-{sig.max_args}")
+                    errors.append(f"{name}() expects {expected} arguments, got {n}")
+                for key, _ in node.kwargs:
+                    if key not in sig.keywords:
+                        errors.append(f"{name}() got unexpected keyword '{key}'")
+
+        if name.startswith("vec_") and node.args and node.args[0].kind == "ident":
+            ftype = self.field_types.get(node.args[0].value)
+            if ftype is not None and ftype != "VECTOR":
+                errors.append(f"{name}() expects a VECTOR field, got {ftype} field '{node.args[0].value}'")
+
+        args = [self._check(a, local_vars, errors, repairs, parent=name) for a in node.args]
+
+        idx = WINDOW_ARG_INDEX.get(name)
+        if idx is not None and idx < len(args):
+            window = args[idx]
+            if window.kind != "num":
+                errors.append(f"{name}() window argument must be a number, got '{to_expr(window)}'")
+            elif window.value <= 0:
+                errors.append(f"{name}() window argument must be positive, got {window.value:g}")
+            elif not float(window.value).is_integer():
+                fixed = max(1, round(window.value))
+                repairs.append(f"{name}() window {window.value:g} rounded to {fixed}")
+                args[idx] = Node("num", float(fixed))
+
+        kwargs = tuple((k, self._check(v, local_vars, errors, repairs, parent=name)) for k, v in node.kwargs)
+        return Node("call", name, tuple(args), kwargs)
+
+    def validate(self, expr: str, repair: bool = True) -> ValidationResult:
+        """检查表达式；repair=True 时对可修复的问题自动修复并在 fixed_expr 中返回"""
+        try:
+            tree = parse(expr)
+        except FastExprSyntaxError as e:
+            return ValidationResult(expr, False, errors=[f"syntax error: {e}"])
+
+        errors, repairs = [], []
+        fixed_tree = self._check(tree, set(), errors, repairs)
+        if errors:
+            return ValidationResult(expr, False, errors=errors, repairs=repairs)
+        if repairs and not repair:
+            return ValidationResult(expr, False, errors=repairs)
+        fixed_expr = to_expr(fixed_tree) if repairs else expr
+        return ValidationResult(expr, True, fixed_expr=fixed_expr, repairs=repairs)
+
+
+_warned_missing = False
+
+
+def load_validator():
+    """
+    加载校验器；operators.csv 不存在时返回 None（跳过本地校验），并在本进程中只提示一次。
+    operators.csv 由 utils/wq_info_loader.OpAndFeature.get_operators() 下载（main.py / main_researcher.py /
+    main_evaluator.py 启动时会调用）
+    """
+    global _warned_missing
+    try:
+        validator = FastExprValidator()
+    except FileNotFoundError:
+        if not _warned_missing:
+            _warned_missing = True
+            message = (f"本地表达式校验已关闭：缺少 {OPERATORS_CSV}，"
+                       f"请先运行 OpAndFeature().get_operators()（utils/wq_info_loader.py）下载运算符列表")
+            print(f"⚠️ {message}")
+            logging.warning(message)
+        return None
+    if not validator.check_fields:
+        missing = ", ".join(validator.missing_datasets) or "data/wq_fields"
+        print(f"⚠️ 缺少字段数据（{missing}），本地校验不检查未知字段")
+    return validator
@@ -0,0 +1,185 @@
+# negative_cache.py
+"""
+从 simulation 的 ERROR 信息中学习无效的字段 / 运算符组合（负缓存）。
+
+评估器拿到 status=ERROR 的 status_json 后调用 learn()：按 ERROR_RULES 对 message 分类，
+抽取出问题字段、运算符或（运算符, 字段）组合，连同 settings 的作用域（instrumentType/region/delay）
+持久化到 SQLite。此后生成器与评估器的提交队列对每个待回测 alpha 调用 match()，
+包含已知无效模式的 alpha 直接跳过，每个无效模式只需一次失败的 simulation。
+
+    python -m utils.negative_cache                      # 列出已学习的模式
+    python -m utils.negative_cache --remove PATTERN     # 删除误判的模式
+"""
+import argparse
+import re
+import sqlite3
+import time
+from pathlib import Path
+from threading import Lock
+
+from utils.config_loader import ConfigLoader
+from utils.fast_expr import FastExprSyntaxError, parse
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BACKTEST_DIR = Path(ConfigLoader.get("backtest_result_dir") or BASE_DIR / "data" / "alpha_db_v2" / "backtest_result")
+BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+NEGATIVE_CACHE_DB = BACKTEST_DIR / "negative_cache.db"
+
+# (正则, 模式类型)：field = 字段本身不可用；operator = 运算符不可用；op_field = 字段不能用在该运算符中
+ERROR_RULES = [
+    (re.compile(r'invalid data field (?:type )?"?(?P<field>\w+)"? for operator "?(?P<op>\w+)', re.I), "op_field"),
+    (re.compile(r'operator "?(?P<op>\w+)"? does not support (?:data )?field "?(?P<field>\w+)', re.I), "op_field"),
+    (re.compile(r'invalid data field "?(?P<field>\w+)"? for operator', re.I), "op_field"),
+    (re.compile(r'unknown (?:variable|data field|field) "?(?P<field>\w+)', re.I), "field"),
+    (re.compile(r'unknown (?:operator|function) "?(?P<op>\w+)', re.I), "operator"),
+]
+
+
+def settings_scope(settings):
+    """字段是否可用取决于 instrumentType / region / delay；settings 为空时返回 None（匹配任意作用域）"""
+    if not settings:
+        return None
+    return f"{settings.get('instrumentType')}/{settings.get('region')}/D{settings.get('delay')}"
+
+
+def expr_patterns(expr):
+    """表达式中出现的全部模式：field:x、operator:f、op_field:f(x)（x 是 f 的直接参数）"""
+    try:
+        tree = parse(expr)
+    except FastExprSyntaxError:
+        return {f"field:{t}" for t in re.findall(r"[A-Za-z_]\w*", expr)}
+    patterns = set()
+
+    def walk(node, parent=None):
+        if node.kind == "ident":
+            patterns.add(f"field:{node.value}")
+            if parent:
+                patterns.add(f"op_field:{parent}({node.value})")
+            return
+        name = node.value if node.kind == "call" else None
+        if name:
+            patterns.add(f"operator:{name}")
+        for child in node.args:
+            walk(child, name)
+        for _, child in node.kwargs or ():
+            walk(child, name)
+
+    walk(tree)
+    return patterns
+
+
+def classify_error(expr, message):
+    """把 ERROR 信息归类为一个模式，无法归类（如语法错误、服务端异常）时返回 None"""
+    if not message:
+        return None
+    for regex, kind in ERROR_RULES:
+        m = regex.search(message)
+        if not m:
+            continue
+        field, op = m.groupdict().get("field"), m.groupdict().get("op")
+        if kind == "field":
+            return f"field:{field}"
+        if kind == "operator":
+            return f"operator:{op}"
+        if op:
+            return f"op_field:{op}({field})"
+        # 信息中没有运算符名：字段只作为一个运算符的直接参数出现时才能确定组合
+        parents = {p for p in expr_patterns(expr) if p.startswith("op_field:") and p.endswith(f"({field})")}
+        return parents.pop() if len(parents) == 1 else None
+    return None
+
+
+class NegativeCache:
+    def __init__(self, db_path=NEGATIVE_CACHE_DB):
+        self._lock = Lock()
+        self.conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS bad_patterns (
+                pattern    TEXT NOT NULL,
+                scope      TEXT NOT NULL,
+                message    TEXT,
+                example    TEXT,
+                hits       INTEGER DEFAULT 0,
+                created_at REAL,
+                PRIMARY KEY (pattern, scope)
+            )
+        """)
+        self.conn.commit()
+        self._patterns = {}
+        self.reload()
+
+    def reload(self):
+        """重新读取（其他进程学习到的模式也会生效）"""
+        with self._lock:
+            rows = self.conn.execute("SELECT pattern, scope FROM bad_patterns").fetchall()
+        patterns = {}
+        for pattern, scope in rows:
+            patterns.setdefault(pattern, set()).add(scope)
+        self._patterns = patterns
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def learn(self, expr, status_json, settings=None):
+        """从 ERROR 的 status_json 学习一个模式，返回新学到的模式或 None"""
+        message = status_json.get("message") or ""
+        pattern = classify_error(expr, message)
+        if pattern is None:
+            return None
+        scope = settings_scope(settings) or "*"
+        if scope in self._patterns.get(pattern, ()):
+            return None
+        with self._lock:
+            self.conn.execute("INSERT OR IGNORE INTO bad_patterns (pattern, scope, message, example, created_at) "
+                              "VALUES (?, ?, ?, ?, ?)", (pattern, scope, message[:500], expr, time.time()))
+            self.conn.commit()
+        self._patterns.setdefault(pattern, set()).add(scope)
+        print(f"🧠 Learned invalid pattern {pattern} ({scope}): {message[:80]}")
+        return pattern
+
+    def match(self, expr, settings=None):
+        """表达式包含已知无效模式时返回该模式，否则返回 None；settings 为空时匹配任意作用域"""
+        if not self._patterns:
+            return None
+        scope = settings_scope(settings)
+        for pattern in expr_patterns(expr):
+            scopes = self._patterns.get(pattern)
+            if scopes and (scope is None or scope in scopes or "*" in scopes):
+                return pattern
+        return None
+
+    def record_hits(self, counts):
+        """累计每个模式拦下的 alpha 数（{pattern: n}），用于评估缓存收益"""
+        with self._lock:
+            self.conn.executemany("UPDATE bad_patterns SET hits = hits + ? WHERE pattern = ?",
+                                  [(n, p) for p, n in counts.items()])
+            self.conn.commit()
+
+    def remove(self, pattern):
+        with self._lock:
+            cur = self.conn.execute("DELETE FROM bad_patterns WHERE pattern = ?", (pattern,))
+            self.conn.commit()
+        self._patterns.pop(pattern, None)
+        return cur.rowcount
+
+    def entries(self):
+        with self._lock:
+            return self.conn.execute("SELECT pattern, scope, hits, message FROM bad_patterns "
+                                     "ORDER BY hits DESC, created_at").fetchall()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or edit the negative cache of invalid patterns")
+    parser.add_argument("--remove", metavar="PATTERN")
+    args = parser.parse_args()
+    cache = NegativeCache()
+    if args.remove:
+        print(f"🗑 Removed {cache.remove(args.remove)} entries for {args.remove}")
+    for pattern, scope, hits, message in cache.entries():
+        print(f"   🚫 {pattern} [{scope}] blocked={hits}: {message[:80]}")
+    cache.close()
@@ -0,0 +1,140 @@
+# rate_limiter.py
+"""
+WQ API 共享限流器。
+
+- 令牌桶：所有 WQ 请求（提交 / 轮询 / 取结果）共用一个桶，平滑请求速率；
+- 自适应速率（AIMD）：收到限流 429 时速率乘以 decrease，之后每次成功请求线性回升到上限，
+  高峰期自动降速、空闲期自动恢复；
+- Retry-After：429 / 5xx 响应中的 Retry-After 优先，否则使用带抖动的指数退避；
+  限流与服务端错误会让整个桶暂停到退避结束，SIMULATION_LIMIT_EXCEEDED 只是并发槽位已满，
+  只让当前提交等待，不影响轮询。
+
+同步评估器调用 wait()，异步评估器调用 await wait_async()；请求结束后调用 on_response() / on_error()，
+返回值为重试前应等待的秒数（0 表示请求成功）。
+"""
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from utils.config_loader import ConfigLoader
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+CONCURRENCY_LIMIT_TEXT = "SIMULATION_LIMIT_EXCEEDED"
+
+
+def retry_after_seconds(headers, default=None):
+    """解析 Retry-After（秒数或 HTTP 日期），缺失或无法解析时返回 default"""
+    value = (headers or {}).get("Retry-After")
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """full-jitter 指数退避：在 [0, min(cap, base·2^attempt)] 内均匀取值"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_concurrency_limited(status_code, text=""):
+    return CONCURRENCY_LIMIT_TEXT in (text or "")
+
+
+class RateLimiter:
+    """线程安全的令牌桶 + AIMD 速率调整，同一进程内的同步 / 异步调用方共享"""
+
+    def __init__(self, rate=5.0, burst=10, min_rate=0.5, increase=0.1, decrease=0.7,
+                 backoff_base=1.0, backoff_cap=60.0):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.failures = 0              # 连续失败次数，决定退避长度
+        self.blocked_until = 0.0       # 全局暂停截止时间（monotonic）
+        self.stats = {"requests": 0, "throttled": 0, "server_errors": 0, "concurrency_limited": 0}
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self):
+        """取到令牌返回 0，否则返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.stats["requests"] += 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def wait(self):
+        while True:
+            delay = self._try_acquire()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    async def wait_async(self):
+        while True:
+            delay = self._try_acquire()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def _backoff(self, headers=None):
+        delay = backoff_delay(self.failures, self.backoff_base, self.backoff_cap)
+        self.failures += 1
+        return max(delay, retry_after_seconds(headers, 0.0))
+
+    def on_response(self, status_code, headers=None, text=""):
+        """记录响应并调整速率，返回重试前应等待的秒数（成功或不可重试的错误返回 0）"""
+        with self._lock:
+            if is_concurrency_limited(status_code, text):
+                # 并发槽位已满：与请求速率无关，只让当前调用方等待
+                self.stats["concurrency_limited"] += 1
+                return retry_after_seconds(headers) or backoff_delay(2, self.backoff_base, self.backoff_cap)
+            if status_code in RETRYABLE_STATUSES:
+                if status_code == 429:
+                    self.stats["throttled"] += 1
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                else:
+                    self.stats["server_errors"] += 1
+                delay = self._backoff(headers)
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+                return delay
+            self.failures = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            return 0.0
+
+    def on_error(self):
+        """网络异常：按退避等待，但不降低速率"""
+        with self._lock:
+            return self._backoff()
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_limiter(name="wq"):
+    """进程内按名字共享的限流器，速率取自 config.yaml 的 wq_requests_per_second / wq_burst"""
+    with _LIMITERS_LOCK:
+        if name not in _LIMITERS:
+            _LIMITERS[name] = RateLimiter(rate=float(ConfigLoader.get("wq_requests_per_second", 5)),
+                                          burst=int(ConfigLoader.get("wq_burst", 10)))
+        return _LIMITERS[name]
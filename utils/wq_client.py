@@ -0,0 +1,186 @@
+# wq_client.py
+"""
+WQ Brain HTTP 客户端层，评估器与 OpAndFeature 共用。
+
+- 连接池：按并发数设置连接池大小，所有请求复用 keep-alive 连接；
+- 请求超时：未显式传 timeout 的请求使用默认的连接 / 读取超时，单个挂起的连接不会卡住整个循环；
+- 自动重新登录：会话过期返回 401 时重新登录并重发一次请求，并发请求只触发一次登录；
+- 断路器：连续 FAILURE_THRESHOLD 次网络异常或 5xx 后打开 RESET_TIMEOUT 秒，
+  打开期间请求在客户端等待而不是继续冲击服务端，冷却后放行一个试探请求，成功即关闭。
+
+WQSession 是 requests.Session 的子类（同步评估器 / OpAndFeature），
+AsyncWQClient 是 httpx.AsyncClient 的子类（异步评估器），原有的 get / post 调用无需修改。
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from utils.config_loader import ConfigLoader
+
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 60.0
+POOL_SIZE = 20
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+
+
+class CircuitBreaker:
+    """closed → (连续失败) → open → (冷却结束) → half-open → (试探成功) closed / (试探失败) open"""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.stats = {"opened": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def wait_time(self):
+        """请求发出前应等待的秒数：0 表示放行（half-open 时只放行一个试探请求）"""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self.probing:
+                return 1.0
+            self.probing = True
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            # 试探请求失败时重新打开；已打开期间其他在途请求的失败不延长冷却
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.stats["opened"] += 1
+                print(f"⛔ WQ API circuit open for {self.reset_timeout:.0f}s after {self.failures} failures")
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+
+def _credentials(account=None, password=None):
+    return (account or ConfigLoader.get("worldquant_account"),
+            password if password is not None else ConfigLoader.get("worldquant_password"))
+
+
+class WQSession(requests.Session):
+    """带默认超时、连接池、断路器与 401 自动重新登录的 requests.Session"""
+
+    def __init__(self, account=None, password=None, pool_size=POOL_SIZE,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), breaker=None):
+        super().__init__()
+        self.auth = HTTPBasicAuth(*_credentials(account, password))
+        self.auth_url = ConfigLoader.get("worldquant_api_auth")
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.logins = 0
+        self._login_lock = threading.Lock()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def sign_in(self):
+        """登录并把会话 cookie 保存在 session 中，返回登录响应"""
+        resp = super().request("POST", self.auth_url, timeout=self.timeout)
+        self.logins += 1
+        print(f"Login status: {resp.status_code}")
+        return resp
+
+    def _relogin(self, generation):
+        """只有第一个发现 401 的请求真正登录，其余请求等它完成后直接重发"""
+        with self._login_lock:
+            if self.logins == generation:
+                logging.info("WQ session expired, signing in again")
+                self.sign_in()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        if url == self.auth_url:
+            return super().request(method, url, **kwargs)
+        for attempt in range(2):
+            wait = self.breaker.wait_time()
+            while wait > 0:
+                time.sleep(wait)
+                wait = self.breaker.wait_time()
+            generation = self.logins
+            try:
+                resp = super().request(method, url, **kwargs)
+            except requests.RequestException:
+                self.breaker.record_failure()
+                raise
+            if resp.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            if resp.status_code != 401 or attempt:
+                return resp
+            self._relogin(generation)
+        return resp
+
+
+class AsyncWQClient(httpx.AsyncClient):
+    """WQSession 的异步版本，供 httpx 的异步评估器使用"""
+
+    def __init__(self, account=None, password=None, pool_size=POOL_SIZE,
+                 timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT), breaker=None, **kwargs):
+        limits = httpx.Limits(max_connections=pool_size + 5, max_keepalive_connections=pool_size)
+        super().__init__(auth=httpx.BasicAuth(*_credentials(account, password)), limits=limits,
+                         timeout=timeout, **kwargs)
+        self.auth_url = ConfigLoader.get("worldquant_api_auth")
+        self.breaker = breaker or CircuitBreaker()
+        self.logins = 0
+        self._login_lock = asyncio.Lock()
+
+    async def sign_in(self):
+        resp = await super().request("POST", self.auth_url)
+        self.logins += 1
+        return resp
+
+    async def _relogin(self, generation):
+        async with self._login_lock:
+            if self.logins == generation:
+                logging.info("WQ session expired, signing in again")
+                await self.sign_in()
+
+    async def request(self, method, url, **kwargs):
+        if str(url) == self.auth_url:
+            return await super().request(method, url, **kwargs)
+        for attempt in range(2):
+            wait = self.breaker.wait_time()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self.breaker.wait_time()
+            generation = self.logins
+            try:
+                resp = await super().request(method, url, **kwargs)
+            except httpx.HTTPError:
+                self.breaker.record_failure()
+                raise
+            if resp.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            if resp.status_code != 401 or attempt:
+                return resp
+            await self._relogin(generation)
+        return resp
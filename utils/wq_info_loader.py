@@ -3,10 +3,9 @@ import logging
 from pathlib import Path
 from typing import List, Dict
 
-import requests
 import pandas as pd
-from requests.auth import HTTPBasicAuth
 from utils.config_loader import ConfigLoader
+from utils.wq_client import WQSession
 
 # --- 目录 ---
 BASE_DIR = Path(__file__).resolve().parents[1]
@@ -18,20 +17,22 @@ WQ_OPERATOR_DIR.mkdir(parents=True, exist_ok=True)
 FIELDS_CSV = WQ_FIELD_DIR
 OPERATORS_CSV = WQ_OPERATOR_DIR / "operators.csv"
 
+WQ_API_BASE = ConfigLoader.get("worldquant_api_base")
+
 
 class OpAndFeature:
     def __init__(self):
-        self.sess = requests.Session()
         username = ConfigLoader.get("worldquant_account")
         password = ConfigLoader.get("worldquant_password")
         self.setup_auth(username, password)
 
     def setup_auth(self, username, password) -> None:
         """Set up authentication with WorldQuant Brain."""
-        self.sess.auth = HTTPBasicAuth(username, password)
+        # 共享的 WQ 客户端：请求带默认超时，会话过期时自动重新登录
+        self.sess = WQSession(username, password)
 
         print("Authenticating with WorldQuant Brain...")
-        response = self.sess.post('https://api.worldquantbrain.com/authentication')
+        response = self.sess.sign_in()
         print(f"Authentication response status: {response.status_code}")
         logging.debug(f"Authentication response: {response.text[:500]}...")
 
@@ -136,7 +137,7 @@ class OpAndFeature:
                 params['dataset.id'] = dataset
 
                 print(f"Getting field count for dataset: {dataset}")
-                count_response = self.sess.get('https://api.worldquantbrain.com/data-fields', params=params)
+                count_response = self.sess.get(f'{WQ_API_BASE}/data-fields', params=params)
 
                 if count_response.status_code == 200:
                     count_data = count_response.json()
@@ -147,7 +148,7 @@ class OpAndFeature:
 
                     for offset in range(0, total_fields, params['limit']):
                         params['offset'] = offset
-                        response = self.sess.get('https://api.worldquantbrain.com/data-fields', params=params)
+                        response = self.sess.get(f'{WQ_API_BASE}/data-fields', params=params)
 
                         if response.status_code == 200:
                             data = response.json()
@@ -181,7 +182,7 @@ class OpAndFeature:
             return pd.read_csv(OPERATORS_CSV).to_dict(orient='records')
 
         print("Requesting operators...")
-        response = self.sess.get('https://api.worldquantbrain.com/operators')
+        response = self.sess.get(f'{WQ_API_BASE}/operators')
         print(f"Operators response status: {response.status_code}")
         logging.debug(f"Operators response: {response.text[:500]}...")  # Print first 500 chars
 